@@ -27,41 +27,33 @@ import re
 from datetime import datetime, timedelta, timezone, date
 from decimal import Decimal, ROUND_HALF_UP
 from zoneinfo import ZoneInfo
-import pandas as pd
-from io import StringIO
+from m365lib.runcontext import build_run_context, load_run_context
 
 JST = ZoneInfo("Asia/Tokyo")
 
 # Athenaのクエリ実行時間はJSTで指定された基準日（basedate）に基づいて、UTCの開始日時と終了日時を計算する必要がある。
 # naの場合は基準日ファイルをS3から取得する。ここで取得する基準日とS3に書き込む際に使用する基準日は用途が異なることに注意。
 # S3に出力する基準日は、M365CollectS3Export関数でファイルの保存先を決めるためのもので、Athenaクエリ履歴の取得期間を決めるものではない。
-def _resolve_base_date(basedate: str, session: boto3.Session) -> date:
-    if basedate == "na":
-        # 基準日ファイルから基準日を取得する
+def _resolve_run_context(event: dict, session: boto3.Session) -> dict:
+    # 基準日コンテキスト（base/from/to）を解決する。
+    # イベントで basedate が指定されていればS3を読まずにそのまま使用し、na の場合のみ基準日ファイルを取得する（pandas不使用）
+    basedate = event.get('basedate')
+    if basedate is None or basedate == "na":
         ssm = session.client('ssm')
         bucket_name = ssm.get_parameter(Name='/m365/common/s3bucket',
                                     WithDecryption=False)['Parameter']['Value']
-        s3_client = session.client('s3')
         try:
-            csv_file = s3_client.get_object(
-                Bucket=bucket_name,
-                Key="basedatetime/basedatetime.csv"
-            )
-            csv_file_body = csv_file['Body'].read().decode('utf-8')
-            df = pd.read_csv(StringIO(csv_file_body), usecols=['base'])
-            base_date_str = df['base'].iloc[0]
-            return datetime.strptime(base_date_str, "%Y-%m-%d").date()
+            return load_run_context(session.client('s3'), bucket_name)
         except Exception as e:
-            print(f"[Func-ERROR]-[_resolve_base_date]-[S3ReadError] 基準日ファイル取得エラー: {e}")
+            print(f"[Func-ERROR]-[_resolve_run_context]-[S3ReadError] 基準日ファイル取得エラー: {e}")
             raise
-    else:
-        return datetime.strptime(basedate, "%Y-%m-%d").date()
+    return build_run_context(basedate, event.get('fromtimestamp'), event.get('totimestamp'))
 
 
-def _resolve_time_range(basedate: str, session: boto3.Session) -> tuple[datetime, datetime, date]:
+def _resolve_time_range(basedate: str) -> tuple[datetime, datetime, date]:
     # basedate を基準に JST の 00:00 -> 翌 00:00 の期間を UTC に変換して返す
     # UTC変換後の日時はAthena呼び出しに使用する
-    base_date_jst = _resolve_base_date(basedate, session)
+    base_date_jst = datetime.strptime(basedate, "%Y-%m-%d").date()
     start_jst = datetime(base_date_jst.year, base_date_jst.month, base_date_jst.day, \
                         0, 0, 0, tzinfo=JST)
     end_jst = start_jst + timedelta(days=1)
@@ -174,40 +166,34 @@ def get_athena_query_history(event, context):
         return json.dumps({ "status": "failed" })
     targetdataname = "athenaqueryhistory"
 
+    # 基準日コンテキスト（base/from/to）を1回だけ解決し、UTCの開始日時、終了日時を計算する
+    # 解決した値は後続のLambda（M365CollectS3KeyDelete, M365CollectS3Export）へ明示的に引き渡す
+    try:
+        run_context = _resolve_run_context(event, session)
+        start_utc, end_utc, base_date_jst = _resolve_time_range(run_context['basedate'])
+    except Exception as e:
+        print(f"[Func-ERROR]-[get_athena_query_history] 基準日変換処理エラー: {e}")
+        return json.dumps({ "status": "failed" })
+
     # 冪等性確保のため、ファイル上書きではなく、上位キーを削除する　
     try:
         call_collect_S3KeyDelete(
             targetdataname,
             group,
-            basedate,
+            run_context['basedate'],
         )
     except Exception as e:
         print(f"[Func-ERROR]-[get_athena_query_history]-[S3KeyDelete] {e}")
         return json.dumps({ "status": "failed" })
 
-    # 基準日からUTCの開始日時、終了日時を計算する
-    try:
-        start_utc, end_utc, base_date_jst = _resolve_time_range(basedate, session)
-    except Exception as e:
-        print(f"[Func-ERROR]-[get_athena_query_history] 基準日変換処理エラー: {e}")
-        return json.dumps({ "status": "failed" })
-
-    # na の場合は欠落させる仕様（出力先Lambda側でチェック,設定）
-    fromtimestamp = None
-    totimestamp = None
-    if basedate != "na":
-        fromtimestamp = f"{base_date_jst.strftime('%Y-%m-%d')} 00:00"
-        totimestamp = f"{base_date_jst.strftime('%Y-%m-%d')} 23:59"
-
     export_payload = {
         "is_gzip": False,
         "targetdataname": targetdataname,
         "group": group,
-        "basedate": basedate,
+        "basedate": run_context['basedate'],
+        "fromtimestamp": run_context['fromtimestamp'],
+        "totimestamp": run_context['totimestamp'],
     }
-    if fromtimestamp is not None and totimestamp is not None:
-        export_payload["fromtimestamp"] = fromtimestamp
-        export_payload["totimestamp"] = totimestamp
 
     # Athenaクエリ履歴の取得とS3出力（M365CollectS3Export関数呼び出し）を実行
     try:
@@ -3,18 +3,28 @@
 必須環境変数:
   GROUP : カタログ対象グループ名 (/m365/common/<GROUP>/targettable 用)
 
+任意環境変数:
+  BASEDATE : 実行コンテキストの基準日 yyyy-mm-dd (Step Functions から引き渡し。--basedate が優先)
+
 必須引数 (--exec-type):
   prevdif  : 全ターゲットテーブルの前日差分検証→差分に応じて走査
   specdif  : 指定テーブルの指定日差分検証→差分に応じて走査 (追加引数 --targettable, --specdif-targetday 必須)
   fulscan  : 指定テーブルを常に全走査 (追加引数 --targettable 必須)
+  partreg  : 全ターゲットテーブルの前日差分検証→差分なしはパーティションを直接登録、差分ありは全走査
+  colhist  : 指定テーブルのスキーマ指紋の履歴から各カラムの初出日を出力 (追加引数 --targettable 必須)
 
 使用例:
   python ENTRYPOINT.py --exec-type prevdif
   python ENTRYPOINT.py --exec-type specdif --targettable mytable --specdif-targetday 20250115
   python ENTRYPOINT.py --exec-type fulscan --targettable mytable
+  python ENTRYPOINT.py --exec-type partreg
+  python ENTRYPOINT.py --exec-type colhist --targettable mytable
 
 環境変数 GROUP を CLI から指定したい場合:
   python ENTRYPOINT.py --exec-type prevdif --group mygroup
+
+基準日を実行コンテキストから明示的に指定したい場合 (basedatetime.csv の読込を省略):
+  python ENTRYPOINT.py --exec-type prevdif --basedate 2025-01-21
 """
 import os
 import sys
@@ -46,16 +56,20 @@ def setup_logging():
 
 def parse_args():
     p = argparse.ArgumentParser(description="Glue Catalog Update runner")
-    p.add_argument("--exec-type", required=True, choices=["prevdif", "specdif", "fulscan"], help="実行モード")
-    p.add_argument("--targettable", help="対象テーブル (specdif/fulscan で必須)")
+    p.add_argument("--exec-type", required=True, choices=["prevdif", "specdif", "fulscan", "partreg", "colhist"], help="実行モード")
+    p.add_argument("--targettable", help="対象テーブル (specdif/fulscan/colhist で必須)")
     p.add_argument("--specdif-targetday", help="指定日差分検証用 yyyymmdd (specdif で必須)")
     p.add_argument("--group", help="GROUP 環境変数を上書き設定")
+    p.add_argument("--basedate", default=os.getenv("BASEDATE"),
+                   help="基準日 yyyy-mm-dd (未指定時は環境変数 BASEDATE、それも無ければ basedatetime.csv から取得)")
     return p.parse_args()
 
 
 def build_event(args):
     event = {"exec_type": args.exec_type}
-    if args.exec_type in ("specdif", "fulscan"):
+    if args.basedate:
+        event["basedate"] = args.basedate
+    if args.exec_type in ("specdif", "fulscan", "colhist"):
         if not args.targettable:
             logger.error("--targettable は %s で必須です", args.exec_type)
             sys.exit(1)
@@ -1,14 +1,66 @@
 import boto3
+import csv
+import hashlib
 import os
 import sys
 import pandas as pd
+import pyarrow as pa
 import pyarrow.parquet as pq
-from io import StringIO
+from io import BytesIO, StringIO
+import threading
 import time
 import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.config import Config
+
+### 基準日ファイル読込
+def load_base_date(bucket_name: str) -> str:
+    """basedatetime/basedatetime.csv から基準日(yyyy-mm-dd)を取得する。
+    数十バイトのCSVのため pandas は使わず csv モジュールで解析する。
+    """
+    s3_client = boto3.client('s3')
+    csv_file = s3_client.get_object(
+        Bucket=bucket_name,
+        Key="basedatetime/basedatetime.csv"
+        )
+    csv_file_body = csv_file['Body'].read().decode('utf-8-sig')
+    row = next(csv.DictReader(StringIO(csv_file_body)))
+    return row['base'].strip()
+
+### クローラ起動の再試行（実行中・同時実行数の上限到達時）の間隔と最大待機時間（秒）
+CRAWLER_START_RETRY_INTERVAL = int(os.getenv('CRAWLER_START_RETRY_INTERVAL', '30'))
+CRAWLER_START_MAX_WAIT = int(os.getenv('CRAWLER_START_MAX_WAIT', '1800'))
+
+### クローラ起動
+def start_crawler(glue, crawler_name: str, cancel_event=None):
+    """クローラを起動する。クローラが実行中（CrawlerRunningException）、または Glue のクローラ同時実行数の
+    上限に達している（ResourceNumberLimitExceededException）場合は、CRAWLER_START_RETRY_INTERVAL 秒ごとに
+    CRAWLER_START_MAX_WAIT 秒まで再試行する。
+    cancel_event がセットされた場合は起動せずに例外を送出する（タイムアウトしたテーブルの打ち切り）。
+    """
+    retryable = (glue.exceptions.CrawlerRunningException, glue.exceptions.ResourceNumberLimitExceededException)
+    deadline = time.time() + CRAWLER_START_MAX_WAIT
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RuntimeError(f"クローラ起動中止 (打ち切り) crawler={crawler_name}")
+        try:
+            glue.start_crawler(Name=crawler_name)
+            return
+        except retryable as e:
+            if time.time() >= deadline:
+                print(f"[Error]-[updatecatalog]-[start_crawler] "
+                      f"起動待ちタイムアウト ({CRAWLER_START_MAX_WAIT}s) crawler={crawler_name} error={e}")
+                raise
+            print(f"[Warn]-[updatecatalog]-[start_crawler] "
+                  f"起動できないため再試行します crawler={crawler_name} "
+                  f"interval={CRAWLER_START_RETRY_INTERVAL}s error={e}")
+        if cancel_event is not None:
+            cancel_event.wait(CRAWLER_START_RETRY_INTERVAL)
+        else:
+            time.sleep(CRAWLER_START_RETRY_INTERVAL)
 
 ### クローラ実行
-def catalog_scan(table: str, full_scan: bool = False):
+def catalog_scan(table: str, full_scan: bool = False, ssm=None, glue=None, cancel_event=None):
     """指定テーブル対応の Glue Crawler を取得し、ポリシー更新後に起動して起動クローラ名を返却。
 
     SSM パラメータ命名規則: /m365/updatecatalog/crawler/<table>
@@ -20,13 +72,18 @@ def catalog_scan(table: str, full_scan: bool = False):
             SchemaChangePolicy: UpdateBehavior=UPDATE_IN_DATABASE, DeleteBehavior=DEPRECATE_IN_DATABASE
             RecrawlPolicy: RecrawlBehavior=CRAWL_EVERYTHING
 
+    ssm / glue: 並行処理時は呼び出し側で作成したクライアントを渡す（未指定の場合は作成）
+    cancel_event: セットされた場合はクローラを起動しない（start_crawler）
+
     戻り値:
       {
         'crawler_name': crawler_name
       }
     """
-    ssm = boto3.client('ssm')
-    glue = boto3.client('glue')
+    if ssm is None:
+        ssm = boto3.client('ssm')
+    if glue is None:
+        glue = boto3.client('glue')
     param_name = f'/m365/updatecatalog/crawler/{table}'
     try:
         crawler_name = ssm.get_parameter(Name=param_name, WithDecryption=False)['Parameter']['Value']
@@ -72,22 +129,90 @@ def catalog_scan(table: str, full_scan: bool = False):
         raise
 
     print(f"[Info]-[updatecatalog]-[full_catalog_scan] クローラ起動: {crawler_name}")
-    glue.start_crawler(Name=crawler_name)
+    start_crawler(glue, crawler_name, cancel_event)
     print(f"[Info]-[updatecatalog]-[full_catalog_scan] 起動完了 {crawler_name}")
     return {
         'crawler_name': crawler_name
     }
 
+### クローラ状態の監視（batch_get_crawlers の1回あたりの上限件数・監視間隔の下限・上限）
+CRAWLER_BATCH_SIZE = 100
+CRAWLER_POLL_MIN_INTERVAL = float(os.getenv('CRAWLER_POLL_MIN_INTERVAL', '5'))
+CRAWLER_POLL_MAX_INTERVAL = float(os.getenv('CRAWLER_POLL_MAX_INTERVAL', '300'))
+
+### クローラの過去の所要時間（秒）を取得
+def get_crawler_expected_runtimes(glue, crawler_list: list) -> dict:
+    """get_crawler_metrics の実行時間の中央値（なければ前回の実行時間）を返す。取得できない場合は空。"""
+    expected = {}
+    try:
+        for start in range(0, len(crawler_list), CRAWLER_BATCH_SIZE):
+            request_kwargs = {'CrawlerNameList': crawler_list[start:start + CRAWLER_BATCH_SIZE]}
+            while True:
+                response = glue.get_crawler_metrics(**request_kwargs)
+                for metrics in response.get('CrawlerMetricsList', []):
+                    runtime = metrics.get('MedianRuntimeSeconds') or metrics.get('LastRuntimeSeconds')
+                    if runtime:
+                        expected[metrics['CrawlerName']] = float(runtime)
+                if not response.get('NextToken'):
+                    break
+                request_kwargs['NextToken'] = response['NextToken']
+    except Exception as e:
+        print(f"[Warn]-[updatecatalog]-[wait_crawler_completion] "
+              f"過去の実行時間を取得できません (固定間隔で監視) error={e}")
+    return expected
+
+### 全クローラの状態を一括取得
+def get_crawler_states(glue, crawler_list: list) -> dict:
+    """batch_get_crawlers で状態を取得し、{crawler_name: (state, last_status)} を返す。"""
+    states = {}
+    for start in range(0, len(crawler_list), CRAWLER_BATCH_SIZE):
+        names = crawler_list[start:start + CRAWLER_BATCH_SIZE]
+        try:
+            response = glue.batch_get_crawlers(CrawlerNames=names)
+        except Exception as e:
+            print(f"[Error]-[updatecatalog]-[wait_crawler_completion] "
+                  f"取得失敗 crawlers={names} error={e}")
+            states.update({name: ('ERROR', 'UNKNOWN') for name in names})
+            continue
+        for crawler in response.get('Crawlers', []):
+            last_crawl = crawler.get('LastCrawl') or {}
+            states[crawler['Name']] = (crawler.get('State') or 'UNKNOWN', last_crawl.get('Status') or 'UNKNOWN')
+        for name in response.get('CrawlersNotFound', []):
+            print(f"[Error]-[updatecatalog]-[wait_crawler_completion] Crawler未存在: {name}")
+            states[name] = ('NOT_FOUND', 'UNKNOWN')
+    return states
+
+### 次回の監視までの待機時間
+def next_poll_interval(pending: list, expected: dict, elapsed: float, backoff: float,
+                       min_interval: float, max_interval: float) -> float:
+    """監視ごとに倍にしていく間隔（backoff、min_interval から開始）で待機する。
+    過去の所要時間から完了見込みがある場合は、最も早く完了が見込まれるクローラの残り時間の半分を超えない
+    （残り時間が長いほど間隔を広げ、完了見込みが近づくと短くする）。
+    見込みがない（過去の実行なし・見込みを超過）場合は backoff のみで決める。
+
+    戻り値: 待機秒数（min_interval 以上 max_interval 以下）
+    """
+    interval = backoff
+    remaining = [expected[name] - elapsed for name in pending if name in expected]
+    remaining = [seconds for seconds in remaining if seconds > 0]
+    if remaining:
+        interval = min(interval, min(remaining) / 2)
+    return max(min_interval, min(max_interval, interval))
+
 ### 複数クローラの完了確認
 def wait_crawler_completion(crawler_list: list,
                             timeout_seconds: int = 10800,
-                            poll_interval: int = 30):
+                            poll_interval: float = None):
     """複数クローラの完了 (State=READY) を待機する。
+      - 全クローラの状態を batch_get_crawlers でまとめて取得する。
       - 全クローラがREADY になるまでループ継続。
       - 個別に取得失敗 / 未存在でも他の クローラ は継続監視。
       - いずれか未完了のまま timeout 到達で打ち切り。
-      - 監視間隔はデフォルト30秒。
+      - 監視間隔は CRAWLER_POLL_MIN_INTERVAL（デフォルト5秒）から始めて監視ごとに倍にし、
+        poll_interval（未指定時は CRAWLER_POLL_MAX_INTERVAL、デフォルト300秒）を上限とする。
+        過去の所要時間（get_crawler_metrics）がある場合は、完了見込みまでの残り時間の半分を超えて待機しない。
       - タイムアウトはデフォルト3時間(10800秒)。
+      - クローラごとの完了までの時間を記録し、キャパシティ計画用にログ出力する。
 
     戻り値:
       {
@@ -96,6 +221,8 @@ def wait_crawler_completion(crawler_list: list,
               'crawler_name': str,
               'state': str,          # READY / RUNNING / ERROR / NOT_FOUND / UNKNOWN
               'last_status': str,    # 最終クロール結果 SUCCEEDED/FAILED/CANCELLED/UNKNOWN
+              'completed_seconds': int|None,  # 待機開始から READY を検出するまでの秒数（未完了は None）
+              'expected_seconds': int|None,   # 過去の所要時間（中央値）
             }, ...
         ],
         'all_ready': bool,
@@ -107,6 +234,12 @@ def wait_crawler_completion(crawler_list: list,
     start = time.time()
     polls = 0 # 監視回数
     final_snapshot = [] # 最終状態スナップショット
+    all_ready_flag = False
+    max_interval = CRAWLER_POLL_MAX_INTERVAL if poll_interval is None else poll_interval
+    min_interval = min(CRAWLER_POLL_MIN_INTERVAL, max_interval)
+    backoff = min_interval
+    expected = get_crawler_expected_runtimes(glue, crawler_list)
+    completed = {} # クローラごとの完了検出時の経過秒数
     while True:
         elapsed = time.time() - start
         if elapsed >= timeout_seconds:
@@ -114,53 +247,253 @@ def wait_crawler_completion(crawler_list: list,
                   f"タイムアウト (未完のクローラあり) elapsed={int(elapsed)}s")
             break
 
+        states = get_crawler_states(glue, crawler_list)
+        elapsed = time.time() - start
         snapshot = [] # 現時点の状態スナップショット
-        all_ready_flag = True
         for crawler_name in crawler_list:
-            state = 'UNKNOWN'
-            last_status = 'UNKNOWN'
-            try:
-                crawler = glue.get_crawler(Name=crawler_name)['Crawler']
-                state = crawler.get('State') or 'UNKNOWN'
-                last_crawl = crawler.get('LastCrawl') or {}
-                last_status = last_crawl.get('Status') or 'UNKNOWN'
-            except glue.exceptions.EntityNotFoundException:
-                state = 'NOT_FOUND'
-                last_status = 'UNKNOWN'
-                print(f"[Error]-[updatecatalog]-[wait_crawler_completion] "
-                      f"Crawler未存在: {crawler_name}")
-            except Exception as e:
-                state = 'ERROR'
-                last_status = 'UNKNOWN'
-                print(f"[Error]-[updatecatalog]-[wait_crawler_completion] "
-                      f"取得失敗 crawler={crawler_name} error={e}")
-
+            state, last_status = states.get(crawler_name, ('UNKNOWN', 'UNKNOWN'))
+            if state == 'READY':
+                completed.setdefault(crawler_name, int(elapsed))
             snapshot.append({
                 'crawler_name': crawler_name,
                 'state': state,
                 'last_status': last_status,
+                'completed_seconds': completed.get(crawler_name),
+                'expected_seconds': int(expected[crawler_name]) if crawler_name in expected else None,
             })
-            if state != 'READY':
-                all_ready_flag = False
+        all_ready_flag = all(item['state'] == 'READY' for item in snapshot)
+        final_snapshot = snapshot  # 途中経過を保持
 
         print(f"[Info]-[updatecatalog]-[wait_crawler_completion] "
               f"poll={polls} details={snapshot}")
         polls += 1
         if all_ready_flag:
-            final_snapshot = snapshot
             break
-        time.sleep(poll_interval)
-        final_snapshot = snapshot  # 途中経過を保持
+        pending = [item['crawler_name'] for item in snapshot if item['state'] != 'READY']
+        interval = next_poll_interval(pending, expected, elapsed, backoff, min_interval, max_interval)
+        backoff = min(backoff * 2, max_interval)
+        # タイムアウトを超えて待機しない
+        time.sleep(max(0, min(interval, timeout_seconds - (time.time() - start))))
+
+    # キャパシティ計画用にクローラごとの所要時間を出力
+    for item in final_snapshot:
+        print(f"[Info]-[updatecatalog]-[crawler_metrics] {json.dumps(item, ensure_ascii=False)}")
 
     duration = int(time.time() - start)
     return {
         'crawlers': final_snapshot,
-        'all_ready': all_ready_flag if 'all_ready_flag' in locals() else False,
+        'all_ready': all_ready_flag,
         'duration_seconds': duration,
         'polls': polls,
     }
 
 
+### 指定パーティション配下のParquetキーを取得（<table>.parquet がない場合の分割ファイル対応）
+def find_partition_parquet_key(s3_client, bucket: str, partition_prefix: str):
+    """partition_prefix 配下の最初の Parquet ファイルのキーを返す。存在しない場合は None。"""
+    keys = []
+    paginator_kwargs = {'Bucket': bucket, 'Prefix': partition_prefix}
+    while True:
+        response = s3_client.list_objects_v2(**paginator_kwargs)
+        keys.extend(obj['Key'] for obj in response.get('Contents', []) if obj['Key'].endswith('.parquet'))
+        if not response.get('IsTruncated'):
+            break
+        paginator_kwargs['ContinuationToken'] = response['NextContinuationToken']
+    return sorted(keys)[0] if keys else None
+
+### Parquet スキーマ読込時に末尾から取得するバイト数（フッターがこれより大きい場合は再取得する）
+FOOTER_READ_SIZE = 64 * 1024
+
+### Parquet のスキーマをフッターのみの範囲取得で読み込む
+### m365lib.parquetio.read_parquet_schema と同じ処理（レイヤーを import できないため同じ実装を持つ。スキーマ指紋の索引と同じ理由）。
+### 両者が同一のスキーマを返すことはテスト（test_footer_schema_identical_to_layer）で確認している。
+def read_parquet_footer_schema(s3_client, bucket: str, key: str):
+    """Parquet ファイル末尾 (フッター長4バイト + マジック "PAR1") からフッター長を求め、
+    メタデータ部分のみを Range GET で取得してスキーマを解析する。データ部分は取得しない。
+    通常は1回目の取得 (末尾 FOOTER_READ_SIZE バイト) にフッター全体が含まれる。
+    """
+    tail = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{FOOTER_READ_SIZE}")['Body'].read()
+    if len(tail) < 12 or tail[-4:] != b"PAR1":
+        raise ValueError(f"Parquetファイルではありません。key={key}")
+    footer_size = int.from_bytes(tail[-8:-4], "little") + 8
+    if footer_size > len(tail):
+        tail = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{footer_size}")['Body'].read()
+    return pq.read_schema(BytesIO(b"PAR1" + tail[-footer_size:]))
+
+### Parquet のカラム名をフッターのみの範囲取得で読み込む
+def read_parquet_columns(s3_client, bucket: str, key: str) -> list:
+    return list(read_parquet_footer_schema(s3_client, bucket, key).names)
+
+### スキーマ指紋の索引
+### 変換処理 (m365lib.schemaindex) が出力時に日ごとのスキーマ指紋を記録する。
+### 配置: s3://<bucket>/<group>/<SCHEMA_INDEX_PREFIX><table>/date=YYYYMMDD.json
+###       s3://<bucket>/<group>/<SCHEMA_INDEX_PREFIX><table>/history.json (日ごとの記録の集約)
+### 指紋の算出方法は m365lib.schemaindex と同一とすること。
+### 本スクリプトは ENTRYPOINT.py が S3 から単一ファイルとして取得して実行し、コンテナイメージのビルド
+### コンテキスト（CatalogUpdateContainer_cbvpc）にもレイヤーは含まれないため、m365lib を import できず同じ実装を持つ。
+### 両者が同一の指紋を返すことはテスト（test_schema_fingerprint_identical_to_layer）で確認している。
+SCHEMA_INDEX_PREFIX = os.getenv('SCHEMA_INDEX_PREFIX', 'schemaindex/')
+SCHEMA_INDEX_VERSION = 1
+SCHEMA_HISTORY_NAME = 'history.json'
+
+### スキーマを [[カラム名, 型], ...]（列順）に変換（辞書エンコードの列は値の型とする）
+def schema_columns(schema) -> list:
+    columns = []
+    for field in schema:
+        data_type = field.type
+        if pa.types.is_dictionary(data_type):
+            data_type = data_type.value_type
+        columns.append([field.name, str(data_type)])
+    return columns
+
+def schema_fingerprint(columns: list) -> str:
+    return hashlib.sha256(json.dumps(columns, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def schema_index_prefix(group: str, table: str) -> str:
+    return f"{group}/{SCHEMA_INDEX_PREFIX}{table}/"
+
+### 日ごとのスキーマ指紋を取得（未記録・取得失敗の場合は None）
+def load_schema_index(s3_client, bucket: str, group: str, table: str, day: str):
+    key = f"{schema_index_prefix(group, table)}date={day}.json"
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except Exception as e:
+        err_code = getattr(e, 'response', {}).get('Error', {}).get('Code') if hasattr(e, 'response') else None
+        if not (err_code in ('404', 'NoSuchKey') or 'Not Found' in str(e) or '404' in str(e)):
+            print(f"[Warn]-[updatecatalog]-[load_schema_index] 指紋取得失敗 key={key} err={e}")
+        return None
+    try:
+        entry = json.loads(body.decode('utf-8'))
+    except ValueError as e:
+        print(f"[Warn]-[updatecatalog]-[load_schema_index] 指紋の形式が不正 key={key} err={e}")
+        return None
+    if entry.get('version') != SCHEMA_INDEX_VERSION:
+        return None
+    return entry
+
+### 日ごとのスキーマ指紋を記録（Parquet から読み込んだ場合に索引を補完する。失敗しても処理は継続）
+def write_schema_index(s3_client, bucket: str, group: str, table: str, day: str, columns: list):
+    entry = {
+        'version': SCHEMA_INDEX_VERSION,
+        'table': table,
+        'date': day,
+        'fingerprint': schema_fingerprint(columns),
+        'columns': columns,
+    }
+    try:
+        s3_client.put_object(Bucket=bucket, Key=f"{schema_index_prefix(group, table)}date={day}.json",
+                             Body=json.dumps(entry).encode('utf-8'))
+    except Exception as e:
+        print(f"[Warn]-[updatecatalog]-[write_schema_index] 指紋記録失敗 table={table} date={day} err={e}")
+    return entry
+
+### 指定日のスキーマを取得（指紋の索引を優先し、未記録の場合は Parquet フッターから読み込んで索引に記録）
+def read_day_schema(s3_client, bucket: str, prefix: str, group: str, table: str, day: str, label: str):
+    """戻り値: 指紋の索引と同形式の dict（'fingerprint', 'columns' を含む）。Parquet が存在しない場合は None。"""
+    entry = load_schema_index(s3_client, bucket, group, table, day)
+    if entry is not None:
+        print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] "
+              f"{label}スキーマ指紋を使用 table={table} date={day}")
+        return entry
+
+    key = f"{prefix}{table}/date={day}/{table}.parquet".replace('//', '/')
+    print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] "
+          f"Reading schema s3://{bucket}/{key}")
+    try:
+        schema = read_parquet_footer_schema(s3_client, bucket, key)
+    except Exception as e:
+        err_code = getattr(e, 'response', {}).get('Error', {}).get('Code') if hasattr(e, 'response') else None
+        if not (err_code in ('404', 'NoSuchKey') or 'Not Found' in str(e) or '404' in str(e)):
+            print(f"[Error]-[updatecatalog]-[tablecolumns_diff_verify] "
+                  f"{label}ファイル取得失敗 key={key} err={e}")
+            raise
+        # <table>.parquet がない場合も、同じ date= 配下に分割ファイルがあればそれを比較に使用する
+        split_key = find_partition_parquet_key(s3_client, bucket, key.rsplit('/', 1)[0] + '/')
+        if not split_key:
+            print(f"[Warn]-[updatecatalog]-[tablecolumns_diff_verify] "
+                  f"{label}ファイルなし key={key} err={e} => 全カラム新規扱いで進行")
+            return None
+        print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] "
+              f"分割ファイルを使用 key={split_key}")
+        schema = read_parquet_footer_schema(s3_client, bucket, split_key)
+    return write_schema_index(s3_client, bucket, group, table, day, schema_columns(schema))
+
+### スキーマ指紋の履歴を取得
+def load_schema_history(table: str, base_s3_path: str, backfill: bool = False):
+    """日ごとのスキーマ指紋を集約した履歴 (history.json) を読み込み、未集約の日の記録を取り込んで保存する。
+    backfill=True の場合は、指紋が未記録の日 (索引の導入前など) も Parquet フッターから補完する。
+
+        戻り値(dict):
+            {
+                'version': int,
+                'days': {'YYYYMMDD': 指紋, ...},
+                'schemas': {指紋: [[カラム名, 型], ...], ...},
+            }
+    """
+    parts = base_s3_path.replace("s3://", "").split('/')
+    bucket = parts[0]
+    prefix_parts = [p for p in parts[1:] if p]
+    prefix = '/'.join(prefix_parts) + '/' if prefix_parts else ''
+    group = prefix_parts[0] if prefix_parts else ''
+    index_prefix = schema_index_prefix(group, table)
+    history_key = f"{index_prefix}{SCHEMA_HISTORY_NAME}"
+    s3_client = boto3.client('s3')
+
+    history = {'version': SCHEMA_INDEX_VERSION, 'days': {}, 'schemas': {}}
+    try:
+        loaded = json.loads(s3_client.get_object(Bucket=bucket, Key=history_key)['Body'].read().decode('utf-8'))
+        if loaded.get('version') == SCHEMA_INDEX_VERSION:
+            history = loaded
+    except Exception as e:
+        print(f"[Info]-[updatecatalog]-[load_schema_history] 履歴なし（新規作成）key={history_key} err={e}")
+
+    entries = []
+    # 日ごとの記録のうち履歴に未集約のもの
+    request_kwargs = {'Bucket': bucket, 'Prefix': f"{index_prefix}date="}
+    while True:
+        response = s3_client.list_objects_v2(**request_kwargs)
+        for obj in response.get('Contents', []):
+            day = obj['Key'][len(request_kwargs['Prefix']):].replace('.json', '')
+            if day not in history['days']:
+                entry = load_schema_index(s3_client, bucket, group, table, day)
+                if entry is not None:
+                    entries.append(entry)
+        if not response.get('IsTruncated'):
+            break
+        request_kwargs['ContinuationToken'] = response['NextContinuationToken']
+    # 指紋が未記録の日は Parquet フッターから補完
+    if backfill:
+        recorded = set(history['days']) | {entry['date'] for entry in entries}
+        for day in sorted(list_partition_prefixes(s3_client, bucket, f"{prefix}{table}/")):
+            if day not in recorded:
+                entry = read_day_schema(s3_client, bucket, prefix, group, table, day, '補完対象日')
+                if entry is not None:
+                    entries.append(entry)
+
+    for entry in entries:
+        history['days'][entry['date']] = entry['fingerprint']
+        history['schemas'][entry['fingerprint']] = entry['columns']
+    if entries:
+        s3_client.put_object(Bucket=bucket, Key=history_key, Body=json.dumps(history).encode('utf-8'))
+        print(f"[Info]-[updatecatalog]-[load_schema_history] 履歴更新 table={table} 追加日数={len(entries)}")
+    return history
+
+### 各カラムが最初に出現した日を取得
+def column_first_seen(table: str, base_s3_path: str, backfill: bool = True) -> dict:
+    """スキーマ指紋の履歴から、カラムごとの初出日・最終出現日・型の変遷を返す。
+
+        戻り値: {カラム名: {'first_seen': 'YYYYMMDD', 'last_seen': 'YYYYMMDD', 'types': [..]}, ...}
+    """
+    history = load_schema_history(table, base_s3_path, backfill=backfill)
+    columns = {}
+    for day in sorted(history['days']):
+        for name, data_type in history['schemas'][history['days'][day]]:
+            column = columns.setdefault(name, {'first_seen': day, 'last_seen': day, 'types': []})
+            column['last_seen'] = day
+            if data_type not in column['types']:
+                column['types'].append(data_type)
+    return columns
+
 ### 指定テーブルの指定日のスキーマ差分比較
 def tablecolumns_diff_verify(
     table: str,
@@ -169,24 +502,37 @@ def tablecolumns_diff_verify(
     target_day: str,
     base_cols_override=None,
     target_cols_override=None,
+    s3_client=None,
 ):
     """
-    指定テーブルの Parquet スキーマ(カラム名)差分を比較する。
+    指定テーブルの Parquet スキーマ差分を比較する。
 
     期待S3配置: s3://<bucket>/<group>/<convert_key>/<table>/date=YYYYMMDD/<table>.parquet
+    出力サイズが大きい場合は同じ date= 配下に <table>-00001.parquet ... が追加される（複数ファイル構成）。
+    分割ファイルは全て同じスキーマで出力されるため、比較には1ファイル（通常は <table>.parquet）のみを使用する。
+    ファイルはダウンロードせず、フッターのみを範囲取得してカラム名を読み込む（read_parquet_footer_schema）。
     base_s3_path は "s3://<bucket>/<group>/<convert_key>/" で終端スラッシュ付き想定。
 
         戻り値(dict):
             {
-                'diff': bool,                     # 差分有無（追加/削除いずれか）
+                'diff': bool,                     # 差分有無（スキーマ指紋の不一致・いずれかの日の欠損）
                 'newly_added_columns': [..],      # 基準日に存在し指定日側に存在しないカラム
                 'removed_columns': [..],          # 指定日側に存在し基準日に存在しないカラム
+                'changed_type_columns': [..],     # 両日に存在し型が異なるカラム
                 'base_columns': [..],             # 基準日カラム一覧
                 'target_columns': [..],           # 指定日カラム一覧
+                'base_fingerprint': str|None,     # 基準日スキーマ指紋（カラム名・型・列順のハッシュ）
+                'target_fingerprint': str|None,   # 指定日スキーマ指紋
             }
 
-    base_cols_override / target_cols_override が与えられた場合はS3/Parquet読込をスキップする。
-    テスト用で利用する。
+    各日のスキーマはスキーマ指紋の索引を優先して使用し（ファイルを読まない）、
+    未記録の日のみ Parquet フッターを読み込んで索引に記録する（read_day_schema）。
+    差分の判定はスキーマ指紋（カラム名・型・列順のハッシュ）の比較で行い、型のみ・列順のみの変更も差分ありとする。
+    newly_added_columns / removed_columns / changed_type_columns は差分内容のログ出力用。
+
+    base_cols_override / target_cols_override が与えられた場合はS3/Parquet読込をスキップし、
+    カラム名の追加/削除で判定する。テスト用で利用する。
+    s3_client: 並行処理時は呼び出し側で作成したクライアントを渡す（未指定の場合は作成）。
     """
     # Parquet欠損フラグ（欠損時は差分あり＝新規扱いで full scan に寄せる）
     missing_base = False
@@ -210,70 +556,51 @@ def tablecolumns_diff_verify(
         print(f"[Debug]-[updatecatalog]-[tablecolumns_diff_verify] "
               f"bucket={bucket} base_key={base_key} target_key={target_key}")
 
-        s3_client = boto3.client("s3")
-        base_local_path = f"/tmp/{table}_base.parquet"
-        target_local_path = f"/tmp/{table}_target.parquet"
-
-        print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] "
-              f"Downloading s3://{bucket}/{base_key}")
-        try:
-            s3_client.download_file(bucket, base_key, base_local_path)
-        except Exception as e:
-            # 基準日にデータがないケースがあり、その場合はファイルが存在しないエラーになるため、差分あり扱い（全カラム新規）で続行する
-            err_code = getattr(e, 'response', {}).get('Error', {}).get('Code') if hasattr(e, 'response') else None
-            if err_code in ('404', 'NoSuchKey') or 'Not Found' in str(e) or '404' in str(e):
-                print(f"[Warn]-[updatecatalog]-[tablecolumns_diff_verify] "
-                      f"基準日ファイルなし (データ0件) key={base_key} err={e} => 全カラム新規扱いで進行")
-                missing_base = True
-            else:
-                print(f"[Error]-[updatecatalog]-[tablecolumns_diff_verify] "
-                      f"基準日ファイル取得失敗 key={base_key} err={e}")
-                raise
-        if not missing_base:
-            base_table = pq.read_table(base_local_path)
-            base_cols = list(base_table.schema.names)
-            os.remove(base_local_path)
-        else:
-            base_cols = []  # 全て新規として扱う
+        if s3_client is None:
+            s3_client = boto3.client("s3")
+        group = prefix_parts[0] if prefix_parts else ''
 
-        print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] "
-              f"Downloading s3://{bucket}/{target_key}")
-        try:
-            s3_client.download_file(bucket, target_key, target_local_path)
-        except Exception as e:
-            # 初回実行などで前日(ターゲット)が存在しない場合は差分あり扱い (全カラム新規)
-            err_code = getattr(e, 'response', {}).get('Error', {}).get('Code') if hasattr(e, 'response') else None
-            if err_code in ('404', 'NoSuchKey') or 'Not Found' in str(e) or '404' in str(e):
-                print(f"[Warn]-[updatecatalog]-[tablecolumns_diff_verify] "
-                      f"対象日ファイルなし (初回想定) key={target_key} err={e} => 全カラム新規扱いで進行")
-                missing_target = True
-            else:
-                print(f"[Error]-[updatecatalog]-[tablecolumns_diff_verify] "
-                      f"対象日ファイル取得失敗 key={target_key} err={e}")
-                raise
-        if not missing_target:
-            target_table = pq.read_table(target_local_path)
-            target_cols = list(target_table.schema.names)
-            os.remove(target_local_path)
-        else:
-            target_cols = []  # 全て新規として扱う
+        # 基準日にデータがないケース・初回実行などで前日(ターゲット)が存在しないケースは、差分あり扱い（全カラム新規）で続行する
+        base_entry = read_day_schema(s3_client, bucket, prefix, group, table, base_day, '基準日')
+        target_entry = read_day_schema(s3_client, bucket, prefix, group, table, target_day, '対象日')
+        missing_base = base_entry is None
+        missing_target = target_entry is None
+        base_cols = [] if missing_base else [name for name, _ in base_entry['columns']]
+        target_cols = [] if missing_target else [name for name, _ in target_entry['columns']]
+        base_types = {} if missing_base else dict(base_entry['columns'])
+        target_types = {} if missing_target else dict(target_entry['columns'])
+        base_fingerprint = None if missing_base else base_entry['fingerprint']
+        target_fingerprint = None if missing_target else target_entry['fingerprint']
     else:
         base_cols = list(base_cols_override)
         target_cols = list(target_cols_override)
+        base_types = {}
+        target_types = {}
+        base_fingerprint = None
+        target_fingerprint = None
 
     # 差分（追加/削除）検出
     # 新規追加されたカラム: 基準日(base)にあり指定日(target)にない
     newly_added_columns = [c for c in base_cols if c not in target_cols]
     # 削除されたカラム: 指定日(target)にあり基準日(base)にない
     removed_columns = [c for c in target_cols if c not in base_cols]
+    # 型が変更されたカラム: 両日に存在し型が異なる
+    changed_type_columns = [c for c in base_types if c in target_types and base_types[c] != target_types[c]]
     # どちらかのParquetが欠損なら、新規扱いとして差分ありにする
-    diff_flag = (missing_base or missing_target) or bool(newly_added_columns or removed_columns)
+    if missing_base or missing_target:
+        diff_flag = True
+    elif base_fingerprint is not None and target_fingerprint is not None:
+        # 指紋が異なれば差分あり（カラムの追加/削除・型の変更・列順の変更）
+        diff_flag = base_fingerprint != target_fingerprint
+    else:
+        diff_flag = bool(newly_added_columns or removed_columns)
 
     if diff_flag:
         print(
             f"[Warn]-[updatecatalog]-[tablecolumns_diff_verify] "
             f"カラム差分検出 table={table} "
-            f"newly_added={newly_added_columns} removed={removed_columns}"
+            f"newly_added={newly_added_columns} removed={removed_columns} "
+            f"changed_type={changed_type_columns}"
         )
     else:
         print(f"[Info]-[updatecatalog]-[tablecolumns_diff_verify] 差分なし table={table}")
@@ -282,8 +609,11 @@ def tablecolumns_diff_verify(
         'diff': diff_flag,
         'newly_added_columns': newly_added_columns,
         'removed_columns': removed_columns,
+        'changed_type_columns': changed_type_columns,
         'base_columns': base_cols,
         'target_columns': target_cols,
+        'base_fingerprint': base_fingerprint,
+        'target_fingerprint': target_fingerprint,
     }
 
 ### 特定のテーブルに対して指定日（target_day)を指定してのスキーマ差分比較の場合
@@ -322,54 +652,348 @@ def specifiedday_diff_verify_and_runcrawler(table: str, base_s3_path: str, base_
     )
     return [run_result['crawler_name']]
 
+### テーブル並行処理の同時実行数（差分検証・クローラ起動を並行して行うテーブル数）
+### 起動済みクローラの実行数は制限しない。Glue のクローラ同時実行数の上限に達した場合は起動を再試行して待つ（start_crawler）
+CATALOG_MAX_WORKERS = int(os.getenv('CATALOG_MAX_WORKERS', '5'))
+### テーブルごとの処理（差分検証・クローラ起動）のタイムアウト（秒）
+CATALOG_TABLE_TIMEOUT = int(os.getenv('CATALOG_TABLE_TIMEOUT', '600'))
+### 並行処理で共有するクライアントの接続・読込タイムアウト（秒）
+### 打ち切り指示（cancel_event）は S3 / Glue の応答待ちを中断できないため、応答のない呼び出しはこの時間で失敗させる
+### （executor の終了待ちが応答待ちで止まらないようにする）
+CATALOG_CONNECT_TIMEOUT = int(os.getenv('CATALOG_CONNECT_TIMEOUT', '10'))
+CATALOG_READ_TIMEOUT = int(os.getenv('CATALOG_READ_TIMEOUT', '60'))
+
+### 並行処理で共有するクライアントを作成
+def create_shared_clients():
+    """S3 / SSM / Glue のクライアントを接続・読込タイムアウト付きで作成する。
+
+        戻り値: (s3_client, ssm, glue)
+    """
+    config = Config(connect_timeout=CATALOG_CONNECT_TIMEOUT, read_timeout=CATALOG_READ_TIMEOUT)
+    return (boto3.client('s3', config=config),
+            boto3.client('ssm', config=config),
+            boto3.client('glue', config=config))
+
+### 1テーブルの前日差分検証とクローラ起動
+def diff_verify_and_runcrawler(table: str, base_s3_path: str, base_day: str, target_day: str,
+                               s3_client=None, ssm=None, glue=None, cancel_event=None) -> str:
+    """前日との差分を検証し、差分有無に応じた走査でクローラを起動してクローラ名を返す。
+    クライアントは呼び出し側で作成したもの（スレッド間で共有可能）を使用する。
+    """
+    print(
+        f"[Info]-[updatecatalog]-[prevday_diff_verify_and_runcrawler] "
+        f"テーブル: {table} の前日差分検証を実施します。"
+    )
+    diff_result = tablecolumns_diff_verify(table, base_s3_path, base_day, target_day, s3_client=s3_client)
+    diff_found = diff_result['diff']
+    if diff_found:
+        print(
+            f"[Info]-[updatecatalog]-[prevday_diff_verify_and_runcrawler] "
+            f"テーブル: {table} 差分あり "
+            f"newly_added={diff_result['newly_added_columns']} "
+            f"removed={diff_result['removed_columns']} => クローラー全走査"
+        )
+        run_result = catalog_scan(table, full_scan=True, ssm=ssm, glue=glue, cancel_event=cancel_event)
+    else:
+        print(f"[Info]-[updatecatalog]-[prevday_diff_verify]テーブル: {table} 差分なし => 増分走査")
+        run_result = catalog_scan(table, full_scan=False, ssm=ssm, glue=glue, cancel_event=cancel_event)
+    print(
+        f"[Info]-[updatecatalog]-[prevday_diff_verify] "
+        f"クローラ起動完了 crawler={run_result['crawler_name']}"
+    )
+    return run_result['crawler_name']
+
+### テーブルごとの処理を並行して実行
+def run_tables_concurrently(tables: list, run_table, caller: str,
+                            max_workers: int = None, table_timeout: int = None):
+    """run_table(table, cancel_event) を最大 max_workers 件まで並行して実行する（全体の所要時間は最も遅いテーブルに揃う）。
+    処理開始から table_timeout 秒を超えたテーブルはタイムアウトとし、cancel_event をセットして打ち切る。
+    打ち切り前に処理が完了していた場合（クローラ起動済みなど）も、戻り値は results に含めたうえで
+    errors にはタイムアウトとして記録する（タイムアウト後に完了したテーブルもタイムアウトとして報告される）。
+    実行中の S3 / Glue の呼び出しは中断できないため、応答待ちはクライアントの読込タイムアウト
+    （create_shared_clients）で打ち切られ、executor の終了はそれを待つ。
+
+        戻り値: (results, errors)
+            results: {テーブル名: run_table の戻り値}
+            errors:  {テーブル名: エラー内容 または 'timeout'}
+    """
+    max_workers = CATALOG_MAX_WORKERS if max_workers is None else max_workers
+    table_timeout = CATALOG_TABLE_TIMEOUT if table_timeout is None else table_timeout
+    # テーブルごとの処理開始時刻（キュー待ちの時間はタイムアウトに含めない）と打ち切り指示
+    started = {}
+    cancel_events = {table: threading.Event() for table in tables}
+
+    def run(table):
+        started[table] = time.time()
+        return run_table(table, cancel_events[table])
+
+    results = {}
+    errors = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tables))))
+    try:
+        pending = {executor.submit(run, table): table for table in tables}
+        while pending:
+            done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                table = pending.pop(future)
+                try:
+                    results[table] = future.result()
+                except Exception as e:
+                    if errors.get(table) != 'timeout':
+                        print(f"[Error]-[updatecatalog]-[{caller}] "
+                              f"テーブル: {table} 処理失敗 error={e}")
+                        errors[table] = str(e)
+                    continue
+                if errors.get(table) == 'timeout':
+                    print(f"[Warn]-[updatecatalog]-[{caller}] "
+                          f"テーブル: {table} タイムアウト後に処理が完了 result={results[table]}")
+            now = time.time()
+            for table in pending.values():
+                if table in started and table not in errors and now - started[table] > table_timeout:
+                    print(f"[Error]-[updatecatalog]-[{caller}] "
+                          f"テーブル: {table} タイムアウト ({table_timeout}s) => クローラ起動を打ち切り")
+                    errors[table] = 'timeout'
+                    cancel_events[table].set()
+    finally:
+        # 処理中のテーブルは打ち切り、クローラを起動しないまま終了するのを待つ
+        for event in cancel_events.values():
+            event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+    return results, errors
+
 ### 各テーブルの前日差分比較の場合
 ### 差分有の場合：クローラー全走査
 ### 差分無の場合：増分走査
-def prevday_diff_verify_and_runcrawler(tablelist: str, base_s3_path: str, base_date: str):
+def prevday_diff_verify_and_runcrawler(tablelist: str, base_s3_path: str, base_date: str,
+                                       max_workers: int = None, table_timeout: int = None):
     """前日との差分を各テーブルで検証し、差分有無に応じて走査種別を切替。
+    テーブルごとの処理は最大 max_workers 件まで並行して実行する（run_tables_concurrently）。
+    boto3 のクライアントは最初に作成して各スレッドで共有する（boto3.client の作成はスレッドセーフでないため）。
+    クライアントには接続・読込タイムアウトを設定し、応答のない呼び出しで打ち切りが止まらないようにする。
+    処理開始から table_timeout 秒を超えたテーブルはタイムアウトとし、クローラを起動させずに打ち切る。
+    失敗・タイムアウトしたテーブルがある場合は、他のテーブルの処理と起動済みクローラの完了を待ってから例外を送出する。
 
         戻り値: list[str]
-            起動したクローラ名のリスト
+            起動したクローラ名のリスト（tablelist の順）
     """
-    # テーブルに紐づくクローラー名リスト
-    run_crawler_list = []
-    # 各テーブルで前日差分検証とクローラー起動を実施
-    for table in tablelist.split(','):
-        print(
-            f"[Info]-[updatecatalog]-[prevday_diff_verify_and_runcrawler] "
-            f"テーブル: {table} の前日差分検証を実施します。"
+    base_day = base_date.replace("-", "")
+    target_day = (pd.to_datetime(base_date) - pd.Timedelta(days=1)).strftime('%Y%m%d')
+    tables = tablelist.split(',')
+    s3_client, ssm, glue = create_shared_clients()
+
+    def run_table(table, cancel_event):
+        return diff_verify_and_runcrawler(table, base_s3_path, base_day, target_day,
+                                          s3_client=s3_client, ssm=ssm, glue=glue,
+                                          cancel_event=cancel_event)
+
+    results, errors = run_tables_concurrently(tables, run_table, 'prevday_diff_verify_and_runcrawler',
+                                              max_workers=max_workers, table_timeout=table_timeout)
+
+    run_crawler_list = [results[table] for table in tables if table in results]
+    print(f"[Info]-[updatecatalog]-[prevday_diff_verify] crawler_list={run_crawler_list}")
+    if errors:
+        # 起動済みのクローラは完了を待ってから例外とする
+        if run_crawler_list:
+            complite_result = wait_crawler_completion(run_crawler_list)
+            print(f"[Info]-[updatecatalog]-[prevday_diff_verify] 起動済みクローラの完了結果: {complite_result}")
+        raise RuntimeError(f"差分検証・クローラ起動に失敗したテーブルがあります: {errors}")
+
+    return run_crawler_list
+
+### パーティション直接登録（batch_create_partition の1回あたりの上限件数）
+PARTITION_BATCH_SIZE = 100
+
+### テーブルに対応する Glue カタログのデータベース名・テーブル名を取得
+def resolve_catalog_table(table: str, ssm=None, glue=None):
+    """テーブル対応のクローラ設定 (出力先データベース・テーブル接頭辞) から Glue テーブルを特定する。
+    クローラは <table>/ フォルダを1テーブルとして作成するため、テーブル名は 接頭辞 + <table> となる。
+
+    戻り値: (database_name, catalog_table_name)
+    """
+    if ssm is None:
+        ssm = boto3.client('ssm')
+    if glue is None:
+        glue = boto3.client('glue')
+    param_name = f'/m365/updatecatalog/crawler/{table}'
+    crawler_name = ssm.get_parameter(Name=param_name, WithDecryption=False)['Parameter']['Value']
+    crawler = glue.get_crawler(Name=crawler_name)['Crawler']
+    return crawler['DatabaseName'], f"{crawler.get('TablePrefix') or ''}{table}"
+
+### テーブル配下の date= プレフィックスを取得
+def list_partition_prefixes(s3_client, bucket: str, table_prefix: str) -> dict:
+    """table_prefix 直下の date=YYYYMMDD/ を列挙する (オブジェクトは列挙しない)。
+
+    戻り値: {'YYYYMMDD': 'date=YYYYMMDD/ までのキー', ...}
+    """
+    prefixes = {}
+    paginator_kwargs = {'Bucket': bucket, 'Prefix': table_prefix, 'Delimiter': '/'}
+    while True:
+        response = s3_client.list_objects_v2(**paginator_kwargs)
+        for common_prefix in response.get('CommonPrefixes', []):
+            folder = common_prefix['Prefix'][len(table_prefix):].rstrip('/')
+            if folder.startswith('date='):
+                prefixes[folder[len('date='):]] = common_prefix['Prefix']
+        if not response.get('IsTruncated'):
+            break
+        paginator_kwargs['ContinuationToken'] = response['NextContinuationToken']
+    return prefixes
+
+### Glue カタログに登録済みのパーティション値を取得
+def get_registered_partitions(glue, database: str, catalog_table: str) -> set:
+    registered = set()
+    request_kwargs = {'DatabaseName': database, 'TableName': catalog_table, 'ExcludeColumnSchema': True}
+    while True:
+        response = glue.get_partitions(**request_kwargs)
+        registered.update(partition['Values'][0] for partition in response.get('Partitions', []))
+        if not response.get('NextToken'):
+            break
+        request_kwargs['NextToken'] = response['NextToken']
+    return registered
+
+### 未登録の date= パーティションを Glue カタログに直接登録
+def register_partitions(table: str, base_s3_path: str, s3_client=None, ssm=None, glue=None):
+    """S3 の date= プレフィックスのうちカタログ未登録のものを batch_create_partition で登録する。
+    スキーマ差分（カラムの追加/削除・型の変更）がないことを確認済みの前提で、カタログ上のテーブル定義
+    (StorageDescriptor) を Location のみ差し替えて各パーティションに使用する (クローラによるファイル走査を行わない)。
+    s3_client / ssm / glue: 並行処理時は呼び出し側で作成したクライアントを渡す（未指定の場合は作成）
+
+    戻り値:
+      None (カタログにテーブル未作成。呼び出し側でクローラ全走査とする)
+      または
+      {
+        'table': str,
+        'registered': [..],   # 登録したパーティション値 (YYYYMMDD)
+        'failed': [..],       # 登録に失敗したパーティション値と理由
+      }
+    """
+    if glue is None:
+        glue = boto3.client('glue')
+    if s3_client is None:
+        s3_client = boto3.client('s3')
+    parts = base_s3_path.replace("s3://", "").split('/')
+    bucket = parts[0]
+    prefix = '/'.join(p for p in parts[1:] if p)
+    table_prefix = f"{prefix}/{table}/" if prefix else f"{table}/"
+
+    database, catalog_table = resolve_catalog_table(table, ssm=ssm, glue=glue)
+    try:
+        storage_descriptor = glue.get_table(DatabaseName=database, Name=catalog_table)['Table']['StorageDescriptor']
+    except glue.exceptions.EntityNotFoundException:
+        print(f"[Warn]-[updatecatalog]-[register_partitions] "
+              f"カタログにテーブル未作成 table={database}.{catalog_table}")
+        return None
+
+    registered = get_registered_partitions(glue, database, catalog_table)
+    prefixes = list_partition_prefixes(s3_client, bucket, table_prefix)
+    new_days = sorted(day for day in prefixes if day not in registered)
+    print(f"[Info]-[updatecatalog]-[register_partitions] table={database}.{catalog_table} "
+          f"登録済み={len(registered)} 新規={new_days}")
+
+    created = []
+    failed = []
+    for start in range(0, len(new_days), PARTITION_BATCH_SIZE):
+        chunk = new_days[start:start + PARTITION_BATCH_SIZE]
+        partition_inputs = [{
+            'Values': [day],
+            'StorageDescriptor': dict(storage_descriptor, Location=f"s3://{bucket}/{prefixes[day]}"),
+        } for day in chunk]
+        response = glue.batch_create_partition(
+            DatabaseName=database,
+            TableName=catalog_table,
+            PartitionInputList=partition_inputs,
         )
-        base_day = base_date.replace("-", "")
-        target_day = (pd.to_datetime(base_date) - pd.Timedelta(days=1)).strftime('%Y%m%d')
-        diff_result = tablecolumns_diff_verify(table, base_s3_path, base_day, target_day)
-        diff_found = diff_result['diff']
-        if diff_found:
-            print(
-                f"[Info]-[updatecatalog]-[prevday_diff_verify_and_runcrawler] "
-                f"テーブル: {table} 差分あり "
-                f"newly_added={diff_result['newly_added_columns']} "
-                f"removed={diff_result['removed_columns']} => クローラー全走査"
-            )
-            run_result = catalog_scan(table, full_scan=True)
-        else:
-            print(f"[Info]-[updatecatalog]-[prevday_diff_verify]テーブル: {table} 差分なし => 増分走査")
-            run_result = catalog_scan(table, full_scan=False)
+        errors = {}
+        for error in response.get('Errors', []):
+            error_detail = error.get('ErrorDetail') or {}
+            # 並行実行などで登録済みとなったものは成功扱い
+            if error_detail.get('ErrorCode') != 'AlreadyExistsException':
+                errors[error['PartitionValues'][0]] = error_detail.get('ErrorMessage')
+        created.extend(day for day in chunk if day not in errors)
+        failed.extend({'value': day, 'error': message} for day, message in errors.items())
+
+    if failed:
+        print(f"[Error]-[updatecatalog]-[register_partitions] 登録失敗 table={catalog_table} failed={failed}")
+    return {
+        'table': table,
+        'registered': created,
+        'failed': failed,
+    }
+
+### 1テーブルの前日差分検証とパーティション直接登録
+def diff_verify_and_register_partitions(table: str, base_s3_path: str, base_day: str, target_day: str,
+                                        s3_client=None, ssm=None, glue=None, cancel_event=None) -> dict:
+    """前日との差分を検証し、スキーマ変更がなければパーティションを直接登録、あればクローラ全走査とする。
+    登録するパーティションはカタログのテーブル定義をそのまま使うため、カラム名が同じでも型が変わった場合
+    （スキーマ指紋の不一致。tablecolumns_diff_verify で差分ありとなる）はクローラ全走査とする。
+
+        戻り値: {'crawler_name': str} または {'register_result': register_partitions の結果}
+    """
+    diff_result = tablecolumns_diff_verify(table, base_s3_path, base_day, target_day, s3_client=s3_client)
+    register_result = None
+    if diff_result['diff']:
         print(
-            f"[Info]-[updatecatalog]-[prevday_diff_verify] "
-            f"クローラ起動完了 crawler={run_result['crawler_name']}"
+            f"[Info]-[updatecatalog]-[prevday_diff_verify_and_register_partitions] "
+            f"テーブル: {table} 差分あり "
+            f"newly_added={diff_result['newly_added_columns']} "
+            f"removed={diff_result['removed_columns']} "
+            f"changed_type={diff_result.get('changed_type_columns', [])} => クローラー全走査"
         )
-        run_crawler_list.append(run_result['crawler_name'])
+    else:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RuntimeError(f"パーティション登録中止 (打ち切り) table={table}")
+        register_result = register_partitions(table, base_s3_path, s3_client=s3_client, ssm=ssm, glue=glue)
+    if register_result is None:
+        run_result = catalog_scan(table, full_scan=True, ssm=ssm, glue=glue, cancel_event=cancel_event)
+        return {'crawler_name': run_result['crawler_name']}
+    return {'register_result': register_result}
 
-    print(f"[Info]-[updatecatalog]-[prevday_diff_verify] crawler_list={run_crawler_list}")
+### 各テーブルの前日差分比較のうえパーティション直接登録の場合
+### 差分有の場合：クローラー全走査
+### 差分無の場合：パーティション直接登録（クローラー不使用）
+def prevday_diff_verify_and_register_partitions(tablelist: str, base_s3_path: str, base_date: str,
+                                                max_workers: int = None, table_timeout: int = None):
+    """前日との差分を各テーブルで検証し、差分なしのテーブルはクローラを使わずパーティションを登録する。
+    差分ありのテーブル（型のみの変更を含む）・カタログ未作成のテーブルはクローラ全走査とする。
+    テーブルごとの処理は prevdif と同じく並行して実行し（run_tables_concurrently）、クライアントは共有する。
+    失敗・タイムアウトしたテーブルがある場合は、起動済みクローラの完了を待ってから例外を送出する。
 
-    return run_crawler_list
+        戻り値: (list[str], list[dict])
+            起動したクローラ名のリスト, register_partitions の結果リスト（いずれも tablelist の順）
+    """
+    base_day = base_date.replace("-", "")
+    target_day = (pd.to_datetime(base_date) - pd.Timedelta(days=1)).strftime('%Y%m%d')
+    tables = tablelist.split(',')
+    s3_client, ssm, glue = create_shared_clients()
+
+    def run_table(table, cancel_event):
+        return diff_verify_and_register_partitions(table, base_s3_path, base_day, target_day,
+                                                   s3_client=s3_client, ssm=ssm, glue=glue,
+                                                   cancel_event=cancel_event)
+
+    results, errors = run_tables_concurrently(tables, run_table, 'prevday_diff_verify_and_register_partitions',
+                                              max_workers=max_workers, table_timeout=table_timeout)
+
+    ordered = [results[table] for table in tables if table in results]
+    run_crawler_list = [result['crawler_name'] for result in ordered if 'crawler_name' in result]
+    register_results = [result['register_result'] for result in ordered if 'register_result' in result]
+    print(f"[Info]-[updatecatalog]-[prevday_diff_verify_and_register_partitions] "
+          f"crawler_list={run_crawler_list} registered={register_results}")
+    if errors:
+        # 起動済みのクローラは完了を待ってから例外とする
+        if run_crawler_list:
+            complite_result = wait_crawler_completion(run_crawler_list)
+            print(f"[Info]-[updatecatalog]-[prevday_diff_verify_and_register_partitions] "
+                  f"起動済みクローラの完了結果: {complite_result}")
+        raise RuntimeError(f"差分検証・パーティション登録に失敗したテーブルがあります: {errors}")
+    return run_crawler_list, register_results
 
 ### カタログ更新処理メイン
 ## 引数
 # event: イベントデータ（辞書形式）
-# 例）　{"exec_type": "prevdif"|"specdif"|"fulscan",
+# 例）　{"exec_type": "prevdif"|"specdif"|"fulscan"|"partreg"|"colhist",
 #          "targettable": "テーブル名",
-#          "specdif_targetday": "yyyymmdd"（specdif時のみ必須）}
+#          "specdif_targetday": "yyyymmdd"（specdif時のみ必須）,
+#          "basedate": "yyyy-mm-dd"（任意。未指定またはnaの場合は基準日ファイルから取得）}
 # context: コンテキスト情報（未使用）※基本ECSでの実行だが、Lambda互換の引数形式を想定
 ## 必須環境変数
 # GROUP: カタログ化対象グループ名
@@ -384,9 +1008,11 @@ def updatecatalog(event, context):
     # prevdivの場合、グループ内の全テーブルのスキーマ変更有無について前日差分検証を実施のうえ増分走査
     # specdifの場合、指定テーブルのスキーマ変更有無について指定日の差分検証を実施のうえ増分走査
     # fulscanの場合、指定テーブルを全走査
-    if exectype not in ['prevdif', 'specdif', 'fulscan']:
+    # partregの場合、prevdifと同様に前日差分検証を実施のうえ、差分なしのテーブルはクローラを使わずパーティションを直接登録
+    # colhistの場合、指定テーブルのスキーマ指紋の履歴から各カラムの初出日を出力（カタログは更新しない）
+    if exectype not in ['prevdif', 'specdif', 'fulscan', 'partreg', 'colhist']:
         print("[Error]-[updatecatalog]-[InvalidInput]"
-              "exec_type パラメータが不正です。'prevdif', 'specdif', 'fulscan' を指定してください。")
+              "exec_type パラメータが不正です。'prevdif', 'specdif', 'fulscan', 'partreg', 'colhist' を指定してください。")
         return json.dumps({'status': 'failed'})
 
     # sepcdifの場合、基準日と比較する日付が必要
@@ -414,8 +1040,8 @@ def updatecatalog(event, context):
                   "targettable パラメータが未設定")
             return json.dumps({'status': 'failed'})
 
-    # fulscanの場合、指定テーブルが必要
-    if exectype == 'fulscan':
+    # fulscan/colhistの場合、指定テーブルが必要
+    if exectype in ('fulscan', 'colhist'):
         targettable = event.get('targettable')
         if targettable is None:
             print("[Error]-[updatecatalog]-[InvalidInput]"
@@ -441,14 +1067,10 @@ def updatecatalog(event, context):
     # S3バケットとキーのベース部分を組み立て
     base_s3_path = f"s3://{bucket_name}/{group}/{convert_key}/"
     # 基準日取得(yyyy-mm-dd)
-    s3_client = boto3.client('s3')
-    csv_file = s3_client.get_object(
-        Bucket=bucket_name,
-        Key="basedatetime/basedatetime.csv"
-        )
-    csv_file_body = csv_file['Body'].read().decode('utf-8')
-    df = pd.read_csv(StringIO(csv_file_body), usecols=['base'])
-    base_date = df['base'].iloc[0]
+    # 実行コンテキストで basedate が指定されていればそのまま使用し、未指定(na)の場合のみ基準日ファイルを取得
+    base_date = event.get('basedate')
+    if not base_date or base_date == 'na':
+        base_date = load_base_date(bucket_name)
 
     # カタログ更新処理呼び出し
     if exectype == 'prevdif':
@@ -469,4 +1091,17 @@ def updatecatalog(event, context):
             f"[Info]-[updatecatalog] "
             f"指定テーブルによるカタログ全更新処理完了結果: {complite_result}"
         )
+    elif exectype == 'colhist':
+        history = column_first_seen(targettable, base_s3_path)
+        print(f"[Info]-[updatecatalog] カラム履歴 table={targettable}: {json.dumps(history, ensure_ascii=False)}")
+    elif exectype == 'partreg':
+        run_crawler_list, register_results = prevday_diff_verify_and_register_partitions(
+            tablelist, base_s3_path, base_date)
+        if run_crawler_list:
+            complite_result = wait_crawler_completion(run_crawler_list)
+            print(f"[Info]-[updatecatalog] スキーマ差分ありテーブルのカタログ更新処理完了結果: {complite_result}")
+        if any(result['failed'] for result in register_results):
+            print("[Error]-[updatecatalog] パーティション登録に失敗したテーブルがあります。")
+            return json.dumps({'status': 'failed'})
+        print(f"[Info]-[updatecatalog] パーティション直接登録完了結果: {register_results}")
     return json.dumps({'status': 'success'})
\ No newline at end of file
@@ -16,8 +16,30 @@ from updatecatalog import (
     wait_crawler_completion,
     specifiedday_diff_verify_and_runcrawler,
     prevday_diff_verify_and_runcrawler,
+    register_partitions,
+    prevday_diff_verify_and_register_partitions,
+    schema_columns,
+    schema_fingerprint,
+    column_first_seen,
 )  # noqa: E402
 
+def _parquet_bytes(data: dict) -> bytes:
+    """テスト用の Parquet ファイルのバイト列を作成"""
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pydict(data), buffer)
+    return buffer.getvalue()
+
+
+def _ranged_body(data: bytes, Range: str):
+    """get_object の Range (bytes=-N) に応じて末尾 N バイトを返す Body"""
+    length = int(Range.split('-')[-1])
+    tail = data[-length:]
+    return type("B", (), {"read": lambda self: tail})()
+
+
 @pytest.fixture(autouse=True)
 def mock_boto3(monkeypatch, tmp_path):
     """boto3 SSM/S3 クライアントをモックし、prevdif経路での S3/Parquet アクセスを無害化"""
@@ -44,18 +66,23 @@ def mock_boto3(monkeypatch, tmp_path):
             return self._b
 
     class DummyS3:
-        def get_object(self, Bucket, Key):  # base 日付CSV
-            return {"Body": DummyBody(b"base\n2025-01-21\n")}
-        def download_file(self, Bucket, Key, Filename):
-            import pyarrow as pa
-            import pyarrow.parquet as pq
-            table = pa.Table.from_pydict({"id": [1]})
-            pq.write_table(table, Filename)
+        def get_object(self, Bucket, Key, Range=None):
+            if '/schemaindex/' in Key:  # スキーマ指紋は未記録
+                raise Exception("NoSuchKey 404")
+            if Range is not None:  # Parquet フッターの範囲取得
+                return {"Body": _ranged_body(_parquet_bytes({"id": [1]}), Range)}
+            return {"Body": DummyBody(b"base\n2025-01-21\n")}  # base 日付CSV
+        def put_object(self, Bucket, Key, Body):
+            return {}
 
     class DummyGlue:
         class exceptions:
             class EntityNotFoundException(Exception):
                 pass
+            class CrawlerRunningException(Exception):
+                pass
+            class ResourceNumberLimitExceededException(Exception):
+                pass
 
         def __init__(self):
             self.updated = {}
@@ -71,8 +98,10 @@ def mock_boto3(monkeypatch, tmp_path):
                 'ResponseMetadata': {'RequestId': 'dummy-request-id'},
                 'CrawlerRunId': f'run-{Name}-1'
             }
-        def get_crawler(self, Name):
+        def batch_get_crawlers(self, CrawlerNames):
             # デフォルトで即座に READY を返す（wait_crawler_completion で即完了）
+            return {'Crawlers': [self.get_crawler(n)['Crawler'] for n in CrawlerNames]}
+        def get_crawler(self, Name):
             return {
                 'Crawler': {
                     'Name': Name,
@@ -81,7 +110,7 @@ def mock_boto3(monkeypatch, tmp_path):
                 }
             }
 
-    def _client(service_name):
+    def _client(service_name, **kwargs):
         if service_name == 'ssm':
             return DummySSM()
         if service_name == 's3':
@@ -244,18 +273,16 @@ def test_tablecolumns_missing_target_file(monkeypatch, tmp_path):
 
     # 既存 autouse フィクスチャの boto3.client を上書きしてターゲット日付のみ欠如を再現
     class DummyS3Missing:
-        def get_object(self, Bucket, Key):
-            return {"Body": type("B", (), {"read": lambda self: b"base\n2025-01-21\n"})()}
-        def download_file(self, Bucket, Key, Filename):
-            # target_day=20250120 を含むキーなら存在しない想定で例外
-            if "date=20250120" in Key:
+        def get_object(self, Bucket, Key, Range=None):
+            # target_day=20250120 を含むキー・スキーマ指紋なら存在しない想定で例外
+            if "date=20250120" in Key or '/schemaindex/' in Key:
                 raise Exception("NoSuchKey 404")
-            import pyarrow as pa
-            import pyarrow.parquet as pq
-            table = pa.Table.from_pydict({"id": [1]})
-            pq.write_table(table, Filename)
+            return {"Body": _ranged_body(_parquet_bytes({"id": [1]}), Range)}
+        def list_objects_v2(self, Bucket, Prefix, **kwargs):
+            # 分割ファイルも存在しない
+            return {"KeyCount": 0}
 
-    def _client(service_name):
+    def _client(service_name, **kwargs):
         if service_name == 's3':
             return DummyS3Missing()
         raise AssertionError(f"Unexpected service: {service_name}")
@@ -275,27 +302,88 @@ def test_tablecolumns_missing_target_file(monkeypatch, tmp_path):
     assert result['target_columns'] == []
 
 
+# <table>.parquet がなく分割ファイル（<table>-00001.parquet ...）のみ存在する場合は分割ファイルで比較する
+def test_tablecolumns_split_files_only(monkeypatch):
+    import boto3
+
+    class DummyS3Split:
+        def __init__(self):
+            self.downloaded = []
+        def get_object(self, Bucket, Key, Range=None):
+            if Key.endswith("/sample.parquet") or '/schemaindex/' in Key:
+                raise Exception("NoSuchKey 404")
+            self.downloaded.append(Key)
+            return {"Body": _ranged_body(_parquet_bytes({"id": [1], "name": ["a"]}), Range)}
+        def list_objects_v2(self, Bucket, Prefix, **kwargs):
+            return {"Contents": [{"Key": f"{Prefix}sample-00002.parquet"},
+                                 {"Key": f"{Prefix}sample-00001.parquet"}],
+                    "IsTruncated": False}
+
+    s3 = DummyS3Split()
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+
+    result = tablecolumns_diff_verify(
+        table="sample",
+        base_s3_path="s3://m365-dwh/group1/convert/",
+        base_day="20250121",
+        target_day="20250120",
+    )
+    assert result['diff'] is False
+    assert result['base_columns'] == ["id", "name"]
+    assert s3.downloaded == [
+        "group1/convert/sample/date=20250121/sample-00001.parquet",
+        "group1/convert/sample/date=20250120/sample-00001.parquet",
+    ]
+
+
+# スキーマはフッターのみの範囲取得で読み込み、フッターが初回取得サイズを超える場合のみ再取得すること
+def test_tablecolumns_reads_footer_only(monkeypatch):
+    import boto3
+    import updatecatalog as uc
+
+    data = _parquet_bytes({f"col{i}": [str(n * 7919 + i) for n in range(20000)] for i in range(3)})
+    class DummyS3Range:
+        def __init__(self):
+            self.ranges = []
+        def get_object(self, Bucket, Key, Range=None):
+            assert Range is not None and Range.startswith("bytes=-")
+            self.ranges.append(Range)
+            return {"Body": _ranged_body(data, Range)}
+
+    s3 = DummyS3Range()
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    assert uc.read_parquet_columns(s3, "bucket", "k.parquet") == ["col0", "col1", "col2"]
+    assert s3.ranges == [f"bytes=-{uc.FOOTER_READ_SIZE}"]
+    assert uc.FOOTER_READ_SIZE < len(data)
+
+    # フッターより小さい初回取得サイズでは、フッター長を求めてから2回目で全体を取得
+    monkeypatch.setattr(uc, 'FOOTER_READ_SIZE', 16)
+    s3.ranges = []
+    assert uc.read_parquet_columns(s3, "bucket", "k.parquet") == ["col0", "col1", "col2"]
+    assert s3.ranges[0] == "bytes=-16" and len(s3.ranges) == 2
+
+
 ## wait_crawler_completion のテスト群
+def _crawler(name, state, status):
+    return {'Name': name, 'State': state, 'LastCrawl': {'Status': status}}
+
+
 def test_wait_crawler_completion_all_ready(monkeypatch):
-    """全クローラが即座にREADYの場合、1回の監視周期(polls)で終了すること"""
+    """全クローラが即座にREADYの場合、1回の監視周期(polls)・1回の一括取得で終了すること"""
     import boto3
 
     class GlueWaitMock:
         def __init__(self):
             self.call_count = 0
-        def get_crawler(self, Name):
+        def batch_get_crawlers(self, CrawlerNames):
             self.call_count += 1
-            return {
-                'Crawler': {
-                    'Name': Name,
-                    'State': 'READY',
-                    'LastCrawl': {'Status': 'SUCCEEDED'}
-                }
-            }
+            return {'Crawlers': [_crawler(n, 'READY', 'SUCCEEDED') for n in CrawlerNames],
+                    'CrawlersNotFound': []}
 
-    def _client(service_name):
+    glue = GlueWaitMock()
+    def _client(service_name, **kwargs):
         if service_name == 'glue':
-            return GlueWaitMock()
+            return glue
         raise AssertionError(f"Unexpected service: {service_name}")
 
     monkeypatch.setattr(boto3, 'client', _client)
@@ -305,7 +393,9 @@ def test_wait_crawler_completion_all_ready(monkeypatch):
     assert len(result['crawlers']) == 2
     assert result['crawlers'][0]['state'] == 'READY'
     assert result['crawlers'][1]['state'] == 'READY'
+    assert result['crawlers'][0]['completed_seconds'] == 0
     assert result['polls'] == 1
+    assert glue.call_count == 1
 
 
 def test_wait_crawler_completion_running_to_ready(monkeypatch):
@@ -315,27 +405,14 @@ def test_wait_crawler_completion_running_to_ready(monkeypatch):
     class GlueStateMock:
         def __init__(self):
             self.poll_count = 0
-        def get_crawler(self, Name):
+        def batch_get_crawlers(self, CrawlerNames):
             self.poll_count += 1
             # 最初2回は RUNNING、3回目で READY
             if self.poll_count <= 2:
-                return {
-                    'Crawler': {
-                        'Name': Name,
-                        'State': 'RUNNING',
-                        'LastCrawl': {'Status': 'RUNNING'}
-                    }
-                }
-            else:
-                return {
-                    'Crawler': {
-                        'Name': Name,
-                        'State': 'READY',
-                        'LastCrawl': {'Status': 'SUCCEEDED'}
-                    }
-                }
+                return {'Crawlers': [_crawler(n, 'RUNNING', 'RUNNING') for n in CrawlerNames]}
+            return {'Crawlers': [_crawler(n, 'READY', 'SUCCEEDED') for n in CrawlerNames]}
 
-    def _client(service_name):
+    def _client(service_name, **kwargs):
         if service_name == 'glue':
             return GlueStateMock()
         raise AssertionError(f"Unexpected service: {service_name}")
@@ -356,36 +433,14 @@ def test_wait_crawler_completion_multiple_mixed_state(monkeypatch):
     class GlueMixedMock:
         def __init__(self):
             self.poll_count = 0
-        def get_crawler(self, Name):
+        def batch_get_crawlers(self, CrawlerNames):
             self.poll_count += 1
             # crawler1 は最初から READY、crawler2 は2回目から READY
-            if Name == 'crawler1':
-                return {
-                    'Crawler': {
-                        'Name': Name,
-                        'State': 'READY',
-                        'LastCrawl': {'Status': 'SUCCEEDED'}
-                    }
-                }
-            else:  # crawler2
-                if self.poll_count <= 2:
-                    return {
-                        'Crawler': {
-                            'Name': Name,
-                            'State': 'RUNNING',
-                            'LastCrawl': {'Status': 'RUNNING'}
-                        }
-                    }
-                else:
-                    return {
-                        'Crawler': {
-                            'Name': Name,
-                            'State': 'READY',
-                            'LastCrawl': {'Status': 'SUCCEEDED'}
-                        }
-                    }
-
-    def _client(service_name):
+            crawler2 = 'RUNNING' if self.poll_count < 2 else 'READY'
+            return {'Crawlers': [_crawler('crawler1', 'READY', 'SUCCEEDED'),
+                                 _crawler('crawler2', crawler2, 'SUCCEEDED')]}
+
+    def _client(service_name, **kwargs):
         if service_name == 'glue':
             return GlueMixedMock()
         raise AssertionError(f"Unexpected service: {service_name}")
@@ -396,6 +451,7 @@ def test_wait_crawler_completion_multiple_mixed_state(monkeypatch):
     assert result['all_ready'] is True
     assert len(result['crawlers']) == 2
     assert all(c['state'] == 'READY' for c in result['crawlers'])
+    assert all(c['completed_seconds'] is not None for c in result['crawlers'])
 
 
 def test_wait_crawler_completion_timeout(monkeypatch):
@@ -403,17 +459,11 @@ def test_wait_crawler_completion_timeout(monkeypatch):
     import boto3
 
     class GlueTimeoutMock:
-        def get_crawler(self, Name):
+        def batch_get_crawlers(self, CrawlerNames):
             # 常に RUNNING を返す
-            return {
-                'Crawler': {
-                    'Name': Name,
-                    'State': 'RUNNING',
-                    'LastCrawl': {'Status': 'RUNNING'}
-                }
-            }
+            return {'Crawlers': [_crawler(n, 'RUNNING', 'RUNNING') for n in CrawlerNames]}
 
-    def _client(service_name):
+    def _client(service_name, **kwargs):
         if service_name == 'glue':
             return GlueTimeoutMock()
         raise AssertionError(f"Unexpected service: {service_name}")
@@ -423,21 +473,18 @@ def test_wait_crawler_completion_timeout(monkeypatch):
 
     assert result['all_ready'] is False
     assert result['crawlers'][0]['state'] == 'RUNNING'
+    assert result['crawlers'][0]['completed_seconds'] is None
 
 
 def test_wait_crawler_completion_not_found(monkeypatch):
     """存在しないクローラは state=NOT_FOUND で記録されること"""
     import boto3
 
-    # EntityNotFoundException を模擬するため例外属性を追加
     class MockGlueClient:
-        class exceptions:
-            class EntityNotFoundException(Exception):
-                pass
-        def get_crawler(self, Name):
-            raise self.exceptions.EntityNotFoundException()
+        def batch_get_crawlers(self, CrawlerNames):
+            return {'Crawlers': [], 'CrawlersNotFound': CrawlerNames}
 
-    def _client(service_name):
+    def _client(service_name, **kwargs):
         if service_name == 'glue':
             return MockGlueClient()
         raise AssertionError(f"Unexpected service: {service_name}")
@@ -449,6 +496,81 @@ def test_wait_crawler_completion_not_found(monkeypatch):
     assert result['crawlers'][0]['last_status'] == 'UNKNOWN'
 
 
+def test_wait_crawler_completion_adaptive_interval(monkeypatch):
+    """短い間隔から倍にしていき、完了見込みがある間は残り時間の半分を超えて待機しないこと"""
+    import boto3
+    import updatecatalog as uc
+
+    sleeps = []
+    clock = [0.0]
+    monkeypatch.setattr(uc.time, 'time', lambda: clock[0])
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+    monkeypatch.setattr(uc.time, 'sleep', fake_sleep)
+
+    class GlueAdaptiveMock:
+        def get_crawler_metrics(self, CrawlerNameList):
+            return {'CrawlerMetricsList': [{'CrawlerName': 'long', 'MedianRuntimeSeconds': 20.0}]}
+        def batch_get_crawlers(self, CrawlerNames):
+            # long は 20 秒で完了、fresh（過去の実行なし）は 50 秒で完了
+            return {'Crawlers': [_crawler('long', 'READY' if clock[0] >= 20 else 'RUNNING', 'SUCCEEDED'),
+                                 _crawler('fresh', 'READY' if clock[0] >= 50 else 'RUNNING', 'SUCCEEDED')]}
+
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: GlueAdaptiveMock())
+    monkeypatch.setattr(uc, 'CRAWLER_POLL_MIN_INTERVAL', 5)
+    result = wait_crawler_completion(['long', 'fresh'], timeout_seconds=600, poll_interval=30)
+
+    # 5秒から開始 → 完了見込み(20秒)までの残りの半分 → 下限の5秒 → long 完了後は倍にした間隔(上限30秒)
+    assert sleeps == [5, 7.5, 5, 5, 30]
+    assert result['all_ready'] is True
+    assert [c['completed_seconds'] for c in result['crawlers']] == [22, 52]
+    assert result['crawlers'][0]['expected_seconds'] == 20
+    assert result['crawlers'][1]['expected_seconds'] is None
+
+
+def test_next_poll_interval_grows_with_expected_remaining_time():
+    """所要時間の長いクローラは最大間隔まで広げ、完了見込みが近づくと短くすること"""
+    import updatecatalog as uc
+    expected = {'long': 3600.0}
+    # 初回は短い間隔
+    assert uc.next_poll_interval(['long'], expected, 0, 5, 5, 300) == 5
+    # 残り時間が長い間は backoff に合わせて最大間隔まで広げる（30秒で頭打ちにしない）
+    assert uc.next_poll_interval(['long'], expected, 600, 160, 5, 300) == 160
+    assert uc.next_poll_interval(['long'], expected, 1200, 320, 5, 300) == 300
+    # 完了見込みが近づくと残り時間の半分まで短くする
+    assert uc.next_poll_interval(['long'], expected, 3400, 300, 5, 300) == 100
+    # 見込みを超過した場合は backoff
+    assert uc.next_poll_interval(['long'], expected, 4000, 80, 5, 300) == 80
+
+
+def test_wait_crawler_completion_default_max_interval(monkeypatch):
+    """poll_interval 未指定時は CRAWLER_POLL_MAX_INTERVAL を上限とすること"""
+    import boto3
+    import updatecatalog as uc
+
+    sleeps = []
+    clock = [0.0]
+    monkeypatch.setattr(uc.time, 'time', lambda: clock[0])
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+    monkeypatch.setattr(uc.time, 'sleep', fake_sleep)
+
+    class GlueMock:
+        def get_crawler_metrics(self, CrawlerNameList):
+            return {'CrawlerMetricsList': []}
+        def batch_get_crawlers(self, CrawlerNames):
+            return {'Crawlers': [_crawler('c1', 'READY' if clock[0] >= 1000 else 'RUNNING', 'SUCCEEDED')]}
+
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: GlueMock())
+    monkeypatch.setattr(uc, 'CRAWLER_POLL_MIN_INTERVAL', 5)
+    monkeypatch.setattr(uc, 'CRAWLER_POLL_MAX_INTERVAL', 120)
+    result = wait_crawler_completion(['c1'])
+    assert sleeps[:6] == [5, 10, 20, 40, 80, 120]
+    assert max(sleeps) == 120 and result['all_ready'] is True
+
+
 # specifiedday_diff_verify_and_runcrawler のテスト群
 def test_specifiedday_diff_verify_and_runcrawler_full_scan(monkeypatch):
     """差分ありの場合 full_scan=True が catalog_scan に渡されること"""
@@ -516,13 +638,458 @@ def test_prevdif_multi_tables_mixed(monkeypatch):
     monkeypatch.setattr('updatecatalog.tablecolumns_diff_verify', fake_diff)
 
     calls = []
-    def fake_catalog_scan(table, full_scan=False):
+    def fake_catalog_scan(table, full_scan=False, **kwargs):
         calls.append((table, full_scan))
         return {'crawler_name': f'crawler-{table}'}
     monkeypatch.setattr('updatecatalog.catalog_scan', fake_catalog_scan)
 
     result = prevday_diff_verify_and_runcrawler('t_added,t_same', 's3://bucket/group/conv/', '2025-01-21')
     assert set(result) == {'crawler-t_added', 'crawler-t_same'}
-    # 呼び出し順と full_scan フラグ確認
-    assert calls == [('t_added', True), ('t_same', False)]
+    # full_scan フラグ確認（テーブルは並行処理されるため呼び出し順は不定）
+    assert sorted(calls) == [('t_added', True), ('t_same', False)]
+
+
+def test_prevdif_tables_run_concurrently(monkeypatch):
+    """テーブルは max_workers 件まで並行して処理され、結果は tablelist の順で返ること"""
+    import threading
+    import time as _time
+    running = []
+    peak = []
+    lock = threading.Lock()
+    def fake_run(table, base_s3_path, base_day, target_day, **kwargs):
+        with lock:
+            running.append(table)
+            peak.append(len(running))
+        _time.sleep(0.05)
+        with lock:
+            running.remove(table)
+        return f'crawler-{table}'
+    monkeypatch.setattr('updatecatalog.diff_verify_and_runcrawler', fake_run)
+
+    tables = ','.join(f't{i}' for i in range(6))
+    result = prevday_diff_verify_and_runcrawler(tables, 's3://bucket/group/conv/', '2025-01-21', max_workers=3)
+    assert result == [f'crawler-t{i}' for i in range(6)]
+    assert max(peak) == 3
+
+
+def test_prevdif_failure_and_timeout_aggregated(monkeypatch):
+    """失敗・タイムアウトしたテーブルがあっても他のテーブルは処理され、
+    タイムアウトしたテーブルはクローラを起動せず、起動済みクローラの完了を待ってから例外となること"""
+    launched = []
+    def fake_run(table, base_s3_path, base_day, target_day, cancel_event=None, **kwargs):
+        if table == 't_fail':
+            raise ValueError('boom')
+        if table == 't_slow':
+            # タイムアウトで打ち切られるまで待機し、クローラは起動しない
+            assert cancel_event.wait(5)
+            raise RuntimeError('cancelled')
+        launched.append(table)
+        return f'crawler-{table}'
+    monkeypatch.setattr('updatecatalog.diff_verify_and_runcrawler', fake_run)
+    waited = []
+    monkeypatch.setattr('updatecatalog.wait_crawler_completion', lambda crawlers: waited.append(crawlers))
+
+    with pytest.raises(RuntimeError) as excinfo:
+        prevday_diff_verify_and_runcrawler('t_fail,t_slow,t_ok', 's3://bucket/group/conv/', '2025-01-21',
+                                           max_workers=3, table_timeout=0.5)
+    assert 't_fail' in str(excinfo.value) and "'t_slow': 'timeout'" in str(excinfo.value)
+    assert launched == ['t_ok']
+    assert waited == [['crawler-t_ok']]
+
+
+def test_prevdif_waits_crawler_started_after_timeout(monkeypatch):
+    """打ち切り前に起動したクローラは、タイムアウト扱いでも完了を待つ対象となること"""
+    import time as _time
+    def fake_run(table, base_s3_path, base_day, target_day, **kwargs):
+        _time.sleep(1.5)
+        return f'crawler-{table}'
+    monkeypatch.setattr('updatecatalog.diff_verify_and_runcrawler', fake_run)
+    waited = []
+    monkeypatch.setattr('updatecatalog.wait_crawler_completion', lambda crawlers: waited.append(crawlers))
+
+    with pytest.raises(RuntimeError):
+        prevday_diff_verify_and_runcrawler('t_slow', 's3://bucket/group/conv/', '2025-01-21', table_timeout=0.5)
+    assert waited == [['crawler-t_slow']]
+
+
+def test_prevdif_shares_clients_across_threads(monkeypatch):
+    """boto3 のクライアントは最初に1回だけ（タイムアウト設定付きで）作成し、各テーブルの処理で共有すること"""
+    import boto3
+    import updatecatalog as uc
+    created = []
+    configs = []
+    def _client(service_name, config=None):
+        created.append(service_name)
+        configs.append(config)
+        return object()
+    monkeypatch.setattr(boto3, 'client', _client)
+    used = set()
+    def fake_run(table, base_s3_path, base_day, target_day, s3_client=None, ssm=None, glue=None, **kwargs):
+        used.add((id(s3_client), id(ssm), id(glue)))
+        return f'crawler-{table}'
+    monkeypatch.setattr('updatecatalog.diff_verify_and_runcrawler', fake_run)
+
+    prevday_diff_verify_and_runcrawler('t1,t2,t3,t4', 's3://bucket/group/conv/', '2025-01-21', max_workers=4)
+    assert sorted(created) == ['glue', 's3', 'ssm']
+    assert len(used) == 1
+    # 応答のない S3 / Glue の呼び出しで打ち切りが止まらないよう、接続・読込タイムアウトを設定する
+    assert all(config.connect_timeout == uc.CATALOG_CONNECT_TIMEOUT and config.read_timeout == uc.CATALOG_READ_TIMEOUT
+               for config in configs)
+
+
+def test_start_crawler_retries_on_concurrency_limit(monkeypatch):
+    """同時実行数の上限到達・実行中の場合は起動を再試行すること"""
+    import boto3
+    import updatecatalog as uc
+    glue = boto3.client('glue')
+    errors = [glue.exceptions.ResourceNumberLimitExceededException('limit'),
+              glue.exceptions.CrawlerRunningException('running')]
+    started = []
+    def fake_start(Name):
+        if errors:
+            raise errors.pop(0)
+        started.append(Name)
+    glue.start_crawler = fake_start
+    sleeps = []
+    monkeypatch.setattr(uc.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(uc, 'CRAWLER_START_RETRY_INTERVAL', 7)
+
+    uc.start_crawler(glue, 'crawler-a')
+    assert started == ['crawler-a'] and sleeps == [7, 7]
+
+
+def test_start_crawler_cancelled_does_not_start(monkeypatch):
+    """打ち切り指示後はクローラを起動しないこと"""
+    import boto3
+    import threading
+    import updatecatalog as uc
+    glue = boto3.client('glue')
+    glue.start_crawler = lambda Name: pytest.fail('started')
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(RuntimeError):
+        uc.start_crawler(glue, 'crawler-a', cancel_event)
+
+
+
+# パーティション直接登録 (partreg) のテスト群
+class PartitionGlue:
+    """register_partitions 用の Glue / S3 モック (date= プレフィックスと登録済みパーティションを保持)"""
+    class exceptions:
+        class EntityNotFoundException(Exception):
+            pass
+
+    def __init__(self, days, registered, table_exists=True, fail_days=()):
+        self.days = days
+        self.registered = registered
+        self.table_exists = table_exists
+        self.fail_days = fail_days
+        self.batches = []
+
+    def get_crawler(self, Name):
+        return {'Crawler': {'Name': Name, 'DatabaseName': 'm365db', 'TablePrefix': 'g_'}}
+
+    def get_table(self, DatabaseName, Name):
+        if not self.table_exists:
+            raise self.exceptions.EntityNotFoundException(Name)
+        return {'Table': {'Name': Name, 'StorageDescriptor': {
+            'Columns': [{'Name': 'id', 'Type': 'bigint'}],
+            'Location': 's3://bucket/group/conv/table1/',
+            'SerdeInfo': {'SerializationLibrary': 'parquet'},
+        }}}
+
+    def get_partitions(self, DatabaseName, TableName, ExcludeColumnSchema=False, NextToken=None):
+        # 1件ずつページングして返す
+        index = int(NextToken or 0)
+        response = {'Partitions': [{'Values': [v]} for v in self.registered[index:index + 1]]}
+        if index + 1 < len(self.registered):
+            response['NextToken'] = str(index + 1)
+        return response
+
+    def batch_create_partition(self, DatabaseName, TableName, PartitionInputList):
+        self.batches.append(PartitionInputList)
+        errors = [{'PartitionValues': p['Values'],
+                   'ErrorDetail': {'ErrorCode': 'InternalServiceException', 'ErrorMessage': 'boom'}}
+                  for p in PartitionInputList if p['Values'][0] in self.fail_days]
+        return {'Errors': errors}
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter, ContinuationToken=None):
+        return {'CommonPrefixes': [{'Prefix': f"{Prefix}date={day}/"} for day in self.days]
+                + [{'Prefix': f"{Prefix}_tmp/"}]}
+
+
+def _patch_partition_clients(monkeypatch, glue):
+    import boto3
+
+    class DummySSM:
+        def get_parameter(self, Name, WithDecryption=False):
+            return {"Parameter": {"Value": f"crawler-{Name.rsplit('/', 1)[-1]}"}}
+
+    def _client(service_name, **kwargs):
+        if service_name == 'ssm':
+            return DummySSM()
+        return glue
+    monkeypatch.setattr(boto3, 'client', _client)
+
+
+def test_register_partitions_only_new(monkeypatch):
+    """未登録の date= プレフィックスのみ、テーブル定義の Location を差し替えて登録されること"""
+    glue = PartitionGlue(days=['20250119', '20250120', '20250121'], registered=['20250119', '20250120'])
+    _patch_partition_clients(monkeypatch, glue)
+    result = register_partitions('table1', 's3://bucket/group/conv/')
+    assert result == {'table': 'table1', 'registered': ['20250121'], 'failed': []}
+    [partition] = glue.batches[0]
+    assert partition['Values'] == ['20250121']
+    assert partition['StorageDescriptor']['Location'] == 's3://bucket/group/conv/table1/date=20250121/'
+    assert partition['StorageDescriptor']['Columns'] == [{'Name': 'id', 'Type': 'bigint'}]
+
+
+def test_register_partitions_batches_of_100(monkeypatch):
+    """batch_create_partition は100件ずつ呼び出され、失敗したパーティションが返ること"""
+    days = [f"2024{i:04d}" for i in range(250)]
+    glue = PartitionGlue(days=days, registered=[], fail_days=('20240010',))
+    _patch_partition_clients(monkeypatch, glue)
+    result = register_partitions('table1', 's3://bucket/group/conv/')
+    assert [len(batch) for batch in glue.batches] == [100, 100, 50]
+    assert len(result['registered']) == 249
+    assert result['failed'] == [{'value': '20240010', 'error': 'boom'}]
+
+
+def test_register_partitions_table_not_found(monkeypatch):
+    """カタログにテーブルがない場合は None (クローラ全走査へ)"""
+    glue = PartitionGlue(days=['20250121'], registered=[], table_exists=False)
+    _patch_partition_clients(monkeypatch, glue)
+    assert register_partitions('table1', 's3://bucket/group/conv/') is None
+    assert glue.batches == []
+
+
+def test_partreg_crawls_only_schema_changes(monkeypatch):
+    """差分ありのテーブルのみクローラ全走査、差分なしはパーティション直接登録となること"""
+    def fake_diff(*args, **kwargs):
+        return {'diff': args[0] == 't_added', 'newly_added_columns': [], 'removed_columns': [],
+                'base_columns': [], 'target_columns': []}
+    monkeypatch.setattr('updatecatalog.tablecolumns_diff_verify', fake_diff)
+    calls = []
+    def fake_catalog_scan(table, full_scan=False, **kwargs):
+        calls.append((table, full_scan))
+        return {'crawler_name': f'crawler-{table}'}
+    monkeypatch.setattr('updatecatalog.catalog_scan', fake_catalog_scan)
+    monkeypatch.setattr('updatecatalog.register_partitions',
+                        lambda table, base_s3_path, **kwargs: {'table': table, 'registered': ['20250121'], 'failed': []})
+
+    crawlers, registered = prevday_diff_verify_and_register_partitions(
+        't_added,t_same', 's3://bucket/group/conv/', '2025-01-21')
+    assert crawlers == ['crawler-t_added']
+    assert calls == [('t_added', True)]
+    assert registered == [{'table': 't_same', 'registered': ['20250121'], 'failed': []}]
+
+
+def test_partreg_crawls_type_only_change(monkeypatch):
+    """カラム名が同じでも型が変わった（指紋が異なる）テーブルはパーティション登録せずクローラ全走査となること"""
+    s3 = IndexS3({
+        "group/schemaindex/t_type/date=20250121.json": _index_entry("20250121", [["id", "string"], ["n", "double"]]),
+        "group/schemaindex/t_type/date=20250120.json": _index_entry("20250120", [["id", "string"], ["n", "int64"]]),
+        "group/schemaindex/t_same/date=20250121.json": _index_entry("20250121", [["id", "string"]]),
+        "group/schemaindex/t_same/date=20250120.json": _index_entry("20250120", [["id", "string"]]),
+    })
+    import boto3
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    calls = []
+    def fake_catalog_scan(table, full_scan=False, **kwargs):
+        calls.append((table, full_scan))
+        return {'crawler_name': f'crawler-{table}'}
+    monkeypatch.setattr('updatecatalog.catalog_scan', fake_catalog_scan)
+    registered_clients = set()
+    def fake_register(table, base_s3_path, s3_client=None, ssm=None, glue=None):
+        registered_clients.add((id(s3_client), id(ssm), id(glue)))
+        return {'table': table, 'registered': ['20250121'], 'failed': []}
+    monkeypatch.setattr('updatecatalog.register_partitions', fake_register)
+
+    crawlers, registered = prevday_diff_verify_and_register_partitions(
+        't_type,t_same', 's3://bucket/group/conv/', '2025-01-21')
+    assert crawlers == ['crawler-t_type']
+    assert calls == [('t_type', True)]
+    assert registered == [{'table': 't_same', 'registered': ['20250121'], 'failed': []}]
+    assert registered_clients == {(id(s3), id(s3), id(s3))}
+
+
+def test_tablecolumns_reports_changed_type_columns(monkeypatch):
+    """型のみの変更は差分ありとなり、両日に存在し型が異なるカラムが changed_type_columns として返ること"""
+    s3 = IndexS3({
+        "group/schemaindex/sample/date=20250121.json": _index_entry("20250121", [["id", "string"], ["n", "double"]]),
+        "group/schemaindex/sample/date=20250120.json": _index_entry("20250120", [["id", "string"], ["n", "int64"]]),
+    })
+    import boto3
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    result = tablecolumns_diff_verify('sample', 's3://bucket/group/conv/', '20250121', '20250120')
+    assert result['changed_type_columns'] == ['n']
+    assert result['base_fingerprint'] != result['target_fingerprint']
+    # カラム名が同じでも指紋が異なれば差分あり
+    assert result['diff'] is True
+
 
+def test_partreg_failure_waits_started_crawlers(monkeypatch):
+    """失敗したテーブルがある場合は、他のテーブルで起動したクローラの完了を待ってから例外となること"""
+    def fake_run(table, base_s3_path, base_day, target_day, **kwargs):
+        if table == 't_fail':
+            raise ValueError('boom')
+        return {'crawler_name': f'crawler-{table}'}
+    monkeypatch.setattr('updatecatalog.diff_verify_and_register_partitions', fake_run)
+    waited = []
+    monkeypatch.setattr('updatecatalog.wait_crawler_completion', lambda crawlers: waited.append(crawlers))
+
+    with pytest.raises(RuntimeError) as excinfo:
+        prevday_diff_verify_and_register_partitions('t_fail,t_ok', 's3://bucket/group/conv/', '2025-01-21')
+    assert 't_fail' in str(excinfo.value)
+    assert waited == [['crawler-t_ok']]
+
+
+def test_valid_partreg_failed_registration(monkeypatch):
+    """パーティション登録に失敗したテーブルがある場合は failed を返すこと"""
+    monkeypatch.setenv('GROUP', 'group1')
+    monkeypatch.setattr('updatecatalog.prevday_diff_verify_and_register_partitions',
+                        lambda *args: ([], [{'table': 'table1', 'registered': [],
+                                             'failed': [{'value': '20250121', 'error': 'boom'}]}]))
+    result = json.loads(updatecatalog({'exec_type': 'partreg', 'basedate': '2025-01-21'}, None))
+    assert result['status'] == 'failed'
+
+
+# スキーマ指紋の索引のテスト群
+class IndexS3:
+    """キーとバイト列で保持するS3モック（範囲取得・プレフィックス列挙に対応）"""
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.reads = []
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise Exception("NoSuchKey 404")
+        self.reads.append(Key)
+        if Range is not None:
+            return {"Body": _ranged_body(self.objects[Key], Range)}
+        return {"Body": type("B", (), {"read": lambda _, data=self.objects[Key]: data})()}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None, ContinuationToken=None):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        if Delimiter is None:
+            return {"Contents": [{"Key": k} for k in keys], "IsTruncated": False}
+        folders = sorted({Prefix + k[len(Prefix):].split(Delimiter)[0] + Delimiter
+                          for k in keys if Delimiter in k[len(Prefix):]})
+        return {"CommonPrefixes": [{"Prefix": f} for f in folders], "IsTruncated": False}
+
+
+def _index_entry(day, columns):
+    return json.dumps({"version": 1, "table": "sample", "date": day,
+                       "fingerprint": schema_fingerprint(columns), "columns": columns}).encode('utf-8')
+
+
+def test_schema_fingerprint_matches_converter():
+    """指紋は変換処理 (m365lib.schemaindex) と同一の算出方法であること（辞書エンコードは値の型）"""
+    import pyarrow as pa
+    columns = schema_columns(pa.schema([('id', pa.string()), ('base_date', pa.date32()),
+                                        ('n', pa.dictionary(pa.int32(), pa.string()))]))
+    assert columns == [['id', 'string'], ['base_date', 'date32[day]'], ['n', 'string']]
+    assert schema_fingerprint(columns) == '382feac49ae08be64ca16e1655c470fc49efbd16babb79766fdbe6c6aaf3c771'
+
+
+def _layer_module(name):
+    """同じ実装を持つレイヤーのモジュール (m365lib.<name>) を読み込む"""
+    import importlib
+    layer_dir = os.path.join(os.path.dirname(os.path.dirname(CURRENT_DIR)), 'layers_cbvpc_work', 'layers', 'PythonLayer')
+    sys.path.insert(0, layer_dir)
+    try:
+        return importlib.import_module(f'm365lib.{name}')
+    finally:
+        sys.path.remove(layer_dir)
+
+
+def test_schema_fingerprint_identical_to_layer():
+    """コンテナ側の指紋の算出が変換処理のレイヤー (m365lib.schemaindex) と同一であること"""
+    import pyarrow as pa
+    schemaindex = _layer_module('schemaindex')
+    schemas = [
+        pa.schema([('id', pa.string())]),
+        pa.schema([('id', pa.string()), ('base_date', pa.date32()), ('n', pa.dictionary(pa.int32(), pa.string()))]),
+        pa.schema([('ts', pa.timestamp('us', tz='Asia/Tokyo')), ('score', pa.float64()),
+                   ('tags', pa.list_(pa.string())), ('flag', pa.bool_()), ('cnt', pa.int64())]),
+        pa.schema([('cnt', pa.int64()), ('id', pa.string())]),
+    ]
+    for schema in schemas:
+        assert schema_columns(schema) == schemaindex.schema_columns(schema)
+        assert schema_fingerprint(schema_columns(schema)) == schemaindex.schema_fingerprint(schemaindex.schema_columns(schema))
+
+
+def test_footer_schema_identical_to_layer(monkeypatch):
+    """コンテナ側のフッター読込がレイヤー (m365lib.parquetio.read_parquet_schema) と同一のスキーマを返すこと
+    （フッターが1回目の取得に収まらない場合の再取得を含む）"""
+    import pyarrow as pa
+    import updatecatalog as uc
+    parquetio = _layer_module('parquetio')
+    data = _parquet_bytes({'id': ['a'], 'n': [1], 'ts': pa.array([0], pa.timestamp('us', tz='Asia/Tokyo')),
+                           'tags': [['x']], 'code': pa.array(['c']).dictionary_encode()})
+    s3 = IndexS3({'conv/sample/date=20250121/sample.parquet': data})
+    for read_size in (64 * 1024, 16):
+        monkeypatch.setattr(uc, 'FOOTER_READ_SIZE', read_size)
+        monkeypatch.setattr(parquetio, 'FOOTER_READ_SIZE', read_size)
+        container_schema = uc.read_parquet_footer_schema(s3, 'bucket', 'conv/sample/date=20250121/sample.parquet')
+        layer_schema = parquetio.read_parquet_schema(s3, 'bucket', 'conv/sample/date=20250121/sample.parquet')
+        assert container_schema.equals(layer_schema, check_metadata=False)
+        assert schema_columns(container_schema) == _layer_module('schemaindex').schema_columns(layer_schema)
+
+
+def test_tablecolumns_uses_schema_index(monkeypatch):
+    """両日の指紋が記録済みの場合は Parquet を読まずに比較すること"""
+    import boto3
+    s3 = IndexS3({
+        "group1/schemaindex/sample/date=20250121.json": _index_entry("20250121", [["id", "string"], ["x", "int64"]]),
+        "group1/schemaindex/sample/date=20250120.json": _index_entry("20250120", [["id", "string"]]),
+    })
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    result = tablecolumns_diff_verify("sample", "s3://m365-dwh/group1/convert/", "20250121", "20250120")
+    assert result['diff'] is True
+    assert result['newly_added_columns'] == ["x"]
+    assert not any(k.endswith('.parquet') for k in s3.reads)
+
+
+def test_tablecolumns_records_missing_schema_index(monkeypatch):
+    """指紋が未記録の日は Parquet フッターから読み込み、索引に記録すること"""
+    import boto3
+    s3 = IndexS3({
+        "group1/convert/sample/date=20250121/sample.parquet": _parquet_bytes({"id": ["a"]}),
+        "group1/convert/sample/date=20250120/sample.parquet": _parquet_bytes({"id": ["b"]}),
+    })
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    first = tablecolumns_diff_verify("sample", "s3://m365-dwh/group1/convert/", "20250121", "20250120")
+    assert first['diff'] is False
+    assert first['base_fingerprint'] == first['target_fingerprint']
+    assert json.loads(s3.objects["group1/schemaindex/sample/date=20250121.json"])['columns'] == [["id", "string"]]
+
+    s3.reads = []
+    second = tablecolumns_diff_verify("sample", "s3://m365-dwh/group1/convert/", "20250121", "20250120")
+    assert second['base_fingerprint'] == first['base_fingerprint']
+    assert not any(k.endswith('.parquet') for k in s3.reads)
+
+
+def test_column_first_seen_with_backfill(monkeypatch):
+    """履歴に日ごとの指紋と未記録日の Parquet を取り込み、カラムの初出日を返すこと"""
+    import boto3
+    s3 = IndexS3({
+        "group1/schemaindex/sample/date=20250119.json": _index_entry("20250119", [["id", "string"]]),
+        "group1/convert/sample/date=20250119/sample.parquet": _parquet_bytes({"id": ["a"]}),
+        "group1/convert/sample/date=20250120/sample.parquet": _parquet_bytes({"id": ["a"], "x": [1]}),
+        "group1/convert/sample/date=20250121/sample-00001.parquet": _parquet_bytes({"id": ["a"], "x": ["1"]}),
+    })
+    monkeypatch.setattr(boto3, 'client', lambda service_name, **kwargs: s3)
+    history = column_first_seen("sample", "s3://m365-dwh/group1/convert/")
+    assert history["id"] == {"first_seen": "20250119", "last_seen": "20250121", "types": ["string"]}
+    assert history["x"] == {"first_seen": "20250120", "last_seen": "20250121", "types": ["int64", "string"]}
+    stored = json.loads(s3.objects["group1/schemaindex/sample/history.json"])
+    assert sorted(stored['days']) == ["20250119", "20250120", "20250121"]
+
+    # 2回目は集約済みの履歴のみで回答する（Parquet を読まない）
+    s3.reads = []
+    assert column_first_seen("sample", "s3://m365-dwh/group1/convert/") == history
+    assert not any(k.endswith('.parquet') for k in s3.reads)
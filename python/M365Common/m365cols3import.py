@@ -1,8 +1,12 @@
 # S3のcollectディレクトリ（生データ取得用）からJSONファイルを取得し、DataFrameに変換する関数
+# return_mode=reference の場合は、レコード本体は返却せずS3参照（キー・ETag）とスキーマ・件数のみ返却する
+# （呼び出し側はS3から直接Arrowへ読み込むため、レスポンス上限とJSON二重変換を回避できる）
 import boto3
 import pandas as pd
 from io import StringIO
 import json
+from m365lib.runcontext import resolve_run_context
+from m365lib.collectio import read_collect_object, build_collect_reference
 
 def m365cols3import(event, context):
 
@@ -11,33 +15,41 @@ def m365cols3import(event, context):
     group = event.get('group')
     targetdataname = event.get('targetdataname')
     filename = event.get('filename')
+    # 返却モード（inline：レコードを返却（既定）, reference：S3参照のみ返却）
+    return_mode = event.get('return_mode', 'inline')
 
     ## 基準日(yyyy-mm-dd)をS3から取得。またはリカバリ用に関数入力パラメータから基準日(yyyy-mm-dd)を取得。
     s3_client = boto3.client('s3')
     print(f"[Debug]-[m365colimport]-bucket_name:{bucket_name}, collect_key:{collect_key}, group:{group}, targetdataname:{targetdataname}, filename:{filename}")
     print(f"[Debug]-[m365colimport]-event:{event.get('basedate')}")
     try:
-        # 通常処理の場合、S3から基準日を取得
-        if event.get('basedate') == 'na':
-            csv_file = s3_client.get_object(
-                Bucket=bucket_name,
-                Key="basedatetime/basedatetime.csv"
-            )
-            csv_file_body = csv_file['Body'].read().decode('utf-8')
-            df = pd.read_csv(StringIO(csv_file_body), usecols=['base'])
-            base_date = df['base'].iloc[0]
-        # リカバリ用基準日が指定されている場合、その日付を使用
-        else:
-            base_date = event.get('basedate')
+        # 通常処理の場合、S3から基準日を取得（ウォームスタート時はキャッシュを使用）
+        # リカバリ用基準日、または実行コンテキストで基準日が指定されている場合、その日付を使用
+        base_date = resolve_run_context(event, s3_client, bucket_name)['basedate']
     except Exception as e:
         print(f"[func-error]-[m365colimport]-[reading-error] \
             basedatetime.csv: {e}")
         return json.dumps({ "status": "failed" })
 
+    dtstr = base_date.replace("-", "")
+    targetkey = f"{group}/{collect_key}{targetdataname}/date={dtstr}/"
+
+    # 参照渡しモードの場合、S3参照とスキーマ・件数のみ返却
+    if return_mode == 'reference':
+        try:
+            collect = read_collect_object(s3_client, bucket_name, targetkey + filename)
+        except s3_client.exceptions.NoSuchKey as e:
+            print(f"[func-error]-[m365colimport]-NoSuchKey: {targetkey + filename}")
+            return json.dumps({ "status": "failed"})
+        except Exception as e:
+            print(f"[func-error]-[m365colimport]-reading JSON: {targetkey + filename} : {e}")
+            return json.dumps({ "status": "failed"})
+        reference = build_collect_reference(bucket_name, collect)
+        reference['status'] = "success"
+        return reference
+
     # 各収集データの取得
     try:
-        dtstr = base_date.replace("-", "")
-        targetkey = f"{group}/{collect_key}{targetdataname}/date={dtstr}/"
         json_file = s3_client.get_object(
             Bucket=bucket_name,
             Key=targetkey + filename
@@ -1,8 +1,38 @@
 # S3のcollectディレクトリ（生データ取得用）にあるJSONファイルのリストを取得する関数
-# S3キーは削除し、ファイル名のみを配列に格納
+# 各ファイルのキー・ファイル名・サイズ・ETag・最終更新日時をマニフェストとしてS3に出力し、そのキーを返却する
+# （変換側でファイル名だけでなくバイトサイズを元に処理を計画できるようにするため）
+# マニフェストはファイル数に比例して大きくなり、レスポンスに含めるとLambda/Step Functionsの
+# ペイロード上限（256KB）を超えるため、収集データ（m365cols3import）と同様に参照渡しとする
 import boto3
-import pandas as pd
-from io import StringIO
+from m365lib.runcontext import resolve_run_context
+from m365lib.collectio import build_manifest_key, write_collect_manifest
+
+# list_objects_v2 の1ページあたりの最大取得件数（S3の上限は1000）
+LIST_PAGE_SIZE = 1000
+
+
+# 指定プレフィックス配下のオブジェクトをページングしながら1件ずつ返す
+# 1000件を超える場合も list_objects_v2 のページネータで全件を走査する
+def _iter_collect_objects(s3_client, bucket_name: str, prefix: str,
+                          page_size: int = LIST_PAGE_SIZE):
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket_name,
+                               Prefix=prefix,
+                               PaginationConfig={'PageSize': page_size})
+    for page in pages:
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            # ディレクトリマーカー（末尾スラッシュ）は対象外
+            if key.endswith('/'):
+                continue
+            last_modified = obj.get('LastModified')
+            yield {
+                'key': key,
+                'filename': key.split('/')[-1],
+                'size': obj.get('Size', 0),
+                'etag': (obj.get('ETag') or '').strip('"'),
+                'last_modified': last_modified.isoformat() if last_modified else None,
+            }
 
 
 def m365cols3list(event, context):
@@ -15,18 +45,9 @@ def m365cols3list(event, context):
     ## 基準日(yyyy-mm-dd)をS3から取得。またはリカバリ用に関数入力パラメータから基準日(yyyy-mm-dd)を取得。
     s3_client = boto3.client('s3')
     try:
-        # 通常処理の場合、S3から基準日を取得
-        if event.get('basedate') == 'na':
-            csv_file = s3_client.get_object(
-                Bucket=bucket_name,
-                Key="basedatetime/basedatetime.csv"
-            )
-            csv_file_body = csv_file['Body'].read().decode('utf-8')
-            df = pd.read_csv(StringIO(csv_file_body), usecols=['base'])
-            base_date = df['base'].iloc[0]
-        # リカバリ用基準日が指定されている場合、その日付を使用
-        else:
-            base_date = event.get('basedate')
+        # 通常処理の場合、S3から基準日を取得（ウォームスタート時はキャッシュを使用）
+        # リカバリ用基準日、または実行コンテキストで基準日が指定されている場合、その日付を使用
+        base_date = resolve_run_context(event, s3_client, bucket_name)['basedate']
     except Exception as e:
         print(f"[func-error]-[m365cols3list]-[reading-error] \
             basedatetime.csv: {e}")
@@ -35,24 +56,40 @@ def m365cols3list(event, context):
             "message": f"m365cols3list Error : {str(e)}"
         }
 
-    keys = []
-    files = []
+    manifest = []
+    total_size = 0
     try:
         dtstr = base_date.replace("-", "")
         targetkey = f"{group}/{collect_key}{targetdataname}/date={dtstr}/"
-        # 返却リストは1000件まで
-        keys = s3_client.list_objects(Bucket=bucket_name, Prefix=targetkey)
-        for key in keys.get('Contents', []):
-            # ファイル名を抽出してリストに追加
-            files.append(key['Key'].split('/')[-1])
+        # ページングしながら逐次マニフェストへ追加（1000件超も取りこぼさない）
+        for obj in _iter_collect_objects(s3_client, bucket_name, targetkey):
+            manifest.append(obj)
+            total_size += obj['size']
 
     except Exception as e:
         print(f"[func-error]-[m365cols3list]-[reading-error] \
-            s3_client.list_objects: {e}")
+            s3_client.list_objects_v2: {e}")
+        return {
+            "statusCode": 500,
+            "message": f"m365cols3list Error : {str(e)}"
+        }
+
+    try:
+        reference = write_collect_manifest(s3_client, bucket_name,
+                                           build_manifest_key(group, targetdataname, base_date), manifest)
+    except Exception as e:
+        print(f"[func-error]-[m365cols3list]-[writing-error] \
+            s3_client.put_object: {e}")
         return {
             "statusCode": 500,
             "message": f"m365cols3list Error : {str(e)}"
         }
 
-    return { "statusCode": 200, "files": files }
+    print(f"[Info]-[m365cols3list] prefix={targetkey} files={len(manifest)} total_size={total_size} "
+          f"manifest_key={reference['manifest_key']}")
 
+    return {"statusCode": 200,
+            "manifest_key": reference['manifest_key'],
+            "manifest_etag": reference['manifest_etag'],
+            "file_count": len(manifest),
+            "total_size": total_size}
@@ -0,0 +1,32 @@
+# パイプライン実行単位の基準日コンテキスト（base/from/to）を解決するLambda関数
+# Step Functionsのグループ実行開始時に1回だけ呼び出し、
+# 戻り値の basedate/fromtimestamp/totimestamp を後続ステートのイベントへ明示的に引き渡す。
+# （各Lambdaが個別に basedatetime.csv を読み込む必要がなくなる）
+# リカバリ用に basedate（yyyy-mm-dd形式）が指定された場合はその日付を使用する
+# 解決できない場合は例外を送出し、Step Functions の Retry/Catch に処理を委ねる
+# （status=failed を返すと後続の ResultSelector が $.Payload.basedate を参照できないため）
+import boto3
+import re
+from m365lib.runcontext import resolve_run_context
+
+
+def m365runcontext(event, context):
+    # リカバリ用基準日の形式チェック（未使用：na or 未指定, リカバリ用：yyyy-mm-dd形式）
+    basedate = event.get('basedate')
+    if basedate not in (None, 'na') and not re.match(r'^\d{4}-\d{2}-\d{2}$', basedate):
+        print(f"[Func-ERROR]-[m365runcontext]-[InvalidInput] "
+              f"basedate: {basedate} basedateの形式が不正です。'yyyy-mm-dd'の形式で指定してください。")
+        raise ValueError(f"basedateの形式が不正です: {basedate}")
+
+    try:
+        ssm = boto3.client('ssm')
+        bucket_name = ssm.get_parameter(Name='/m365/common/s3bucket',
+                                        WithDecryption=False)['Parameter']['Value']
+        run_context = resolve_run_context(event, boto3.client('s3'), bucket_name)
+    except Exception as e:
+        print(f"[Func-ERROR]-[m365runcontext]-[reading-error] basedatetime.csv: {e}")
+        raise
+
+    print(f"[Info]-[m365runcontext] run_context={run_context}")
+    run_context['status'] = "success"
+    return run_context
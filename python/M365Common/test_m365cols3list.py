@@ -0,0 +1,78 @@
+import os
+import sys
+import datetime
+import json
+
+# レイヤーの共通ライブラリ（m365lib）をパスに追加
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'layers_cbvpc_work', 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+import m365cols3list  # noqa: E402
+
+
+def _page(start, count, prefix="group1/collect/m365getuser/date=20250725/"):
+    modified = datetime.datetime(2025, 7, 26, 1, 0, 0, tzinfo=datetime.timezone.utc)
+    return {
+        'Contents': [
+            {
+                'Key': f"{prefix}{i}_m365getuser.json",
+                'Size': 100 + i,
+                'ETag': f'"etag{i}"',
+                'LastModified': modified,
+            }
+            for i in range(start, start + count)
+        ]
+    }
+
+
+def test_paginated_listing_over_1000(mocker):
+    paginator_mock = mocker.Mock()
+    paginator_mock.paginate.return_value = [_page(0, 1000), _page(1000, 500)]
+    s3_mock = mocker.Mock()
+    s3_mock.get_paginator.return_value = paginator_mock
+    s3_mock.put_object.return_value = {'ETag': '"manifest-etag"'}
+    mocker.patch('boto3.client', return_value=s3_mock)
+
+    result = m365cols3list.m365cols3list({
+        'bucket_name': 'test-bucket',
+        'collect_key': 'collect/',
+        'group': 'group1',
+        'targetdataname': 'm365getuser',
+        'basedate': '2025-07-25',
+    }, {})
+
+    assert result['statusCode'] == 200
+    # マニフェストはS3に出力し、レスポンスにはキーのみを含める（ペイロード上限対策）
+    assert result['manifest_key'] == 'group1/collectmanifest/m365getuser/date=20250725.json'
+    assert result['manifest_etag'] == 'manifest-etag'
+    assert result['file_count'] == 1500
+    assert 'manifest' not in result and 'files' not in result
+    assert result['total_size'] == sum(100 + i for i in range(1500))
+    s3_mock.get_paginator.assert_called_once_with('list_objects_v2')
+
+    put = s3_mock.put_object.call_args.kwargs
+    assert put['Key'] == result['manifest_key']
+    manifest = json.loads(put['Body'].decode('utf-8'))
+    assert len(manifest) == 1500
+    assert manifest[1499]['filename'] == '1499_m365getuser.json'
+    assert manifest[0]['etag'] == 'etag0'
+    assert manifest[0]['size'] == 100
+    assert manifest[0]['last_modified'] == '2025-07-26T01:00:00+00:00'
+
+
+def test_listing_error(mocker):
+    s3_mock = mocker.Mock()
+    s3_mock.get_paginator.side_effect = Exception("S3 list error")
+    mocker.patch('boto3.client', return_value=s3_mock)
+
+    result = m365cols3list.m365cols3list({
+        'bucket_name': 'test-bucket',
+        'collect_key': 'collect/',
+        'group': 'group1',
+        'targetdataname': 'm365getuser',
+        'basedate': '2025-07-25',
+    }, {})
+
+    assert result['statusCode'] == 500
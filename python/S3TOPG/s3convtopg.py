@@ -1,8 +1,32 @@
 # S3のconvertディレクトリ配下のデータをPostgresにインサートするLambda関数
-import psycopg
-import pandas as pd
+import datetime
+import os
+import time
 import boto3
-from io import BytesIO, StringIO
+from concurrent.futures import ThreadPoolExecutor
+from m365lib.runcontext import resolve_run_context
+from m365lib.parquetio import list_parquet_keys
+from m365lib.pgpool import get_pool
+from m365lib.pgcopy import (COLUMNS_QUERY, ParquetPrefetcher, build_column_mapping, cache_columns, copy_batches,
+                            get_cached_columns, invalidate_columns, open_parquet_source)
+from m365lib.pgmerge import (PRIMARY_KEY_QUERY, TEMP_SCHEMA, create_staging, create_temp_staging, merge_staging,
+                             publish_staging)
+from m365lib.pgsplit import drop_split_target, plan_split_copy, split_copy
+from m365lib.pgpostload import ANALYZE_AFTER_LOAD, DEFER_INDEXES, analyze_table, build_partition_indexes
+from m365lib.pgpartition import (ATTACHED_PARTITIONS_QUERY, RELKIND_QUERY, apply_retention, attach_partition,
+                                 create_partition, ensure_ledger, ledger_query, partition_name, record_load)
+
+# テーブル単位の並列取り込み数（接続プールの最大接続数を上限とする）
+LOAD_WORKERS = int(os.getenv('PG_LOAD_WORKERS', '4'))
+
+# 取り込みモード（イベントの loadmode で上書き可能）
+# - skip : 基準日データが1件でも存在するテーブルはスキップ（従来動作）
+# - merge: ステージングテーブル経由で基準日データを差分反映（再実行可能）
+LOAD_MODES = ("skip", "merge")
+LOAD_MODE = os.getenv('PG_LOAD_MODE', 'skip')
+
+# 期間指定（イベントの fromdate / todate）で1回に取り込む最大日数
+BACKFILL_MAX_DAYS = int(os.getenv('PG_BACKFILL_MAX_DAYS', '31'))
 
 # groupx/convet/直下のテーブル名のみを抽出し配列化
 def s3_target_list(bucket, tier1and2prefix):
@@ -18,103 +42,390 @@ def s3_target_list(bucket, tier1and2prefix):
 
     return tables
 
-# groupx/convert/table名/直下の基準日指定の各データを取得
-# 戻りはDataframe型
-def getconvdata(bucket_name, tier1and2_prefix, table, base_date):
-    s3_client = boto3.client('s3')
-    targetkey = tier1and2_prefix + table + "/" + "year=" \
-                + base_date[:4] + "/month=" + base_date[5:7]  \
-                + "/day=" + base_date[8:10] + "/"
+# groupx/convert/table名/date=yyyymmdd/直下の基準日指定のParquetファイルのキーを取得
+# 出力サイズにより複数ファイル（<table>.parquet, <table>-00001.parquet ...）に分割されている場合は全て対象
+def getconvkeys(s3_client, bucket_name, tier1and2_prefix, table, base_date):
+    targetkey = tier1and2_prefix + table + "/" + "date=" + base_date.replace("-", "") + "/"
     try:
-        parquet_file = s3_client.get_object(
-            Bucket=bucket_name,
-            Key=targetkey + table + ".parquet"
-        )
-        parquet_file_body = parquet_file['Body'].read().decode('utf-8')
-        df = pd.read_parquet(BytesIO(parquet_file_body), engine='pyarrow')
+        keys = list_parquet_keys(s3_client, bucket_name, targetkey)
+        if not keys:
+            raise FileNotFoundError(f"s3://{bucket_name}/{targetkey} にParquetファイルがありません。")
     except Exception as e:
-            print(f"[func-error]-[s3convtopg]-[getconvdata]-[reading-error] \
+            print(f"[func-error]-[s3convtopg]-[getconvkeys]-[reading-error] \
                {table}.parquet: {e}")
             return {
                     "statusCode": 500,
-                    "message": f"s3convtopg-getconvdata-{table}.parquet Error: {str(e)}"
+                    "message": f"s3convtopg-getconvkeys-{table}.parquet Error: {str(e)}"
             }
 
     return {
         "statusCode": 200,
-        "df": df
+        "keys": keys
     }
 
 
-# 基準日データ有無確認→存在していたら重複データのためTrue、存在してなければFalseで返却
-def check_target_duplicate(table,
-                           basedate,
-                           pguser,
-                           pgpasswd,
-                           pghost,
-                           dbname,
-                           schema):
-    conn = None
-    try:
-        conn = psycopg.connect(
-            user=pguser,
-            password=pgpasswd,
-            host=pghost,
-            dbname=dbname,
-            port='5432'
-        )
+# テーブルのメタデータ取得（パイプラインモードで送信し、往復を1回にまとめる）
+# - テーブルの種類（パーティションテーブルか）と基準日パーティションの有無（アタッチ済みのもの）
+# - 取り込み台帳の記録（取り込み済みか、主キーによる索引検索）
+# - テーブルの列定義（列名・型、列の対応付けとバイナリCOPYの型指定に使用、取得後はキャッシュ）
+# - 主キー列（マージモードのみ、差分反映の突き合わせに使用）
+# パーティション化されていないテーブルは台帳導入前のデータがあるため、従来通り基準日データ件数を数える
+# 基準日は複数指定でき（期間指定の取り込み）、パーティション・台帳・件数はそれぞれ1回の検索で全日分を確認する
+# 戻りの days は基準日ごとの partition_exists, loaded, count
+def fetch_table_metadata(conn, table, basedates, schema, primary_key=False):
+    days = [datetime.date.fromisoformat(basedate) for basedate in basedates]
+    columns = get_cached_columns(conn, schema, table)
+    with conn.pipeline():
+        with conn.cursor() as kind_cur, conn.cursor() as partition_cur, conn.cursor() as ledger_cur, \
+                conn.cursor() as columns_cur, conn.cursor() as key_cur:
+            kind_cur.execute(RELKIND_QUERY, (schema, table))
+            partition_cur.execute(ATTACHED_PARTITIONS_QUERY,
+                                  (schema, table, [partition_name(table, basedate) for basedate in basedates]))
+            ledger_cur.execute(ledger_query(schema), (table, days))
+            if columns is None:
+                columns_cur.execute(COLUMNS_QUERY, (schema, table))
+            if primary_key:
+                key_cur.execute(PRIMARY_KEY_QUERY, (f"{schema}.{table}",))
+    kind = kind_cur.fetchone()
+    if kind is None:
+        raise ValueError(f"テーブルが存在しません。table: {schema}.{table}")
+    partitioned = kind[0] == 'p'
+    partitions = {row[0] for row in partition_cur.fetchall()} if partitioned else set()
+    ledger = {row[0].isoformat(): row[1] for row in ledger_cur.fetchall()}
+    if columns is None:
+        columns = [tuple(row) for row in columns_cur.fetchall()]
+        cache_columns(conn, schema, table, columns)
+    metadata = {"partitioned": partitioned,
+                "columns": columns}
+    if primary_key:
+        metadata["primary_key"] = [row[0] for row in key_cur.fetchall()]
+    if not partitioned:
         with conn.cursor() as cur:
-            query = f"SELECT COUNT(base_date) FROM {schema}.{table} WHERE base_date = %s"
-            cur.execute(query, (basedate,))
-            count = cur.fetchone()[0]
+            cur.execute(f"SELECT base_date, COUNT(*) FROM {schema}.{table} WHERE base_date = ANY(%s) "
+                        "GROUP BY base_date", (days,))
+            counts = {row[0].isoformat(): row[1] for row in cur.fetchall()}
+    metadata["days"] = {}
+    for basedate in basedates:
+        partition_exists = partition_name(table, basedate) in partitions
+        if partitioned:
+            count = ledger.get(basedate, 0)
+            loaded = basedate in ledger or partition_exists
+        else:
+            count = counts.get(basedate, 0)
+            loaded = count > 0
+        metadata["days"][basedate] = {"partition_exists": partition_exists, "loaded": loaded, "count": count}
         print(basedate + ":" + table + ":count:" + str(count))
+    return metadata
+
+
+# 基準日データ有無確認→基準日ごとに、存在していたら重複データのため loaded=True、存在してなければFalseで返却
+def check_target_duplicate(conn,
+                           table,
+                           basedates,
+                           schema,
+                           primary_key=False):
+    try:
+        metadata = fetch_table_metadata(conn, table, basedates, schema, primary_key)
     except Exception as e:
         print(f"[func-error]-[s3convtopg]-[check_target_duplicate]-[pg_error] {e}")
         return { "statusCode": 500, "message": str(e) }
-    finally:
-        if conn:
-           conn.close()
 
-    return { "statusCode": 200, "count": count }
+    return { "statusCode": 200, **metadata }
 
 
-def insert_targetdata(table,
-                      pguser,
-                      pgpasswd,
-                      pghost,
-                      dbname,
+# S3のParquetをレコードバッチ単位で読み込み、バイナリCOPYでインサート
+# pool を指定し、データ量が分割の下限以上の場合は分割COPY（PG_COPY_SPLITS）とする
+# 複数の接続からステージングテーブルへ並列に COPY し、1トランザクションで対象テーブルに追加する
+def insert_targetdata(conn,
+                      table,
                       schema,
-                      df):
-    conn = None
+                      columns,
+                      base_date,
+                      s3_client,
+                      bucket_name,
+                      keys,
+                      prefetcher=None,
+                      pool=None):
+    staging = None
     try:
-        conn = psycopg.connect(
-            user=pguser,
-            password=pgpasswd,
-            host=pghost,
-            dbname=dbname,
-            port='5432'
-        )
-        cur = conn.cursor()
-        # DataFrameをCSV形式に変換（ヘッダーなし）
-        buffer = StringIO()
-        df.to_csv(buffer, header=False, index=False)
-        buffer.seek(0)
-        # テーブル名は文字列結合で注意
-        sql = f"COPY {schema}.{table} FROM STDIN WITH CSV"
-        with cur.copy(sql) as copy:
-            copy.write(buffer.getvalue())
+        plan = plan_split_copy(s3_client, bucket_name, keys) if pool is not None else None
+        if plan is None:
+            mapping, batches = open_parquet_source(s3_client, bucket_name, keys, columns, prefetcher=prefetcher)
+            rows = copy_batches(conn, schema, table, mapping, batches)
+        else:
+            mapping = build_column_mapping(plan["names"], columns)
+            # 他の接続から COPY できるよう、ステージングの作成をコミットしておく
+            staging = create_staging(conn, schema, table)
+            conn.commit()
+            rows = split_copy(conn, pool, s3_client, bucket_name, plan, mapping, schema, staging)
+            publish_staging(conn, schema, table, staging, [(target, udt_name) for _, target, udt_name in mapping])
+        record_load(conn, schema, table, base_date, rows, "insert")
         conn.commit()
-        print(f"[Info] Insert to {schema}.{table} success. Rows: {len(df)}")
+        print(f"[Info] Insert to {schema}.{table} success. Rows: {rows}")
     except Exception as e:
         print(f"[func-error]-[s3convtopg]-[insert_targetdata]-[pg_error] {e}")
-        if conn:
-            conn.rollback()
+        conn.rollback()
+        if staging is not None:
+            drop_split_target(conn, schema, staging)
         return { "statusCode": 500, "message": str(e) }
-    finally:
-        if conn:
-            conn.close()
 
-    return { "statusCode": 200, "message": "Insert success" }
+    return { "statusCode": 200, "message": "Insert success", "method": "insert", "rows": rows }
+
+
+# S3のParquetを基準日の新しいパーティション用テーブルにバイナリCOPYし、アタッチする
+# テーブル作成・COPY・索引作成・アタッチ・台帳記録を1トランザクションで行う
+# 索引は COPY 後にまとめて作成する（PG_DEFER_INDEXES、未使用時はアタッチ時に作成される）
+# 分割COPYの場合はパーティション用テーブルの作成をコミットして複数の接続から並列に COPY し、
+# 索引作成・アタッチ・台帳記録を1トランザクションで行う（アタッチまでは対象テーブルから参照されない）
+def attach_targetdata(conn,
+                      table,
+                      schema,
+                      columns,
+                      base_date,
+                      s3_client,
+                      bucket_name,
+                      keys,
+                      prefetcher=None,
+                      pool=None):
+    plan = None
+    partition = None
+    try:
+        plan = plan_split_copy(s3_client, bucket_name, keys) if pool is not None else None
+        partition = create_partition(conn, schema, table, base_date)
+        if plan is None:
+            mapping, batches = open_parquet_source(s3_client, bucket_name, keys, columns, prefetcher=prefetcher)
+            rows = copy_batches(conn, schema, partition, mapping, batches)
+        else:
+            mapping = build_column_mapping(plan["names"], columns)
+            conn.commit()
+            rows = split_copy(conn, pool, s3_client, bucket_name, plan, mapping, schema, partition)
+        if DEFER_INDEXES:
+            indexes = build_partition_indexes(conn, schema, table, partition)
+            print(f"[Info]-[s3convtopg]-[attach_targetdata] {schema}.{partition} 索引作成: {indexes}")
+        attach_partition(conn, schema, table, partition, base_date)
+        record_load(conn, schema, table, base_date, rows, "attach")
+        conn.commit()
+        print(f"[Info] Attach {schema}.{partition} to {schema}.{table} success. Rows: {rows}")
+    except Exception as e:
+        print(f"[func-error]-[s3convtopg]-[attach_targetdata]-[pg_error] {e}")
+        conn.rollback()
+        if plan is not None and partition is not None:
+            drop_split_target(conn, schema, partition)
+        return { "statusCode": 500, "message": str(e) }
+
+    return { "statusCode": 200, "message": "Attach success", "method": "attach", "rows": rows }
+
+
+# S3のParquetをステージングテーブルにバイナリCOPYし、対象テーブルの基準日データに差分反映
+# ステージング（一時テーブル、コミット時に削除）作成・COPY・反映・台帳記録を1トランザクションで行う
+def merge_targetdata(conn,
+                     table,
+                     schema,
+                     columns,
+                     primary_key,
+                     base_date,
+                     s3_client,
+                     bucket_name,
+                     keys,
+                     prefetcher=None):
+    try:
+        staging = create_temp_staging(conn, schema, table)
+        mapping, batches = open_parquet_source(s3_client, bucket_name, keys, columns, prefetcher=prefetcher)
+        rows = copy_batches(conn, TEMP_SCHEMA, staging, mapping, batches)
+        # データにない列（既定値）は突き合わせ・反映の対象外とする
+        counts = merge_staging(conn, schema, table, staging,
+                               [(target, udt_name) for _, target, udt_name in mapping], primary_key, base_date)
+        record_load(conn, schema, table, base_date, rows, "merge")
+        conn.commit()
+        print(f"[Info] Merge to {schema}.{table} success. Rows: {rows} "
+              f"inserted: {counts['inserted']} updated: {counts['updated']} deleted: {counts['deleted']}")
+    except Exception as e:
+        print(f"[func-error]-[s3convtopg]-[merge_targetdata]-[pg_error] {e}")
+        conn.rollback()
+        return { "statusCode": 500, "message": str(e) }
+
+    return { "statusCode": 200, "message": "Merge success", "method": "merge", "rows": rows, **counts }
+
+
+# 保持期間を過ぎたパーティションの除去（取り込みとは別トランザクション、失敗しても取り込み結果は成功のまま）
+def retire_partitions(conn, table, schema, base_date):
+    try:
+        retired = apply_retention(conn, schema, table, base_date)
+        conn.commit()
+    except Exception as e:
+        print(f"[func-error]-[s3convtopg]-[retire_partitions]-[pg_error] {table}: {e}")
+        conn.rollback()
+        return []
+    if retired:
+        print(f"[Info]-[s3convtopg]-[retire_partitions] {table} 保持期間外のパーティションを除去: {retired}")
+    return retired
+
+
+# 取り込み先（新しいパーティション・対象テーブル）の統計情報を更新
+# （取り込みとは別トランザクション、失敗しても取り込み結果は成功のまま）
+def analyze_targets(conn, schema, targets):
+    analyzed = []
+    for target in targets:
+        try:
+            analyze_table(conn, schema, target)
+            conn.commit()
+            analyzed.append(target)
+        except Exception as e:
+            print(f"[func-error]-[s3convtopg]-[analyze_targets]-[pg_error] {target}: {e}")
+            conn.rollback()
+    if analyzed:
+        print(f"[Info]-[s3convtopg]-[analyze_targets] 統計情報を更新: {analyzed}")
+    return analyzed
+
+
+# 期間指定の基準日リスト（yyyy-mm-dd、fromdate から todate までの日付順）
+def backfill_dates(fromdate, todate):
+    try:
+        first = datetime.date.fromisoformat(fromdate)
+        last = datetime.date.fromisoformat(todate)
+    except (TypeError, ValueError):
+        raise ValueError(f"[func-error]-[s3convtopg]-[argument-error] \
+            fromdate: {fromdate} todate: {todate} 'yyyy-mm-dd'の形式で指定してください。")
+    days = (last - first).days + 1
+    if days < 1 or days > BACKFILL_MAX_DAYS:
+        raise ValueError(f"[func-error]-[s3convtopg]-[argument-error] \
+            fromdate: {fromdate} todate: {todate} 期間は1～{BACKFILL_MAX_DAYS}日で指定してください。")
+    return [(first + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+
+
+# テーブル単位・期間指定の取り込み
+# プールから取得した1セッションで、全基準日分の重複確認（1回）→基準日ごとにS3読み込み・COPY→コミットを行う
+# 基準日ごとに別トランザクションとし、1日分の失敗は他の基準日の取り込みに影響しない
+# S3のファイルは取り込み順に1つ先まで先行取得し、COPY の書き込み中に次のファイル（次の基準日分を含む）を読み込む
+# パーティションテーブルは基準日のパーティションを新規作成してアタッチし、最後に保持期間外のパーティションを除去する
+# 戻りは基準日ごとの結果
+def load_table_range(pool, s3_client, table, base_dates, schema, bucket_name, tier1and2_prefix,
+                     load_mode=LOAD_MODE):
+    started = time.perf_counter()
+    results = {}
+    with pool.connection() as conn, ThreadPoolExecutor(max_workers=1) as prefetch_executor:
+        print(f"[Info]-[s3convtopg]-[load_table] {table} 接続取得: {time.perf_counter() - started:.3f}s")
+        # Postgresのテーブルに基準日のデータがすでに存在していないかをチェック（重複データ有無）
+        # 存在していたら後続処理はスキップ（マージモードは差分反映するためスキップしない）
+        merge = load_mode == "merge"
+        metadata = check_target_duplicate(conn, table, base_dates, schema, primary_key=merge)
+        if metadata.get('statusCode') != 200:
+            conn.rollback()
+            print(f"[func-error]-[s3convtopg]-[check_target_duplicate]-[pg_error] \
+                {table}.csv: {metadata.get('message')}")
+            return {base_date: metadata for base_date in base_dates}
+        pending = []
+        for base_date in base_dates:
+            if metadata['days'][base_date]['loaded'] and not merge:
+                print(f"[func-info]-[s3convtopg]-[check_target_duplicate]-{table}の基準日データに重複あり \
+                    base_date: {base_date}")
+                results[base_date] = { "statusCode": 200, "message": "duplicate" }
+            else:
+                pending.append(base_date)
+        if not pending:
+            conn.rollback()
+            return {base_date: results[base_date] for base_date in base_dates}
+
+        # S3から取り込み対象のファイルを取得（ファイルが読み込めない基準日はスキップ）
+        conv_data = {base_date: getconvkeys(s3_client, bucket_name, tier1and2_prefix, table, base_date)
+                     for base_date in pending}
+        prefetcher = ParquetPrefetcher(s3_client, bucket_name,
+                                       [key for data in conv_data.values() for key in data.get('keys', [])],
+                                       prefetch_executor)
+
+        # 読み込んだデータをPostgresにインサート
+        # - パーティションテーブルで基準日のパーティションがない場合: 新しいパーティションを作成してアタッチ
+        # - マージモード: ステージング経由で差分反映
+        # - 上記以外: 対象テーブルに直接インサート
+        for base_date in pending:
+            if conv_data[base_date].get("statusCode") != 200:
+                conn.rollback()
+                results[base_date] = conv_data[base_date]
+                continue
+            keys = conv_data[base_date].get('keys')
+            args = (s3_client, bucket_name, keys)
+            if metadata.get('partitioned') and not metadata['days'][base_date]['partition_exists']:
+                result = attach_targetdata(conn, table, schema, metadata.get('columns'), base_date, *args,
+                                           prefetcher=prefetcher, pool=pool)
+            elif merge:
+                result = merge_targetdata(conn, table, schema, metadata.get('columns'), metadata.get('primary_key'),
+                                          base_date, *args, prefetcher=prefetcher)
+            else:
+                result = insert_targetdata(conn, table, schema, metadata.get('columns'), base_date, *args,
+                                           prefetcher=prefetcher, pool=pool)
+            # 途中で失敗した基準日の先行取得分を解放する
+            for key in keys:
+                prefetcher.release(key)
+            if result.get('statusCode') != 200:
+                # テーブル定義が変更された可能性があるため、次回は列定義を取得し直す
+                invalidate_columns(conn, schema, table)
+                print(f"[func-error]-[s3convtopg]-[load_table]-[pg_error] \
+                    {table}: {result.get('message')} base_date: {base_date}")
+            results[base_date] = result
+        loaded = [base_date for base_date in pending if results[base_date].get('statusCode') == 200]
+        # 取り込んだパーティション（アタッチ時）・テーブルの統計情報を更新する（PG_ANALYZE_AFTER_LOAD）
+        if ANALYZE_AFTER_LOAD and loaded:
+            targets = dict.fromkeys(partition_name(table, base_date) if results[base_date].get('method') == 'attach'
+                                    else table for base_date in loaded)
+            results[loaded[-1]]["analyzed"] = analyze_targets(conn, schema, list(targets))
+        if metadata.get('partitioned') and loaded:
+            results[loaded[-1]]["retired"] = retire_partitions(conn, table, schema, loaded[-1])
+    print(f"[Info]-[s3convtopg]-[load_table] {table} 処理時間: {time.perf_counter() - started:.3f}s")
+    return {base_date: results[base_date] for base_date in base_dates}
+
+
+# テーブル単位の取り込み（基準日1日分）
+def load_table(pool, s3_client, table, base_date, schema, bucket_name, tier1and2_prefix,
+               load_mode=LOAD_MODE):
+    return load_table_range(pool, s3_client, table, [base_date], schema, bucket_name, tier1and2_prefix,
+                            load_mode)[base_date]
+
+
+def _summarize(result):
+    return {
+        "statusCode": result.get("statusCode"),
+        "message": result.get("message"),
+        "rows": result.get("rows", 0),
+        **{key: result[key] for key in ("method", "inserted", "updated", "deleted", "retired", "analyzed")
+           if key in result},
+    }
+
+
+# 複数テーブルの並列取り込み
+# テーブルごとに独立したセッション・スレッドで処理し、1テーブルの失敗や遅延が他のテーブルを止めないようにする
+# 戻りはテーブル名ごとの結果（statusCode, message, rows, seconds）
+# base_date に基準日のリストを指定した場合は期間指定の取り込みとし、テーブルごとの結果に基準日ごとの結果（days）を含める
+# （statusCode はいずれかの基準日が失敗した場合 500、rows は全基準日の合計）
+def load_tables(pool, s3_client, tables, base_date, schema, bucket_name, tier1and2_prefix,
+                max_workers=LOAD_WORKERS, load_mode=LOAD_MODE):
+    if not tables:
+        return {}
+    max_workers = max(1, min(int(max_workers), pool.max_size, len(tables)))
+    print(f"[Info]-[s3convtopg]-[load_tables] テーブル数: {len(tables)} 並列数: {max_workers} モード: {load_mode}")
+
+    def run(table):
+        started = time.perf_counter()
+        try:
+            if isinstance(base_date, list):
+                days = load_table_range(pool, s3_client, table, base_date, schema, bucket_name,
+                                        tier1and2_prefix, load_mode)
+                days = {day: _summarize(days[day]) for day in base_date}
+                failed = [day for day, result in days.items() if result["statusCode"] != 200]
+                result = {"statusCode": 500 if failed else 200,
+                          "message": f"failed: {', '.join(failed)}" if failed else "success",
+                          "rows": sum(result["rows"] for result in days.values()),
+                          "days": days}
+            else:
+                result = _summarize(load_table(pool, s3_client, table, base_date, schema, bucket_name,
+                                               tier1and2_prefix, load_mode))
+        except Exception as e:
+            # 接続取得の失敗なども他のテーブルは継続する
+            print(f"[func-error]-[s3convtopg]-[load_table]-[pg_error] {table}: {e}")
+            result = _summarize({ "statusCode": 500, "message": str(e) })
+        return {**result, "seconds": round(time.perf_counter() - started, 3)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(tables, executor.map(run, tables)))
 
 
 # main
@@ -124,22 +435,25 @@ def s3convtopg(event, context):
         raise ValueError(f"[func-error]-[s3convtopg]-[argument-error] \
             event[group]: {e}")
     group = event['group']
+    load_mode = event.get('loadmode', LOAD_MODE)
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"[func-error]-[s3convtopg]-[argument-error] \
+            event[loadmode]: {load_mode}")
+    # fromdate / todate 指定時は期間内の全基準日を1回の実行で取り込む（取り込み漏れの再取り込み）
+    base_dates = None
+    if event.get('fromdate') or event.get('todate'):
+        base_dates = backfill_dates(event.get('fromdate'), event.get('todate'))
 
     # parameterストアから必要な値を取得
     ssm = boto3.client('ssm')
     bucket_name = ssm.get_parameter(Name='/m365/common/s3bucket',
                                     WithDecryption=False)['Parameter']['Value']
 
-    # 基準日ファイルから基準日を取得
+    # 基準日を取得（イベントで basedate 指定時はそのまま使用、未指定時は基準日ファイルから取得）
+    # （期間指定時は基準日のリスト）
     s3_client = boto3.client('s3')
     try:
-        csv_file = s3_client.get_object(
-            Bucket=bucket_name,
-            Key="basedatetime/basedatetime.csv"
-        )
-        csv_file_body = csv_file['Body'].read().decode('utf-8')
-        df = pd.read_csv(StringIO(csv_file_body), usecols=['base'])
-        base_date = df['base'].iloc[0]
+        base_date = base_dates or resolve_run_context(event, s3_client, bucket_name)['basedate']
     except Exception as e:
         print(f"[func-error]-[s3convtopg]-[basedatetime.csv-reading-error] \
             basedatetime.csv: {e}")
@@ -173,45 +487,25 @@ def s3convtopg(event, context):
                                 WithDecryption=False)['Parameter']['Value']
     schema = ssm.get_parameter(Name='/m365/common/pg/' + group + '/schema',
                                 WithDecryption=False)['Parameter']['Value']
-   # テーブル単位で、基準日付データ有無確認、Postgresへのデータインサート
-    for table in tables:
-        # Postgresへ接続し、テーブルに基準日のデータがすでに存在していないかをチェック（重複データ有無）
-        # 存在していたら後続処理はスキップ
-        result = check_target_duplicate(table,
-                                        base_date,
-                                        pguser,
-                                        pgpasswd,
-                                        pghost,
-                                        dbname,
-                                        schema)
-        if result.get('statusCode') != 200:
-            print(f"[func-error]-[s3convtopg]-[check_target_duplicate]-[pg_error] \
-                {table}.csv: {result.get('message')}")
-            continue
-        if result.get('count', 0) > 0:
-            print(f"[func-info]-[s3convtopg]-[check_target_duplicate]-{table}の基準日データに重複あり")
-            continue
-
-        # S3からテーブルデータを読み込む
-        tier1and2_prefix = group + '/convert/'
-        conv_data = getconvdata(bucket_name, tier1and2_prefix, table, base_date)
-        #print("Debug: " + conv_data.get("df"))
-        if conv_data.get("statusCode") != 200:
-            # csvファイルが読み込めなくても次に進める（スキップ）
-            continue
+    # ウォームスタート時は前回の接続プールを再利用する
+    # 取り込み台帳はテーブルの並列取り込み前に作成しておく（同時作成の競合を避けるため）
+    try:
+        pool = get_pool(pguser, pgpasswd, pghost, dbname)
+        with pool.connection() as conn:
+            ensure_ledger(conn, schema)
+    except Exception as e:
+        print(f"[func-error]-[s3convtopg]-[pg-pool-error] {e}")
+        return {
+            "statusCode": 500,
+            "message": f"[func-error]-[s3convtopg]-[pg-pool-error] {e}"}
 
-        # 読み込んだデータをPostgresにインサート
-        result = insert_targetdata(table,
-                                   pguser,
-                                   pgpasswd,
-                                   pghost,
-                                   dbname,
-                                   schema,
-                                   conv_data.get("df"))
-        if result.get('statusCode') != 200:
-            print(f"[func-error]-[s3convtopg]-[insert_targetdata]-[pg_error] \
-                {table}.csv: {result.get('message')}")
-            continue
+    # テーブル単位で、基準日付データ有無確認、Postgresへのデータインサート（テーブル間は並列）
+    results = load_tables(pool, s3_client, tables, base_date, schema, bucket_name, tier1and2_prefix,
+                          load_mode=load_mode)
+    for table, result in results.items():
+        print(f"[Info]-[s3convtopg]-[result] {table}: statusCode={result['statusCode']} "
+              f"message={result['message']} rows={result['rows']} seconds={result['seconds']}")
     return {
         "statusCode": 200,
-        "message": "success"}
\ No newline at end of file
+        "message": "success",
+        "tables": results}
\ No newline at end of file
@@ -0,0 +1,481 @@
+import datetime
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+# S3TOPG ディレクトリとレイヤーのライブラリディレクトリを import パスに追加
+CURRENT_DIR = os.path.dirname(__file__)
+SRC_DIR = os.path.dirname(CURRENT_DIR)
+LIB_DIR = os.path.join(os.path.dirname(SRC_DIR), 'layers_cbvpc_work', 'layers', 'PythonLayer')
+for path in (SRC_DIR, LIB_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import s3convtopg as target  # noqa: E402
+from m365lib import pgcopy  # noqa: E402
+from m365lib.pgpostload import INDEXES_QUERY  # noqa: E402
+
+COLUMNS = [("id", "uuid"), ("displayname", "text"), ("base_date", "date")]
+ID = "6f1c1f0e-3c57-4d4c-9a43-0c6f7b0f9a11"
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    rowcount = 0
+
+    def execute(self, sql, params=None):
+        sql = sql if isinstance(sql, str) else sql.as_string(None)
+        self.conn.executed.append(sql)
+        if self.conn.error:
+            raise self.conn.error
+        if sql.startswith("SELECT base_date, COUNT(*)"):
+            # count は全基準日共通の件数、または基準日(yyyy-mm-dd)ごとの件数
+            counts = self.conn.count if isinstance(self.conn.count, dict) else \
+                {day.isoformat(): self.conn.count for day in params[0]}
+            self.result = [(day, counts[day.isoformat()]) for day in params[0] if counts.get(day.isoformat())]
+        elif sql.startswith("SELECT c.relkind"):
+            self.result = [(self.conn.relkind,)]
+        elif sql.startswith("SELECT c.relname FROM pg_inherits") and "ANY" in sql:
+            self.result = [(name,) for name in params[2]] if self.conn.partition_exists else []
+        elif sql.startswith("SELECT c.relname FROM pg_class"):
+            # アタッチされていない同名のテーブル
+            self.result = [(params[1],)] if params[1] in self.conn.orphans else []
+        elif sql.startswith("SELECT base_date, row_count"):
+            self.result = [(day, self.conn.ledger) for day in params[1]] if self.conn.ledger is not None else []
+        elif sql.startswith("SELECT c.relname"):
+            self.result = [(name,) for name in self.conn.partitions]
+        elif sql.startswith("SELECT column_name"):
+            self.result = list(self.conn.columns)
+        elif sql.startswith("SELECT i.relname"):
+            self.result = list(self.conn.indexes)
+        elif sql.startswith("SELECT a.attname"):
+            self.result = [(name,) for name in self.conn.primary_key]
+        elif sql.startswith("WITH merged"):
+            self.result = [(2, 1)]
+        elif sql.startswith("DELETE"):
+            self.rowcount = 1
+        return self
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def copy(self, sql):
+        self.conn.executed.append(sql.as_string(None))
+        return self.conn
+
+
+class FakeConn:
+    def __init__(self, count=0, columns=COLUMNS, error=None, primary_key=(), relkind='r',
+                 partition_exists=False, ledger=None, partitions=(), indexes=(), orphans=()):
+        self.count = count
+        self.orphans = orphans
+        self.indexes = indexes
+        self.columns = columns
+        self.primary_key = primary_key
+        self.relkind = relkind
+        self.partition_exists = partition_exists
+        self.ledger = ledger
+        self.partitions = partitions
+        self.error = error
+        self.executed = []
+        self.rows = []
+        self.committed = False
+        self.rolled_back = False
+        self.pipelined = False
+        self.info = type("Info", (), {"host": "db", "dbname": "m365"})()
+
+    def pipeline(self):
+        self.pipelined = True
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    # COPY オブジェクト
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakePool:
+    max_size = 4
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.checkouts = 0
+
+    def connection(self):
+        self.checkouts += 1
+        return self.conn
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_paginator(self, name):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {'Contents': [{'Key': k} for k in sorted(objects) if k.startswith(Prefix)]}
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]
+        if Range:
+            start, end = Range.split("=")[1].split("-")
+            data = data[int(start):int(end) + 1] if start else data[-int(end):]
+        return {'Body': io.BytesIO(data)}
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+
+def _parquet(rows):
+    table = pa.table({"id": pa.array([ID] * rows), "displayname": pa.array(["g"] * rows),
+                      "base_date": pa.array([datetime.date(2025, 7, 25)] * rows, pa.date32())})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+PREFIX = "group1/convert/"
+KEY = PREFIX + "m365getgroup/date=20250725/m365getgroup.parquet"
+
+
+@pytest.fixture(autouse=True)
+def clear_columns_cache():
+    pgcopy._COLUMNS_CACHE.clear()
+
+
+def _load(conn, objects, load_mode="skip"):
+    pool = FakePool(conn)
+    result = target.load_table(pool, FakeS3(objects), "m365getgroup", "2025-07-25", "m365", "bucket", PREFIX,
+                               load_mode)
+    return result, pool
+
+
+def test_load_table_single_session():
+    conn = FakeConn()
+    result, pool = _load(conn, {KEY: _parquet(3)})
+    assert result["statusCode"] == 200 and result["rows"] == 3
+    # 重複確認・COPY・コミットを1セッションで実施
+    assert pool.checkouts == 1
+    assert conn.pipelined and conn.committed
+    assert conn.executed[-3] == ('COPY "m365"."m365getgroup" ("id", "displayname", "base_date") '
+                                 'FROM STDIN (FORMAT BINARY)')
+    assert conn.executed[-2].startswith('INSERT INTO "m365"."load_ledger"')
+    # 取り込み後に統計情報を更新する
+    assert conn.executed[-1] == 'ANALYZE "m365"."m365getgroup"'
+    assert result["analyzed"] == ["m365getgroup"]
+    assert len(conn.rows) == 3
+
+
+def test_load_table_skips_duplicate():
+    conn = FakeConn(count=5)
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["message"] == "duplicate"
+    assert conn.rows == [] and not conn.committed and conn.rolled_back
+
+
+def test_load_table_missing_files():
+    conn = FakeConn()
+    result, _ = _load(conn, {})
+    assert result["statusCode"] == 500
+    assert not conn.committed and conn.rolled_back
+
+
+def test_load_table_maps_columns_by_name():
+    # テーブルの列名・列順がデータと異なっても列名で対応付け、テーブルにない列は取り込まない
+    conn = FakeConn(columns=[("base_date", "date"), ("display_name", "text"), ("id", "uuid")])
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["statusCode"] == 200
+    assert conn.executed[-3].startswith('COPY "m365"."m365getgroup" ("base_date", "display_name", "id")')
+    assert conn.types == ["date", "text", "uuid"]
+    assert conn.rows[0] == (datetime.date(2025, 7, 25), "g", uuid.UUID(ID))
+
+
+def test_load_table_without_common_columns_rolls_back():
+    conn = FakeConn(columns=[("foo", "text")])
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["statusCode"] == 500
+    assert not conn.committed and conn.rolled_back
+
+
+def test_load_table_reuses_cached_columns():
+    conn = FakeConn()
+    _load(conn, {KEY: _parquet(3)})
+    conn.executed.clear()
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["statusCode"] == 200
+    # 2回目は列定義を取得しない
+    assert not any(sql.startswith("SELECT column_name") for sql in conn.executed)
+
+    # 取り込みに失敗した場合はキャッシュを破棄する（テーブル定義の変更に追従）
+    pgcopy.cache_columns(conn, "m365", "m365getgroup", [("foo", "text")])
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["statusCode"] == 500
+    assert pgcopy.get_cached_columns(conn, "m365", "m365getgroup") is None
+
+
+def test_load_table_merge_mode_reloads_existing_base_date():
+    # 途中まで取り込まれた基準日データがあってもスキップせず、ステージング経由で差分反映する
+    conn = FakeConn(count=5, primary_key=("id", "base_date"))
+    result, pool = _load(conn, {KEY: _parquet(3)}, load_mode="merge")
+
+    assert result["statusCode"] == 200
+    assert (result["rows"], result["inserted"], result["updated"], result["deleted"]) == (3, 2, 1, 1)
+    assert pool.checkouts == 1 and conn.committed and not conn.rolled_back
+    statements = [sql.split(" (")[0] for sql in conn.executed]
+    assert statements[statements.index('CREATE TEMP TABLE "m365getgroup_stg"'):] == [
+        'CREATE TEMP TABLE "m365getgroup_stg"',
+        'COPY "pg_temp"."m365getgroup_stg"',
+        'DELETE FROM "m365"."m365getgroup" t WHERE t.base_date = %s AND NOT EXISTS',
+        'WITH merged AS',
+        'INSERT INTO "m365"."load_ledger"',
+        'ANALYZE "m365"."m365getgroup"',
+    ]
+    assert len(conn.rows) == 3
+
+
+def test_load_table_merge_mode_failure_rolls_back():
+    conn = FakeConn(columns=[("foo", "text")])
+    result, _ = _load(conn, {KEY: _parquet(3)}, load_mode="merge")
+    assert result["statusCode"] == 500
+    assert not conn.committed and conn.rolled_back
+
+
+def test_load_table_partitioned_attaches_new_partition(monkeypatch):
+    monkeypatch.setattr(target, 'apply_retention', lambda conn, schema, table, base_date: ["m365getgroup_p20250101"])
+    indexes = [("m365getgroup_pkey", 'CREATE UNIQUE INDEX m365getgroup_pkey ON ONLY m365.m365getgroup '
+                'USING btree (id, base_date)', "PRIMARY KEY (id, base_date)"),
+               ("m365getgroup_name_idx", 'CREATE INDEX m365getgroup_name_idx ON ONLY m365.m365getgroup '
+                'USING btree (displayname)', None)]
+    conn = FakeConn(relkind='p', indexes=indexes)
+    result, pool = _load(conn, {KEY: _parquet(3)})
+
+    assert result["statusCode"] == 200
+    assert result["method"] == "attach" and result["rows"] == 3
+    assert result["analyzed"] == ["m365getgroup_p20250725"]
+    assert result["retired"] == ["m365getgroup_p20250101"]
+    # パーティションテーブルは台帳で取り込み済みを判定し、基準日データ件数は数えない
+    assert not any(sql.startswith("SELECT base_date, COUNT(*)") for sql in conn.executed)
+    statements = [sql.split(" (")[0] for sql in conn.executed]
+    assert statements[statements.index('CREATE TABLE "m365"."m365getgroup_p20250725"'):] == [
+        'CREATE TABLE "m365"."m365getgroup_p20250725"',
+        'ALTER TABLE "m365"."m365getgroup_p20250725" ADD CONSTRAINT "m365getgroup_p20250725_range" CHECK',
+        'COPY "m365"."m365getgroup_p20250725"',
+        # 索引は COPY 後、アタッチ前にまとめて作成する
+        INDEXES_QUERY,
+        'ALTER TABLE "m365"."m365getgroup_p20250725" ADD PRIMARY KEY',
+        'CREATE INDEX ON "m365"."m365getgroup_p20250725" USING btree',
+        'ALTER TABLE "m365"."m365getgroup" ATTACH PARTITION "m365"."m365getgroup_p20250725" FOR VALUES FROM',
+        'ALTER TABLE "m365"."m365getgroup_p20250725" DROP CONSTRAINT "m365getgroup_p20250725_range"',
+        'INSERT INTO "m365"."load_ledger"',
+        'ANALYZE "m365"."m365getgroup_p20250725"',
+    ]
+
+
+def test_load_table_partitioned_replaces_orphaned_partition():
+    # 前回の取り込みが中断され、アタッチされずに残ったパーティション用テーブルは取り込み済みとせず、削除して作り直す
+    conn = FakeConn(relkind='p', orphans=("m365getgroup_p20250725",))
+    result, _ = _load(conn, {KEY: _parquet(3)})
+
+    assert result["statusCode"] == 200 and result["method"] == "attach"
+    statements = [sql.split(" (")[0] for sql in conn.executed]
+    drop = statements.index('DROP TABLE "m365"."m365getgroup_p20250725"')
+    assert statements[drop + 1] == 'CREATE TABLE "m365"."m365getgroup_p20250725"'
+
+
+def test_load_table_partitioned_skips_when_ledger_has_base_date():
+    conn = FakeConn(relkind='p', ledger=120)
+    result, _ = _load(conn, {KEY: _parquet(3)})
+    assert result["message"] == "duplicate"
+    assert conn.rows == []
+
+
+def test_load_table_partitioned_merge_into_existing_partition():
+    conn = FakeConn(relkind='p', partition_exists=True, ledger=120)
+    result, _ = _load(conn, {KEY: _parquet(3)}, load_mode="merge")
+    assert result["method"] == "merge"
+    assert any(sql.startswith('COPY "pg_temp"."m365getgroup_stg"') for sql in conn.executed)
+
+
+def test_load_tables_runs_in_parallel_and_isolates_failures(monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_load_table(pool, s3_client, table, *args):
+        with lock:
+            running.append(table)
+            peak.append(len(running))
+        try:
+            time.sleep(0.2)
+            if table == "broken":
+                raise RuntimeError("connection refused")
+            return {"statusCode": 200, "message": "Insert success", "rows": 10}
+        finally:
+            with lock:
+                running.remove(table)
+
+    monkeypatch.setattr(target, 'load_table', fake_load_table)
+    started = time.perf_counter()
+    results = target.load_tables(FakePool(None), None, ["t1", "broken", "t2", "t3"],
+                                 "2025-07-25", "m365", "bucket", PREFIX, max_workers=4)
+    elapsed = time.perf_counter() - started
+
+    assert list(results) == ["t1", "broken", "t2", "t3"]
+    assert results["broken"]["statusCode"] == 500
+    assert results["broken"]["message"] == "connection refused"
+    assert all(results[t]["statusCode"] == 200 and results[t]["rows"] == 10 for t in ("t1", "t2", "t3"))
+    assert max(peak) == 4
+    assert elapsed < 0.6
+
+
+def test_load_tables_limited_by_pool_size(monkeypatch):
+    peak = []
+    running = []
+    lock = threading.Lock()
+
+    def fake_load_table(pool, s3_client, table, *args):
+        with lock:
+            running.append(table)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(table)
+        return {"statusCode": 200, "message": "Insert success", "rows": 1}
+
+    monkeypatch.setattr(target, 'load_table', fake_load_table)
+    pool = FakePool(None)
+    pool.max_size = 2
+    target.load_tables(pool, None, [f"t{i}" for i in range(6)], "2025-07-25", "m365", "bucket",
+                       PREFIX, max_workers=8)
+    assert max(peak) == 2
+
+
+def _key(day):
+    return f"{PREFIX}m365getgroup/date={day.replace('-', '')}/m365getgroup.parquet"
+
+
+def test_load_table_range_loads_each_day_in_one_session():
+    days = ["2025-07-21", "2025-07-22", "2025-07-23", "2025-07-24"]
+    # 07-22 は取り込み済み、07-23 はファイルなし
+    conn = FakeConn(count={"2025-07-22": 5})
+    objects = {_key(day): _parquet(3) for day in days if day != "2025-07-23"}
+    pool = FakePool(conn)
+    results = target.load_table_range(pool, FakeS3(objects), "m365getgroup", days, "m365", "bucket", PREFIX)
+
+    assert list(results) == days
+    assert results["2025-07-21"]["rows"] == 3 and results["2025-07-24"]["rows"] == 3
+    assert results["2025-07-22"]["message"] == "duplicate"
+    assert results["2025-07-23"]["statusCode"] == 500
+    # 接続は1回のみ取得し、重複確認は全基準日分を1回で検索する
+    assert pool.checkouts == 1
+    assert sum(sql.startswith("SELECT base_date, COUNT(*)") for sql in conn.executed) == 1
+    assert sum(sql.startswith("COPY") for sql in conn.executed) == 2
+    assert len(conn.rows) == 6
+
+
+def test_load_tables_with_date_range(monkeypatch):
+    def fake_load_table_range(pool, s3_client, table, base_dates, *args):
+        return {day: {"statusCode": 500 if table == "t2" and day == base_dates[-1] else 200,
+                      "message": "Insert success", "rows": 2} for day in base_dates}
+
+    monkeypatch.setattr(target, 'load_table_range', fake_load_table_range)
+    days = target.backfill_dates("2025-07-24", "2025-07-25")
+    results = target.load_tables(FakePool(None), None, ["t1", "t2"], days, "m365", "bucket", PREFIX)
+
+    assert results["t1"]["statusCode"] == 200 and results["t1"]["rows"] == 4
+    assert list(results["t1"]["days"]) == ["2025-07-24", "2025-07-25"]
+    assert results["t2"]["statusCode"] == 500
+    assert results["t2"]["message"] == "failed: 2025-07-25"
+
+
+def test_backfill_dates_validates_range(monkeypatch):
+    assert target.backfill_dates("2025-07-30", "2025-08-01") == ["2025-07-30", "2025-07-31", "2025-08-01"]
+    monkeypatch.setattr(target, 'BACKFILL_MAX_DAYS', 7)
+    for fromdate, todate in (("2025-07-25", "2025-07-24"), ("2025-07-01", "2025-07-08"), ("2025-07-01", None)):
+        with pytest.raises(ValueError):
+            target.backfill_dates(fromdate, todate)
+
+
+def _split_plan(monkeypatch, error=None):
+    calls = []
+    plan = {"splits": 2, "names": ["id", "displayname", "base_date"], "rows": 6, "units": []}
+    monkeypatch.setattr(target, 'plan_split_copy', lambda s3_client, bucket_name, keys: plan)
+
+    def fake_split_copy(conn, pool, s3_client, bucket_name, plan, mapping, schema, table):
+        calls.append((table, [target_name for _, target_name, _ in mapping]))
+        if error:
+            raise error
+        return plan["rows"]
+
+    monkeypatch.setattr(target, 'split_copy', fake_split_copy)
+    return calls
+
+
+def test_load_table_split_copy_publishes_staging(monkeypatch):
+    calls = _split_plan(monkeypatch)
+    conn = FakeConn()
+    result, _ = _load(conn, {KEY: _parquet(3)})
+
+    assert result["statusCode"] == 200 and result["rows"] == 6
+    # ステージングは実行ごとに別名
+    ((staging, names),) = calls
+    assert staging.startswith("m365getgroup_stg_") and names == ["id", "displayname", "base_date"]
+    statements = [sql.split(" (")[0] for sql in conn.executed]
+    assert statements[statements.index(f'CREATE UNLOGGED TABLE "m365"."{staging}"'):] == [
+        f'CREATE UNLOGGED TABLE "m365"."{staging}"',
+        'INSERT INTO "m365"."m365getgroup"',
+        f'DROP TABLE "m365"."{staging}"',
+        'INSERT INTO "m365"."load_ledger"',
+        'ANALYZE "m365"."m365getgroup"',
+    ]
+
+
+def test_load_table_split_copy_failure_drops_partition(monkeypatch):
+    calls = _split_plan(monkeypatch, error=RuntimeError("copy failed"))
+    conn = FakeConn(relkind='p')
+    result, _ = _load(conn, {KEY: _parquet(3)})
+
+    assert result["statusCode"] == 500 and result["message"] == "copy failed"
+    assert calls[0][0] == "m365getgroup_p20250725"
+    assert conn.rolled_back
+    assert conn.executed[-1] == 'DROP TABLE IF EXISTS "m365"."m365getgroup_p20250725"'
+    assert not any("ATTACH PARTITION" in sql for sql in conn.executed)
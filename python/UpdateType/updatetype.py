@@ -27,6 +27,9 @@ def load_typejson_from_s3(bucket_name, key):
 
 
 def updatetype(event, context):
+    # 実行コンテキスト（Step Functions から引き渡された基準日）をログに残す
+    # 型更新は基準日に依存しないため basedatetime.csv は読み込まない
+    print(f"[Info]-[updatetype] basedate={(event or {}).get('basedate')} group={(event or {}).get('group')}")
 
     ssm = boto3.client("ssm")
     bucket_name = ssm.get_parameter(
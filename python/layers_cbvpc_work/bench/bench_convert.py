@@ -0,0 +1,143 @@
+# 変換処理（加工・結合・Parquet化）のベンチマーク
+# 従来の pandas 経路（json_normalize + 定数列追加 + pd.concat + to_parquet）と
+# Arrow 経路（from_pylist + 辞書エンコード定数列 + concat_tables + write_table）、
+# ストリーミング経路（ファイル単位で StreamingParquetWriter に行グループ書き込み + マルチパート）を比較する。
+# ピークメモリは経路ごとに子プロセスで実行し ru_maxrss で計測する。
+#
+# 実行例:
+#   python bench/bench_convert.py --files 500 --rows 2000
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+
+def build_records(file_no: int, rows: int) -> list:
+    return [{"id": f"{file_no:04d}{i:08d}-0000-0000-0000-000000000000",
+             "userPrincipalName": f"user{file_no}_{i}@example.com",
+             "surname": None if i % 7 == 0 else f"sur{i}",
+             "givenName": f"given{i}",
+             "displayName": f"user {file_no} {i}"} for i in range(rows)]
+
+
+META = {"m365_base": "2025-07-25", "m365_from": "2025-07-25 00:00",
+        "m365_to": "2025-07-25 23:59", "acquired_date": "2025-07-26"}
+
+
+def run_pandas(files: int, rows: int) -> int:
+    import pandas as pd
+    dfs = []
+    for f in range(files):
+        df = pd.json_normalize(build_records(f, rows))
+        df['base_date'] = META['m365_base']
+        df['from_datetime'] = META['m365_from']
+        df['to_datetime'] = META['m365_to']
+        df['acquired_date'] = META['acquired_date']
+        dfs.append(df)
+    merged = pd.concat(dfs, ignore_index=True)
+    merged[['surname', 'givenName']] = merged[['surname', 'givenName']].fillna("dummy")
+    buf = io.BytesIO()
+    merged.to_parquet(buf, index=False, engine='pyarrow', compression='snappy')
+    return len(buf.getvalue())
+
+
+def run_arrow(files: int, rows: int) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from m365lib.arrowconv import append_constant_columns, concat_tables, fill_null_columns
+    tables = []
+    for f in range(files):
+        table = pa.Table.from_pylist(build_records(f, rows))
+        table = append_constant_columns(table, {
+            'base_date': META['m365_base'], 'from_datetime': META['m365_from'],
+            'to_datetime': META['m365_to'], 'acquired_date': META['acquired_date']})
+        tables.append(table)
+    merged = fill_null_columns(concat_tables(tables), ['surname', 'givenName'], "dummy")
+    buf = io.BytesIO()
+    pq.write_table(merged, buf, compression='snappy')
+    return len(buf.getvalue())
+
+
+class NullS3:
+    """送信データを破棄し、サイズのみ数えるS3クライアント（ストリーミング経路用）"""
+
+    def __init__(self):
+        self.size = 0
+
+    def put_object(self, Bucket, Key, Body):
+        self.size += len(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {'UploadId': 'bench'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.size += len(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        pass
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        pass
+
+
+def run_stream(files: int, rows: int) -> int:
+    import pyarrow as pa
+    from m365lib.arrowconv import append_constant_columns, fill_null_columns
+    from m365lib.parquetio import StreamingParquetWriter
+    s3 = NullS3()
+    writer = StreamingParquetWriter(s3, 'bench', 'bench.parquet')
+    for f in range(files):
+        table = pa.Table.from_pylist(build_records(f, rows))
+        table = append_constant_columns(table, {
+            'base_date': META['m365_base'], 'from_datetime': META['m365_from'],
+            'to_datetime': META['m365_to'], 'acquired_date': META['acquired_date']})
+        writer.write_table(fill_null_columns(table, ['surname', 'givenName'], "dummy"))
+    writer.close()
+    return s3.size
+
+
+RUNNERS = {"pandas": run_pandas, "arrow": run_arrow, "stream": run_stream}
+
+
+def child(mode: str, files: int, rows: int):
+    start = time.perf_counter()
+    size = RUNNERS[mode](files, rows)
+    elapsed = time.perf_counter() - start
+    maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "seconds": elapsed, "maxrss_mb": maxrss_kb / 1024, "parquet_bytes": size}))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--files", type=int, default=500)
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--child", choices=list(RUNNERS))
+    args = p.parse_args()
+
+    if args.child:
+        child(args.child, args.files, args.rows)
+        return
+
+    results = {}
+    for mode in RUNNERS:
+        out = subprocess.run([sys.executable, __file__, "--child", mode,
+                              "--files", str(args.files), "--rows", str(args.rows)],
+                             check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"files={args.files} rows/file={args.rows}")
+    for mode, r in results.items():
+        print(f"{mode:7s}: {r['seconds']:.2f}s  peak RSS {r['maxrss_mb']:.0f} MB  parquet {r['parquet_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
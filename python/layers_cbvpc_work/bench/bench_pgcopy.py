@@ -0,0 +1,148 @@
+# Postgres 取り込み（COPY）のベンチマーク
+# 従来の CSV 経路（Parquet→pandas→to_csv(StringIO)→COPY ... WITH CSV）と
+# バイナリ経路（Parquet レコードバッチ→write_row→COPY ... (FORMAT BINARY)）を比較する。
+# ピークメモリは経路ごとに子プロセスで実行し ru_maxrss で計測する。
+# テーブルは ddl.txt の m365getuser と同じ定義で一時スキーマに作成し、終了時に削除する。
+#
+# 実行例（ローカルの Postgres に接続）:
+#   python bench/bench_pgcopy.py --dsn "host=localhost dbname=postgres user=postgres" --rows 1000000
+import argparse
+import datetime
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+SCHEMA = "bench_pgcopy"
+TABLE = "m365getuser"
+DDL = f"""
+CREATE TABLE {SCHEMA}.{TABLE} (
+ id UUID not null,
+ userPrincipalName text not null,
+ surname text not null,
+ givenName text not null,
+ displayName text not null,
+ from_datetime TIMESTAMP not null,
+ to_datetime TIMESTAMP not null,
+ base_date DATE not null,
+ acquired_date DATE not null
+)"""
+
+
+def build_parquet(rows: int, row_group_rows: int = 65536) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    base = datetime.datetime(2025, 7, 25)
+    table = pa.table({
+        "id": pa.array([str(uuid.UUID(int=i)) for i in range(rows)], pa.string()),
+        "userprincipalname": pa.array([f"user{i}@example.com" for i in range(rows)], pa.string()),
+        "surname": pa.array([f"sur{i}" for i in range(rows)], pa.string()),
+        "givenname": pa.array([f"given{i}" for i in range(rows)], pa.string()),
+        "displayname": pa.array([f"user {i}" for i in range(rows)], pa.string()),
+        "from_datetime": pa.array([base] * rows, pa.timestamp("ms")),
+        "to_datetime": pa.array([base + datetime.timedelta(hours=23, minutes=59)] * rows, pa.timestamp("ms")),
+        "base_date": pa.array([base.date()] * rows, pa.date32()),
+        "acquired_date": pa.array([base.date() + datetime.timedelta(days=1)] * rows, pa.date32()),
+    })
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression='snappy', row_group_size=row_group_rows)
+    return buf.getvalue()
+
+
+class BytesS3:
+    """生成済みの Parquet を返すS3クライアント"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.data)}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Range:
+            start, end = Range.split('=')[1].split('-')
+            data = self.data[int(start):int(end) + 1] if start else self.data[-int(end):]
+            return {'Body': io.BytesIO(data)}
+        return {'Body': io.BytesIO(self.data)}
+
+
+def run_csv(conn, data: bytes) -> int:
+    import pyarrow.parquet as pq
+    df = pq.read_table(io.BytesIO(data)).to_pandas()
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False)
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {SCHEMA}.{TABLE} FROM STDIN WITH CSV") as copy:
+            copy.write(buffer.getvalue())
+    return len(df)
+
+
+def run_binary(conn, data: bytes) -> int:
+    from m365lib.pgcopy import COLUMNS_QUERY, copy_batches, open_parquet_source
+    with conn.cursor() as cur:
+        columns = [tuple(row) for row in cur.execute(COLUMNS_QUERY, (SCHEMA, TABLE)).fetchall()]
+    mapping, batches = open_parquet_source(BytesS3(data), 'bench', ['bench.parquet'], columns)
+    return copy_batches(conn, SCHEMA, TABLE, mapping, batches)
+
+
+RUNNERS = {"csv": run_csv, "binary": run_binary}
+
+
+def child(mode: str, dsn: str, rows: int):
+    import psycopg
+    data = build_parquet(rows)
+    with psycopg.connect(dsn) as conn:
+        conn.execute(f"TRUNCATE {SCHEMA}.{TABLE}")
+        conn.commit()
+        start = time.perf_counter()
+        loaded = RUNNERS[mode](conn, data)
+        conn.commit()
+        elapsed = time.perf_counter() - start
+    maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "seconds": elapsed, "maxrss_mb": maxrss_kb / 1024,
+                      "rows": loaded, "parquet_bytes": len(data)}))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--dsn", default=os.getenv("PG_BENCH_DSN", ""))
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--child", choices=list(RUNNERS))
+    args = p.parse_args()
+
+    if args.child:
+        child(args.child, args.dsn, args.rows)
+        return
+
+    import psycopg
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.execute(DDL)
+    try:
+        results = {}
+        for mode in RUNNERS:
+            out = subprocess.run([sys.executable, __file__, "--child", mode,
+                                  "--dsn", args.dsn, "--rows", str(args.rows)],
+                                 check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(out.strip().splitlines()[-1])
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+    print(f"rows={args.rows}")
+    for mode, r in results.items():
+        print(f"{mode:7s}: {r['seconds']:.2f}s  {r['rows'] / r['seconds']:,.0f} rows/s  "
+              f"peak RSS {r['maxrss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+# Lambda Layer（SimPythonRuntimeLayer）に同梱する共通ライブラリ
+# 各Lambda関数から import m365lib.xxx で利用する
+# レイヤービルド時に buildspec.yml で layers/PythonLayer/python/ 配下へコピーされる
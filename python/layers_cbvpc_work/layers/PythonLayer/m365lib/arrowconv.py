@@ -0,0 +1,68 @@
+# 収集データ（Arrowテーブル）の加工処理
+# pandas（json_normalize + pd.concat）を経由せずにArrowテーブルのまま加工・結合する。
+# - 定数列（base_date, from_datetime, to_datetime, acquired_date）は辞書エンコードで付与し、
+#   値の実体は1件のみ保持する（インデックス配列のみ行数分）
+# - ファイル単位のテーブルは pa.concat_tables でチャンクとして連結する（データのコピーなし）
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# 全行が同じ値の辞書エンコード列を作成する
+def constant_column(value, length: int) -> pa.Array:
+    dictionary = pa.array([value], type=pa.string() if value is None or isinstance(value, str) else None)
+    indices = pa.array(np.zeros(length, dtype=np.int32))
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+# 列を指定の型に変換する
+# 辞書エンコードの列は辞書の値のみを変換し、辞書エンコードのまま返す（値の実体を行数分に展開しない）
+# 値の型が同じ場合は変換しない
+def cast_column(column, data_type):
+    if not pa.types.is_dictionary(column.type):
+        return column if column.type == data_type else column.cast(data_type)
+    value_type = data_type.value_type if pa.types.is_dictionary(data_type) else data_type
+    if column.type.value_type != value_type:
+        chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+        chunks = [pa.DictionaryArray.from_arrays(chunk.indices, chunk.dictionary.cast(value_type))
+                  for chunk in chunks]
+        column = pa.chunked_array(chunks, type=pa.dictionary(column.type.index_type, value_type)) \
+            if isinstance(column, pa.ChunkedArray) else chunks[0]
+    if pa.types.is_dictionary(data_type) and column.type != data_type:
+        column = column.cast(data_type)
+    return column
+
+
+# 定数列をテーブルに追加する（既存列がある場合は置き換える）
+def append_constant_columns(table: pa.Table, columns: dict) -> pa.Table:
+    for name, value in columns.items():
+        column = constant_column(value, table.num_rows)
+        index = table.schema.get_field_index(name)
+        if index >= 0:
+            table = table.set_column(index, name, column)
+        else:
+            table = table.append_column(name, column)
+    return table
+
+
+# ファイル単位のテーブルを連結する
+# ファイル間で列構成が異なる場合（項目欠落、全件nullなど）も型を昇格して連結する
+def concat_tables(tables: list) -> pa.Table:
+    if len(tables) == 1:
+        return tables[0]
+    return pa.concat_tables(tables, promote_options="default")
+
+
+# 指定列のnullを指定値で置き換える（列が存在しない場合はnull列として追加したうえで置き換える）
+def fill_null_columns(table: pa.Table, columns: list, value) -> pa.Table:
+    for name in columns:
+        index = table.schema.get_field_index(name)
+        if index < 0:
+            table = table.append_column(name, pa.nulls(table.num_rows, pa.string()))
+            index = table.schema.get_field_index(name)
+        column = table.column(index)
+        # 全件nullのファイルのみの場合、null型になるため文字列型に揃える
+        if pa.types.is_null(column.type):
+            column = column.cast(pa.string())
+        table = table.set_column(index, name, pc.fill_null(column, value))
+    return table
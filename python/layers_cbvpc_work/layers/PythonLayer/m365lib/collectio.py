@@ -0,0 +1,136 @@
+# S3のcollectディレクトリ（生データ取得用）のJSONファイルを直接読み込む共通処理
+# Lambda（m365cols3import）経由でレコードをレスポンスに詰めて受け渡すと
+# 6MBのレスポンス上限とJSONの二重エンコード/デコードが発生するため、
+# 呼び出し側はS3参照（バケット・キー）だけを受け取り、S3から直接Arrowテーブルへ読み込む
+import json
+import os
+import pyarrow as pa
+
+# collectファイルのラッパー項目（M365CollectS3Exportで付与）
+COLLECT_META_KEYS = ('m365_base', 'm365_from', 'm365_to', 'acquired_date')
+# collectファイルのマニフェスト（キー・サイズ・ETagの一覧）の配置先
+# ファイル数が多い日はLambda/Step Functionsのペイロード上限（256KB）を超えるため、S3に出力してキーのみ受け渡す
+# （collect 配下に置くと収集ファイルとして列挙されるため、別プレフィックスとする）
+MANIFEST_PREFIX = os.getenv('COLLECT_MANIFEST_PREFIX', 'collectmanifest/')
+
+
+# collectファイルのS3キープレフィックスを組み立てる
+def build_collect_prefix(group: str, collect_key: str, targetdataname: str, base_date: str) -> str:
+    dtstr = base_date.replace("-", "")
+    return f"{group}/{collect_key}{targetdataname}/date={dtstr}/"
+
+
+# collectファイルのマニフェストの配置先キーを組み立てる
+def build_manifest_key(group: str, targetdataname: str, base_date: str) -> str:
+    dtstr = base_date.replace("-", "")
+    return f"{group}/{MANIFEST_PREFIX}{targetdataname}/date={dtstr}.json"
+
+
+# マニフェストをS3に出力し、参照（キー・ETag）を返却する（同じ日の再実行時は上書き）
+def write_collect_manifest(s3_client, bucket_name: str, key: str, manifest: list) -> dict:
+    response = s3_client.put_object(Bucket=bucket_name, Key=key,
+                                    Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+    return {"manifest_key": key, "manifest_etag": (response.get('ETag') or '').strip('"')}
+
+
+# S3からマニフェストを読み込む
+def read_collect_manifest(s3_client, bucket_name: str, key: str) -> list:
+    obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+    return json.loads(obj['Body'].read().decode('utf-8'))
+
+
+# collectファイル本文（bytes）をパースし、dataをArrowテーブルに変換する
+# PowerShell(Out-File -Encoding UTF8)出力のBOM付きにも対応する
+def parse_collect_body(body: bytes) -> dict:
+    wrapper = json.loads(body.decode('utf-8-sig'))
+    data = wrapper.get('data') or []
+    # 1件のみの場合、ConvertTo-Json により配列ではなくオブジェクトになる
+    if isinstance(data, dict):
+        data = [data]
+    table = records_to_table(data)
+    result = {key: wrapper.get(key) for key in COLLECT_META_KEYS}
+    result['table'] = table
+    result['row_count'] = table.num_rows
+    return result
+
+
+# レコード（dictのリスト）をArrowテーブルに変換する
+# pd.json_normalize と同様に全レコードのキーを合わせた列とする（後続のレコードにのみ存在するキーも列になる）
+# 同じ列で型が混在する場合（数値と文字列、オブジェクトと文字列など）は、その列を文字列として取り込む
+def records_to_table(data: list) -> pa.Table:
+    if not data:
+        return pa.table({})
+    try:
+        # 全レコードから構造体の型を推論する（キーは全レコードの和集合）
+        array = pa.array(data)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return _records_to_table_by_column(data)
+    if not pa.types.is_struct(array.type):
+        raise ValueError(f"data の要素がオブジェクトではありません。type: {array.type}")
+    return flatten_table(pa.Table.from_struct_array(array))
+
+
+# "親.子" 形式のキーに展開する（リストはそのまま値とする）
+def _flatten_record(record: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict) and value:
+            flat.update(_flatten_record(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+# 型が混在するレコードを列単位で変換する（変換できない列は文字列とする）
+def _records_to_table_by_column(data: list) -> pa.Table:
+    records = [_flatten_record(record) for record in data]
+    names = list(dict.fromkeys(key for record in records for key in record))
+    columns = {}
+    for name in names:
+        values = [record.get(name) for record in records]
+        try:
+            columns[name] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            print(f"[Warn]-[collectio]-[records_to_table] 型が混在するため文字列として取り込みます。column: {name}")
+            columns[name] = pa.array([_to_text(value) for value in values], type=pa.string())
+    return pa.table(columns)
+
+
+# 構造体列を "親.子" 形式の列に展開する（pd.json_normalize と同じ列名規則）
+def flatten_table(table: pa.Table) -> pa.Table:
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    return table
+
+
+# S3から直接collectファイルを取得しArrowテーブルとして返却する
+def read_collect_object(s3_client, bucket_name: str, key: str) -> dict:
+    obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+    result = parse_collect_body(obj['Body'].read())
+    result['key'] = key
+    result['etag'] = (obj.get('ETag') or '').strip('"')
+    result['size'] = obj.get('ContentLength', 0)
+    return result
+
+
+# 参照渡し用のメタデータ（ポインタ＋スキーマ＋件数）を組み立てる
+# Arrowテーブル本体は含めず、JSONシリアライズ可能な値のみ返却する
+def build_collect_reference(bucket_name: str, collect: dict) -> dict:
+    table = collect['table']
+    reference = {
+        "bucket_name": bucket_name,
+        "key": collect['key'],
+        "etag": collect.get('etag'),
+        "size": collect.get('size'),
+        "row_count": collect['row_count'],
+        "schema": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+    }
+    for key in COLLECT_META_KEYS:
+        reference[key] = collect.get(key)
+    return reference
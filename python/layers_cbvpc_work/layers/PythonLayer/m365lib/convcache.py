@@ -0,0 +1,149 @@
+# 変換結果のキャッシュ（ETagマニフェスト）処理
+# 収集ファイルごとの変換結果（加工済みテーブル）を中間ファイル（フラグメント）としてS3に保存し、
+# 収集ファイルのETagとフラグメントの対応を日単位のマニフェストに記録する。
+# Step Functions のリトライやリカバリ実行では、ETagが一致する収集ファイルはフラグメントを読み込み、
+# 新規・更新された収集ファイルのみを取得・変換する。
+# 収集ファイルごとにフラグメントのPUTが発生するため、変換定義で有効にしたテーブルのみ使用する（既定は無効）。
+# 基準日から CACHE_RETENTION_DAYS 日より前の date= 配下は、変換の成功時に削除する（prune）。
+#
+# 配置: s3://<bucket>/<group>/<CONVERT_CACHE_PREFIX><table>/date=yyyymmdd/
+#         manifest.json
+#         fragments/<収集キーのハッシュ>-<ETag>.parquet
+# （convert 配下に置くとテーブルとして扱われるため、別プレフィックスとする）
+import datetime
+import hashlib
+import io
+import json
+import os
+import threading
+import pyarrow.parquet as pq
+from m365lib.parquetio import delete_stale_parquet
+
+CACHE_PREFIX = os.getenv('CONVERT_CACHE_PREFIX', 'convcache/')
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# キャッシュの保持日数（基準日からこの日数より前の date= 配下を削除する）
+CACHE_RETENTION_DAYS = int(os.getenv('CONVERT_CACHE_RETENTION_DAYS', '7'))
+
+
+# キャッシュの配置先プレフィックスを組み立て
+def build_cache_prefix(group: str, targetdataname: str, basedate: str) -> str:
+    return f"{group}/{CACHE_PREFIX}{targetdataname}/date={basedate.replace('-', '')}/"
+
+
+# 変換定義と出力スキーマの指紋（変換内容が変わった場合はキャッシュを使用しない）
+def spec_fingerprint(spec: dict, schema) -> str:
+    material = {
+        "targetdataname": spec.get("targetdataname"),
+        "columns": spec.get("columns"),
+        "types": spec.get("types"),
+        "fill_null": spec.get("fill_null"),
+        "transforms": [f"{t.__module__}.{t.__qualname__}" for t in spec.get("transforms", [])],
+        "schema": str(schema),
+    }
+    return hashlib.sha1(json.dumps(material, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ConvertCache:
+    """収集ファイルのETagと変換済みフラグメントの対応を管理する。
+    lookup / store はプリフェッチのスレッドから呼び出されるため、記録はロックで保護する。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, prefix: str, fingerprint: str):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._previous = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_key(self) -> str:
+        return f"{self.prefix}{MANIFEST_NAME}"
+
+    # 前回のマニフェストを読み込む（存在しない・変換内容が異なる場合は空）
+    def load(self):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.manifest_key)
+        except Exception as e:
+            print(f"[Info]-[convcache]-[load] マニフェストなし（キャッシュ未使用）key: {self.manifest_key} err: {e}")
+            return self
+        manifest = json.loads(obj['Body'].read().decode('utf-8'))
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("fingerprint") != self.fingerprint:
+            print(f"[Info]-[convcache]-[load] 変換定義が変更されたためキャッシュを使用しません。key: {self.manifest_key}")
+            return self
+        self._previous = manifest.get("files", {})
+        return self
+
+    def fragment_key(self, collect_key: str, etag: str) -> str:
+        digest = hashlib.sha1(collect_key.encode('utf-8')).hexdigest()[:16]
+        return f"{self.prefix}fragments/{digest}-{etag}.parquet"
+
+    # ETagが一致するキャッシュを返す（なければ None）
+    def lookup(self, collect_object: dict):
+        etag = collect_object.get('etag')
+        entry = self._previous.get(collect_object['key'])
+        if not etag or entry is None or entry.get('etag') != etag:
+            return None
+        with self._lock:
+            self._entries[collect_object['key']] = entry
+            self.hits += 1
+        return entry
+
+    def read_fragment(self, entry: dict):
+        obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=entry['fragment'])
+        return pq.read_table(io.BytesIO(obj['Body'].read()))
+
+    # 変換結果をフラグメントとして保存し、マニフェストに記録する（table が None の場合はデータ空として記録）
+    def store(self, collect_object: dict, table, meta: dict):
+        etag = collect_object.get('etag')
+        if not etag:
+            return
+        entry = {"etag": etag, "rows": 0, "fragment": None, "meta": meta}
+        if table is not None and table.num_rows > 0:
+            key = self.fragment_key(collect_object['key'], etag)
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression='snappy')
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=buffer.getvalue())
+            entry.update({"rows": table.num_rows, "fragment": key})
+        with self._lock:
+            self._entries[collect_object['key']] = entry
+            self.misses += 1
+
+    # マニフェストを保存する
+    # 成功時は今回の収集ファイルのみを記録し、参照されなくなったフラグメントを削除する
+    # 失敗時は前回分も残したまま保存する（リトライで処理済みファイルを再利用するため）
+    def save(self, completed: bool):
+        with self._lock:
+            files = dict(self._entries) if completed else {**self._previous, **self._entries}
+        manifest = {"version": MANIFEST_VERSION, "fingerprint": self.fingerprint, "files": files}
+        self.s3_client.put_object(Bucket=self.bucket_name,
+                                  Key=self.manifest_key,
+                                  Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        if completed:
+            keep = [entry['fragment'] for entry in files.values() if entry.get('fragment')]
+            delete_stale_parquet(self.s3_client, self.bucket_name, f"{self.prefix}fragments/", keep)
+
+    # 保持期間を過ぎた date= 配下（マニフェスト・フラグメント）を削除し、削除した日付を返す
+    def prune(self, retention_days: int = None) -> list:
+        retention_days = CACHE_RETENTION_DAYS if retention_days is None else retention_days
+        table_prefix, current = self.prefix.rstrip('/').rsplit('date=', 1)
+        oldest = (datetime.datetime.strptime(current, '%Y%m%d')
+                  - datetime.timedelta(days=retention_days)).strftime('%Y%m%d')
+        stale = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{table_prefix}date="):
+            for obj in page.get('Contents', []):
+                day = obj['Key'][len(table_prefix) + len('date='):].split('/', 1)[0]
+                if day < oldest:
+                    stale.setdefault(day, []).append(obj['Key'])
+        keys = [key for day in sorted(stale) for key in stale[day]]
+        # delete_objects は1回あたり1000件まで
+        for i in range(0, len(keys), 1000):
+            self.s3_client.delete_objects(Bucket=self.bucket_name,
+                                          Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]],
+                                                  'Quiet': True})
+        return sorted(stale)
@@ -0,0 +1,331 @@
+# 収集データの変換エンジン
+# S3のcollectからデータを取得し、加工してS3のconvertにParquet形式で出力する共通処理。
+# 各変換Lambda（m365convuser, m365convgroup, convathenaqueryhistory, convathenabilmetrics）は
+# テーブルごとの変換定義（CONVERT_SPEC）のみを持ち、run_conversion を呼び出す。
+#
+# 変換定義（dict）の項目:
+#   name           : ログ出力に使用する関数名（必須）
+#   targetdataname : 収集元・出力先のテーブル名（必須）
+#   columns        : 出力列（射影）。None の場合は型定義の全列（型定義がない場合は全列）
+#   types          : 型定義（datatype/updatetype.json）への追加・上書き {列名: 型}
+#   fill_null      : nullの置換ルール {列名: 置換値}
+#   transforms     : テーブル単位の加工関数のリスト。関数は (table, result) を受け取り table を返す
+#                    （result は収集ファイルのメタ情報。列単位の pyarrow.compute で実装する）
+#   partition      : 出力先のパーティションキー名（<partition>=yyyymmdd）
+#   target_file_size_mb : 1ファイルあたりの目標サイズ（MB）。超えた場合は同じパーティション内で分割出力する
+#                    （None の場合は環境変数 PARQUET_TARGET_FILE_SIZE_MB、0 の場合は分割しない）
+#   empty_file     : data が空の収集ファイルの扱い（skip: 読み飛ばす / error: 処理全体を失敗とする）
+#   cache          : 変換結果のキャッシュ（ETagマニフェスト）を使用するか（m365lib.convcache）。既定は無効
+#                    （収集ファイルごとにフラグメントのPUTが発生するため、リトライ・再実行の多いテーブルのみ有効にする）
+import boto3
+import json
+import os
+import re
+import pyarrow as pa
+from m365lib.collectio import read_collect_object, read_collect_manifest
+from m365lib.prefetch import prefetch_map
+from m365lib.arrowconv import append_constant_columns, fill_null_columns
+from m365lib.parquetio import SplitParquetWriter, TARGET_FILE_SIZE, delete_stale_parquet
+from m365lib.schema import load_table_schema, cast_to_schema
+from m365lib.convcache import ConvertCache, build_cache_prefix, spec_fingerprint
+from m365lib.schemaindex import delete_schema_index, write_schema_index
+from m365lib.runcontext import resolve_run_context
+
+# 収集ファイルの並行取得数（先読み数）。boto3の既定コネクションプール(10)以下とする
+FETCH_WORKERS = int(os.getenv('COLLECT_FETCH_WORKERS', '8'))
+
+# 変換定義の既定値
+DEFAULT_SPEC = {
+    "columns": None,
+    "types": None,
+    "fill_null": {},
+    "transforms": [],
+    "partition": "date",
+    "target_file_size_mb": None,
+    "empty_file": "skip",
+    "cache": False,
+}
+
+# 収集ファイルのメタ情報（キャッシュにも保存し、フラグメント読み込み時に復元する）
+COLLECT_META = ('m365_base', 'm365_from', 'm365_to', 'acquired_date')
+
+
+# 変換定義に既定値を補完し、必須項目を確認する
+def normalize_spec(spec: dict) -> dict:
+    spec = {**DEFAULT_SPEC, **spec}
+    for key in ("name", "targetdataname"):
+        if not spec.get(key):
+            raise ValueError(f"変換定義に {key} がありません。spec: {spec}")
+    if spec["empty_file"] not in ("skip", "error"):
+        raise ValueError(f"empty_file は skip / error のいずれかを指定してください。spec: {spec}")
+    return spec
+
+
+# 収集データをS3から直接取得（参照渡し）
+# m365cols3listのマニフェストに含まれるS3キーを元に、Lambda（m365cols3import）を経由せずArrowテーブルとして読み込む
+# スレッドから呼び出されるため、S3クライアントは呼び出し元で生成したものを共有する
+def imp_s3_collect_data(s3_client, bucket_name, collect_object, empty_file="skip"):
+    result = read_collect_object(s3_client, bucket_name, collect_object['key'])
+
+    # data空チェック（空データ(data)の場合もある。）
+    if result['row_count'] == 0:
+        if empty_file == "error":
+            raise ValueError(f"データが空です。key: {collect_object['key']}")
+        print(f"[Func-WARN]-[imp_s3_collect_data] データが空です。key: {collect_object['key']}")
+        return None
+    return result
+
+
+# 取得対象のS3キー一覧を取得
+def list_s3_collect_data(bucket_name, collect_key, group, targetdataname, basedate):
+    lambda_client = boto3.client('lambda')
+    payload = {
+        "bucket_name": bucket_name,
+        "collect_key": collect_key,
+        "group": group,
+        "targetdataname": targetdataname,
+        "basedate": basedate
+    }
+    response = lambda_client.invoke(
+        FunctionName='m365cols3listVpc',
+        InvocationType='RequestResponse',
+        Payload=json.dumps(payload)
+    )
+    response_payload = response['Payload'].read().decode('utf-8')
+    result = json.loads(response_payload)
+
+    if result.get("statusCode") != 200:
+        print(f"[Func-ERROR]-[list_s3_collect_data] S3キーの一覧取得に失敗しました。result: {result}")
+        return None
+
+    print(f"[Debug-result {result}]")
+
+    # S3キー・サイズ・ETagを含むマニフェストをS3から読み込んで返却（参照渡し）
+    return read_collect_manifest(boto3.client('s3'), bucket_name, result['manifest_key'])
+
+
+# 変換定義から出力スキーマを取得（型定義の追加・上書き、列の射影を反映）
+# 型定義がない場合は None を返す（型推論で出力）
+def load_spec_schema(s3_client, bucket_name, spec):
+    schema = load_table_schema(s3_client, bucket_name, spec["targetdataname"], spec["types"])
+    if schema is not None and spec["columns"] is not None:
+        schema = pa.schema([schema.field(name.lower()) for name in spec["columns"]])
+    return schema
+
+
+# 収集ファイル単位のテーブルを加工する
+# 定数列の付与 → nullの置換 → テーブル固有の加工 → 出力スキーマへの変換 の順で行う
+def transform_table(table, result, spec, schema):
+    # 出力データの列に取得開始日、取得終了日、取得日を追加（辞書エンコードの定数列）
+    table = append_constant_columns(table, {
+        'base_date': result.get('m365_base'),
+        'from_datetime': result.get('m365_from'),
+        'to_datetime': result.get('m365_to'),
+        'acquired_date': result.get('acquired_date'),
+    })
+    for column, value in spec["fill_null"].items():
+        table = fill_null_columns(table, [column], value)
+    for transform in spec["transforms"]:
+        table = transform(table, result)
+    # 型定義にある列の型を固定（日付・タイムスタンプ・数値を型付きで出力）
+    if schema is not None:
+        table = cast_to_schema(table, schema)
+    if spec["columns"] is not None:
+        names = {name.lower(): name for name in table.column_names}
+        table = table.select([names[name.lower()] for name in spec["columns"] if name.lower() in names])
+    return table
+
+
+# 変換結果のキャッシュを読み込む（基準日が特定できない場合などはキャッシュを使用しない）
+def open_convert_cache(s3_client, bucket_name, group, spec, schema, event):
+    if not spec["cache"]:
+        return None
+    try:
+        basedate = resolve_run_context(event, s3_client, bucket_name)['basedate']
+        prefix = build_cache_prefix(group, spec["targetdataname"], basedate)
+        return ConvertCache(s3_client, bucket_name, prefix, spec_fingerprint(spec, schema)).load()
+    except Exception as e:
+        print(f"[Warn]-[{spec['name']}]-[open_convert_cache] キャッシュを使用せずに変換します: {e}")
+        return None
+
+
+# 収集ファイル1件を取得・加工する（プリフェッチのスレッドから呼び出す）
+# キャッシュのETagが一致する場合は、収集ファイルを読み込まずに変換済みのフラグメントを返す
+# データが空の場合は None を返す
+def convert_collect_object(s3_client, bucket_name, collect_object, spec, schema, cache=None):
+    entry = cache.lookup(collect_object) if cache is not None else None
+    if entry is not None:
+        if not entry.get('fragment'):
+            return None
+        return {'table': cache.read_fragment(entry), 'cached': True, **entry['meta']}
+
+    result = imp_s3_collect_data(s3_client, bucket_name, collect_object, spec["empty_file"])
+    if result is None or result.get('table') is None or result['table'].num_rows == 0:
+        if cache is not None:
+            cache.store(collect_object, None, {})
+        return None
+    meta = {key: result.get(key) for key in COLLECT_META}
+    table = transform_table(result['table'], result, spec, schema)
+    if cache is not None:
+        cache.store(collect_object, table, meta)
+    return {'table': table, 'cached': False, **meta}
+
+
+# S3出力先のパーティションのプレフィックスを組み立て
+def build_conv_prefix(target_key, group, targetdataname, base_date, partition="date"):
+    dtstr = base_date.replace("-", "")
+    return (f"{group}/{target_key}"
+            f"{targetdataname}/"
+            f"{partition}={dtstr}/")
+
+
+# S3のconvertへの出力ライターを作成
+# 加工済みのテーブルを受け取るたびに行グループとして書き出し、S3マルチパートアップロードで送信する
+# 目標ファイルサイズを超えた場合は <table>-00001.parquet ... に分割し、パートを並行送信する
+# 出力スキーマは最初に書き込むテーブルのスキーマとし、後続のファイルで列の追加・型の変更があれば
+# 次のファイルに切り替えて全列を出力する（型定義にある列は cast_to_schema で型を固定済み）
+def open_s3_conv_writer(s3_client, bucket_name, target_key, group, spec, base_date):
+    key_prefix = build_conv_prefix(target_key, group, spec["targetdataname"], base_date, spec["partition"])
+    target_file_size = TARGET_FILE_SIZE
+    if spec["target_file_size_mb"] is not None:
+        target_file_size = int(spec["target_file_size_mb"]) * 1024 * 1024
+    return SplitParquetWriter(s3_client, bucket_name, key_prefix, spec["targetdataname"],
+                              target_file_size=target_file_size)
+
+
+# 変換処理のmain関数（各変換Lambdaのハンドラから呼び出す）
+def run_conversion(event, spec):
+    spec = normalize_spec(spec)
+    name = spec["name"]
+    targetdataname = spec["targetdataname"]
+
+    # リカバリ用に関数入力パラメータから基準日を取得（未使用：na, リカバリ用：yyyy-mm-dd形式）
+    if event.get('basedate') is None:
+        basedate = "na"
+    else:
+        if not re.match(r'^\d{4}-\d{2}-\d{2}$', event['basedate']):
+            print(f"[Func-ERROR]-[{name}]-[InvalidInput]"
+                  "basedateの形式が不正です。'yyyy-mm-dd'の形式で指定してください。")
+            return json.dumps({ "status": "failed" })
+        basedate = event['basedate']
+
+    # parameterストアから必要な値を取得
+    ssm = boto3.client('ssm')
+    bucket_name = ssm.get_parameter(Name='/m365/common/s3bucket',
+                                    WithDecryption=False)['Parameter']['Value']
+    collect_key = ssm.get_parameter(Name='/m365/common/pipelinecol',
+                                    WithDecryption=False)['Parameter']['Value']
+    target_key = ssm.get_parameter(Name='/m365/common/pipelineconv',
+                                    WithDecryption=False)['Parameter']['Value']
+    # データ取得対象グループ
+    group = event.get("group")
+    if not group:
+        print(f"[Func-ERROR]-[{name}]-[InvalidInput] group is required.")
+        return json.dumps({ "status": "failed" })
+
+    # 取得対象キーに格納された一覧を取得（単一キー、複数キーの違いはなし）
+    filelist = list_s3_collect_data(bucket_name,
+                                    collect_key,
+                                    group,
+                                    targetdataname,
+                                    basedate)
+    if filelist is None:
+        print(f"[Func-ERROR]-[{name}] list_s3_collect_dataでS3キーの一覧取得に失敗しました。")
+        return json.dumps({ "status": "failed" })
+
+    # S3出力ライター（最初のデータ取得時に出力先キーを確定して作成）
+    # ファイル単位で加工したテーブルを順次書き込み、全件をメモリ上に保持しない
+    writer = None
+    output_base_date = None
+    completed = False
+    s3_client = boto3.client('s3')
+    # 型定義ファイル（UpdateTypeと共通）から出力スキーマを取得（定義がない場合は型推論で出力）
+    schema = load_spec_schema(s3_client, bucket_name, spec)
+    # 前回実行時の変換結果（ETagが一致する収集ファイルは再変換しない）
+    cache = open_convert_cache(s3_client, bucket_name, group, spec, schema, event)
+    # 収集ファイルを上限付きスレッドプールで並行取得・加工（結果は入力順に返却し、書き込み中に後続ファイルを先読み）
+    fetched = prefetch_map(lambda obj: convert_collect_object(s3_client, bucket_name, obj, spec, schema, cache),
+                           filelist,
+                           max_workers=FETCH_WORKERS)
+    try:
+        for collect_object, result, error in fetched:
+            file = collect_object['filename']
+
+            # ファイル単位のエラーは処理全体を失敗とする
+            if error is not None:
+                print(f"[Func-ERROR]-[{name}]-[convert_collect_object] 取得・変換に失敗しました: {error} file: {file}")
+                return json.dumps({ "status": "failed" })
+
+            if result is None:
+                print(f"[Func-WARN]-[{name}] dataが空のためスキップします。file: {file}")
+                # データが空の場合もあるため、後続処理は行わずに次のファイルへ（ループ継続）
+                continue
+
+            # S3出力ライターに書き込む
+            try:
+                if writer is None:
+                    output_base_date = result.get('m365_base')
+                    # 再変換の場合、前回のスキーマ指紋を先に削除する（記録に失敗しても古い指紋が使用されないように）
+                    delete_schema_index(s3_client, bucket_name, group, targetdataname, output_base_date)
+                    writer = open_s3_conv_writer(s3_client,
+                                                 bucket_name,
+                                                 target_key,
+                                                 group,
+                                                 spec,
+                                                 output_base_date)
+                writer.write_table(result['table'])
+            except Exception as e:
+                print(f"[Func-ERROR]-[{name}] Parquet書き込み失敗: {str(e)} file: {file}")
+                return json.dumps({ "status": "failed" })
+
+        # 全て空の場合は、S3出力せずに成功で終了する
+        if writer is None:
+            print(f"[Func-WARN]-[{name}] 取得したデータは全て空でした。")
+            # データが空の場合もあるため、後続処理は行わずに成功で終了
+            completed = True
+            return json.dumps({ "status": "success" })
+
+        # 残りの行グループとParquetフッターを書き出し、マルチパートアップロードを完了
+        try:
+            output = writer.close()
+        except Exception as e:
+            print(f"[Func-ERROR]-[{name}]-[s3-Export-Error] Error uploading to S3: {str(e)}")
+            return json.dumps({ "status": "failed" })
+        print(f"[Debug-output] {output['rows']} 件のデータを出力しました。s3_keys: {output['s3_keys']}")
+
+        # 前回実行時の分割ファイルが残っている場合は削除（ファイル数が減った場合の重複読み込み防止）
+        try:
+            stale = delete_stale_parquet(s3_client, bucket_name, writer.key_prefix, output['s3_keys'])
+        except Exception as e:
+            print(f"[Func-ERROR]-[{name}]-[s3-Cleanup-Error] 前回出力ファイルの削除に失敗しました: {str(e)}")
+            return json.dumps({ "status": "failed" })
+        if stale:
+            print(f"[Info]-[{name}] 前回出力ファイルを削除しました。keys: {stale}")
+
+        # 出力スキーマの指紋を記録（カタログ更新のスキーマ変更判定に使用。失敗時は Parquet の読み込みで判定される）
+        try:
+            write_schema_index(s3_client, bucket_name, group, targetdataname, output_base_date, writer.schema)
+        except Exception as e:
+            print(f"[Warn]-[{name}]-[schemaindex] スキーマ指紋の記録に失敗しました: {str(e)}")
+        completed = True
+    finally:
+        # 途中で失敗した場合は、アップロード途中のパートを破棄する
+        if writer is not None and not writer.closed:
+            writer.abort()
+        # 変換結果のマニフェストを保存（失敗時も処理済みファイル分を保存し、リトライで再利用する）
+        if cache is not None:
+            try:
+                cache.save(completed)
+                print(f"[Info]-[{name}] 変換キャッシュ hit: {cache.hits} miss: {cache.misses}")
+            except Exception as e:
+                print(f"[Warn]-[{name}]-[convcache] マニフェストの保存に失敗しました: {e}")
+            # 成功時は保持期間を過ぎた日のキャッシュを削除する
+            if completed:
+                try:
+                    pruned = cache.prune()
+                    if pruned:
+                        print(f"[Info]-[{name}] 保持期間を過ぎた変換キャッシュを削除しました。dates: {pruned}")
+                except Exception as e:
+                    print(f"[Warn]-[{name}]-[convcache] 変換キャッシュの削除に失敗しました: {e}")
+
+    return json.dumps({ "status": "success" })
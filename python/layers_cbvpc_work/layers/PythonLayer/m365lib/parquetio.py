@@ -0,0 +1,480 @@
+# Parquetのストリーミング出力処理
+# 変換済みのArrowテーブルを受け取るたびに行グループとして書き出し、
+# 一定サイズに達したパートから S3 マルチパートアップロードで送信する。
+# データ全体・DataFrame・Parquetバッファを同時に保持しないため、
+# Lambdaのメモリ使用量は1日のデータ量（ユーザ数）に依存せず一定となる。
+#
+# 出力が目標ファイルサイズを超える場合は、同じ date= パーティション内で複数ファイルに分割する
+# （SplitParquetWriter）。1ファイル目は従来どおり <table>.parquet、2ファイル目以降は
+# <table>-00001.parquet, <table>-00002.parquet ... とし、小規模テナントの出力は従来と同一となる。
+# 読み込み側はパーティション配下の *.parquet を全て読み込む（list_parquet_keys）。
+# 出力スキーマを固定しない場合、後続の収集ファイルで列の追加・型の変更があれば次のファイルに切り替え、
+# 以降のファイルはそれまでの全列を含むスキーマで出力する（列を除外しない）。
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import pyarrow as pa
+import pyarrow.parquet as pq
+from m365lib.arrowconv import cast_column
+
+# マルチパートの1パートサイズ（S3の下限は最終パートを除き5MiB）
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = int(os.getenv('PARQUET_PART_SIZE_MB', '8')) * 1024 * 1024
+# 1行グループあたりの目安行数（小さいファイルが多い場合もこの単位でまとめて書き出す）
+ROW_GROUP_ROWS = int(os.getenv('PARQUET_ROW_GROUP_ROWS', '65536'))
+# 分割出力時の1ファイルあたりの目標サイズ（0 の場合は分割しない）
+TARGET_FILE_SIZE = int(os.getenv('PARQUET_TARGET_FILE_SIZE_MB', '128')) * 1024 * 1024
+# パートの並行アップロード数（送信待ちのパートはこの2倍までメモリに保持する）
+UPLOAD_WORKERS = int(os.getenv('PARQUET_UPLOAD_WORKERS', '4'))
+# スキーマ読み込み時に末尾から取得するバイト数（フッターがこれより大きい場合は再取得する）
+FOOTER_READ_SIZE = 64 * 1024
+
+
+class UploadPool:
+    """パートアップロードを並行実行するスレッドプール。
+    送信待ちのパート数を上限付きで管理し、上限に達した場合は空きができるまで投入側を待機させる。
+    """
+
+    def __init__(self, max_workers: int = UPLOAD_WORKERS):
+        max_workers = max(1, int(max_workers))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class _DoneFuture:
+    """同期送信の結果を Future と同じ形で保持する"""
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+    def cancel(self):
+        return False
+
+
+class S3MultipartWriter:
+    """S3 マルチパートアップロードへ書き込むファイルライクオブジェクト。
+    パートサイズに達するまでメモリに溜め、達したら upload_part で送信する。
+    送信パートが1つもないまま close された場合は put_object で1回だけ送信する。
+    pool を指定した場合、パートの送信は pool 上で並行実行する。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, key: str, part_size: int = PART_SIZE,
+                 pool: UploadPool = None):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.pool = pool
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._position = 0
+        self.closed = False
+
+    # pyarrow の出力ストリームとして必要なメソッド
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError(f"S3MultipartWriter is closed. key: {self.key}")
+        self._buffer.extend(data)
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def _send_part(self, part_number: int, body: bytes) -> dict:
+        response = self.s3_client.upload_part(Bucket=self.bucket_name,
+                                              Key=self.key,
+                                              UploadId=self._upload_id,
+                                              PartNumber=part_number,
+                                              Body=body)
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    def _upload_part(self, body: bytes):
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key)['UploadId']
+        part_number = len(self._futures) + 1
+        if self.pool is None:
+            self._futures.append(_DoneFuture(self._send_part(part_number, body)))
+        else:
+            self._futures.append(self.pool.submit(self._send_part, part_number, body))
+
+    # 残りのデータを送信する（pool 指定時は送信完了を待たない）
+    def finish(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is None:
+            # 1パートに満たない場合は通常のPUT
+            body = bytes(self._buffer)
+            if self.pool is None:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=self.key, Body=body)
+            else:
+                self._futures.append(self.pool.submit(self.s3_client.put_object,
+                                                      Bucket=self.bucket_name, Key=self.key, Body=body))
+        elif self._buffer:
+            self._upload_part(bytes(self._buffer))
+        self._buffer = bytearray()
+
+    # 送信完了を待ち、マルチパートアップロードを完了する
+    def complete(self):
+        results = [future.result() for future in self._futures]
+        if self._upload_id is not None:
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket_name,
+                                                     Key=self.key,
+                                                     UploadId=self._upload_id,
+                                                     MultipartUpload={'Parts': results})
+
+    def close(self):
+        self.finish()
+        self.complete()
+
+    # 途中失敗時はアップロード済みパートを破棄する（S3上に不完全なファイルを残さない）
+    def abort(self):
+        self.closed = True
+        self._buffer = bytearray()
+        for future in self._futures:
+            future.cancel()
+        pending = [future for future in self._futures if not isinstance(future, _DoneFuture)]
+        wait(pending)
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name,
+                                                  Key=self.key,
+                                                  UploadId=self._upload_id)
+
+
+# 書き出し用スキーマに合わせてテーブルを整形する
+# - スキーマにあってテーブルにない列は null 列を補完
+# - 型が異なる列はスキーマの型へキャスト（辞書エンコードの列は辞書の値のみを変換し、展開しない）
+# - スキーマにない列は除外（警告を出力）
+def conform_table(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    extra = [name for name in table.column_names if schema.get_field_index(name) < 0]
+    if extra:
+        print(f"[Warn]-[parquetio]-[conform_table] 出力スキーマにない列を除外します: {extra}")
+    columns = []
+    for field in schema:
+        if table.schema.get_field_index(field.name) < 0:
+            columns.append(pa.nulls(table.num_rows, field.type))
+            continue
+        # 辞書エンコードの列は辞書の値のみを変換する（出力スキーマが辞書型の場合は辞書エンコードのまま出力）
+        column = cast_column(table.column(field.name), field.type)
+        if column.type != field.type:
+            column = column.cast(field.type)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+# null型の列は後続ファイルで値が入る可能性があるため文字列型として扱う
+def _writable_schema(schema: pa.Schema) -> pa.Schema:
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                      for f in schema])
+
+
+def _value_type(data_type):
+    return data_type.value_type if pa.types.is_dictionary(data_type) else data_type
+
+
+# 出力中の列型と後続テーブルの列型をまとめる（数値は広い型へ、変換できない組み合わせは文字列型とする）
+def _merge_type(current, other):
+    if pa.types.is_null(other) or _value_type(current) == _value_type(other):
+        return current
+    try:
+        merged = pa.unify_schemas([pa.schema([("x", _value_type(current))]),
+                                   pa.schema([("x", _value_type(other))])],
+                                  promote_options="permissive").field("x").type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    return merged
+
+
+# 出力スキーマに後続テーブルの列を加えたスキーマを返す（既存の列順を維持し、新しい列は末尾に追加）
+def merge_schema(schema: pa.Schema, other: pa.Schema) -> pa.Schema:
+    fields = []
+    for field in schema:
+        index = other.get_field_index(field.name)
+        if index < 0:
+            fields.append(field)
+        else:
+            fields.append(field.with_type(_merge_type(field.type, other.field(index).type)))
+    added = pa.schema([field for field in other if schema.get_field_index(field.name) < 0])
+    return pa.schema(fields + list(_writable_schema(added)))
+
+
+class StreamingParquetWriter:
+    """Arrowテーブルを行グループ単位でS3へストリーミング出力するライター。
+    schema 未指定時は最初に書き込まれたテーブルのスキーマを出力スキーマとする。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, key: str, schema: pa.Schema = None,
+                 compression: str = 'snappy', row_group_rows: int = ROW_GROUP_ROWS,
+                 part_size: int = PART_SIZE, pool: UploadPool = None):
+        self.key = key
+        self.schema = schema
+        self.compression = compression
+        self.row_group_rows = row_group_rows
+        self.rows = 0
+        self.closed = False
+        self._sink = S3MultipartWriter(s3_client, bucket_name, key, part_size, pool)
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+
+    # 出力済みのバイト数（行グループ単位で増加）
+    @property
+    def bytes_written(self) -> int:
+        return self._sink.tell()
+
+    def write_table(self, table: pa.Table):
+        if table.num_rows == 0:
+            return
+        if self.schema is None:
+            self.schema = _writable_schema(table.schema)
+        self._pending.append(conform_table(table, self.schema))
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.row_group_rows:
+            self._flush()
+
+    # 溜めたテーブルを1つの行グループとして書き出す
+    def _flush(self):
+        if not self._pending:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression=self.compression)
+        self._writer.write_table(pa.concat_tables(self._pending), row_group_size=max(self._pending_rows, 1))
+        self.rows += self._pending_rows
+        self._pending = []
+        self._pending_rows = 0
+
+    # Parquetフッターまで書き出して送信を開始する（送信完了は complete で待つ）
+    # 1件も書き込みがない場合はファイルを作成せず False を返す
+    def finish(self) -> bool:
+        self._flush()
+        if self._writer is None:
+            self._sink.abort()
+            self.closed = True
+            return False
+        self._writer.close()
+        self._sink.finish()
+        return True
+
+    def complete(self):
+        self._sink.complete()
+        self.closed = True
+
+    def close(self) -> dict:
+        if self.finish():
+            self.complete()
+        return {"s3_key": self.key, "rows": self.rows}
+
+    # 途中失敗時に呼び出す（書き込み済みの行グループ・アップロード済みパートを破棄）
+    def abort(self):
+        self.closed = True
+        self._pending = []
+        self._sink.abort()
+        # ライターのリソースを解放（破棄済みのためフッターの書き込みエラーは無視）
+        try:
+            if self._writer is not None:
+                self._writer.close()
+        except Exception:
+            pass
+
+
+# 分割出力時のファイル名（1ファイル目は <table>.parquet、以降は <table>-00001.parquet ...）
+def split_file_name(base_name: str, index: int) -> str:
+    if index == 0:
+        return f"{base_name}.parquet"
+    return f"{base_name}-{index:05d}.parquet"
+
+
+class SplitParquetWriter:
+    """目標ファイルサイズごとに出力ファイルを分割するストリーミングライター。
+    各ファイルのパートは共有の UploadPool で並行送信し、ファイルの切り替え時も送信完了を待たない。
+    target_file_size が 0 の場合は分割せず1ファイルに出力する。
+    schema 未指定時は、書き込むテーブルに列の追加・型の変更がある場合も次のファイルに切り替える（merge_schema）。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, key_prefix: str, base_name: str,
+                 schema: pa.Schema = None, target_file_size: int = TARGET_FILE_SIZE,
+                 upload_workers: int = UPLOAD_WORKERS, **writer_options):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key_prefix = key_prefix
+        self.base_name = base_name
+        self.schema = schema
+        self.fixed_schema = schema is not None
+        self.target_file_size = target_file_size
+        self.writer_options = writer_options
+        self.rows = 0
+        self.closed = False
+        self._pool = UploadPool(upload_workers)
+        self._current = None
+        self._finished = []
+
+    def _open(self):
+        key = f"{self.key_prefix}{split_file_name(self.base_name, len(self._finished))}"
+        self._current = StreamingParquetWriter(self.s3_client, self.bucket_name, key,
+                                               schema=self.schema, pool=self._pool,
+                                               **self.writer_options)
+
+    # 現在のファイルを確定し、送信完了待ちのリストへ移す
+    def _roll(self):
+        if self._current.finish():
+            self._finished.append(self._current)
+            self.rows += self._current.rows
+        self._current = None
+
+    def write_table(self, table: pa.Table):
+        if table.num_rows == 0:
+            return
+        if not self.fixed_schema and self.schema is not None:
+            merged = merge_schema(self.schema, table.schema)
+            if not merged.equals(self.schema):
+                # 出力済みのファイルはそのままとし、以降は列を追加・型を変更したスキーマで出力する
+                changed = [field.name for field in merged
+                           if self.schema.get_field_index(field.name) < 0
+                           or self.schema.field(field.name).type != field.type]
+                print(f"[Info]-[parquetio]-[write_table] 列の追加・型の変更のため出力ファイルを切り替えます。"
+                      f"columns: {changed}")
+                if self._current is not None:
+                    self._roll()
+                self.schema = merged
+        if self._current is None:
+            self._open()
+        self._current.write_table(table)
+        # 2ファイル目以降も同じスキーマで出力する（型推論時は1ファイル目のスキーマを引き継ぐ）
+        self.schema = self._current.schema
+        if self.target_file_size and self._current.bytes_written >= self.target_file_size:
+            self._roll()
+
+    def close(self) -> dict:
+        try:
+            if self._current is not None:
+                self._roll()
+            for writer in self._finished:
+                writer.complete()
+        finally:
+            self._pool.shutdown()
+        self.closed = True
+        return {"s3_keys": [writer.key for writer in self._finished], "rows": self.rows}
+
+    def abort(self):
+        self.closed = True
+        writers = self._finished + ([self._current] if self._current is not None else [])
+        for writer in writers:
+            try:
+                writer.abort()
+            except Exception as e:
+                print(f"[Warn]-[parquetio]-[abort] アップロードの破棄に失敗しました。key: {writer.key} err: {e}")
+        self._pool.shutdown()
+
+
+# 指定プレフィックス配下のParquetファイルのキー一覧を取得する（キー名順）
+def list_parquet_keys(s3_client, bucket_name: str, prefix: str) -> list:
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'].endswith('.parquet'))
+    return sorted(keys)
+
+
+# 再実行時に前回の分割ファイルが残らないよう、今回出力していないParquetファイルを削除する
+def delete_stale_parquet(s3_client, bucket_name: str, prefix: str, keep_keys: list) -> list:
+    keep = set(keep_keys)
+    stale = [key for key in list_parquet_keys(s3_client, bucket_name, prefix) if key not in keep]
+    # delete_objects は1回あたり1000件まで
+    for i in range(0, len(stale), 1000):
+        s3_client.delete_objects(Bucket=bucket_name,
+                                 Delete={'Objects': [{'Key': key} for key in stale[i:i + 1000]],
+                                         'Quiet': True})
+    return stale
+
+
+# Parquetファイルのメタデータ（スキーマ・行グループ構成）をフッターのみの範囲取得で読み込む（データ本体は取得しない）
+# ファイル末尾は「フッター + フッター長(4バイト) + "PAR1"」の構成
+# updatecatalog（コンテナ）の read_parquet_footer_schema は同じ処理の複製のため、変更する場合は両方を合わせること
+def read_parquet_metadata(s3_client, bucket_name: str, key: str) -> pq.FileMetaData:
+    tail = s3_client.get_object(Bucket=bucket_name, Key=key,
+                                Range=f"bytes=-{FOOTER_READ_SIZE}")['Body'].read()
+    if len(tail) < 12 or tail[-4:] != b"PAR1":
+        raise ValueError(f"Parquetファイルではありません。key: {key}")
+    footer_size = int.from_bytes(tail[-8:-4], "little") + 8
+    if footer_size > len(tail):
+        tail = s3_client.get_object(Bucket=bucket_name, Key=key,
+                                    Range=f"bytes=-{footer_size}")['Body'].read()
+    return pq.read_metadata(io.BytesIO(b"PAR1" + tail[-footer_size:]))
+
+
+# Parquetファイルのスキーマをフッターのみの範囲取得で読み込む
+def read_parquet_schema(s3_client, bucket_name: str, key: str) -> pa.Schema:
+    return read_parquet_metadata(s3_client, bucket_name, key).schema.to_arrow_schema()
+
+
+class S3RangeFile(io.RawIOBase):
+    """S3 オブジェクトを範囲取得（Range GET）で読み込む読み取り専用のファイルライクオブジェクト。
+    pq.ParquetFile に渡すとフッターと必要な行グループ・列のみを取得するため、
+    オブジェクト全体をメモリに載せずに行グループ単位で読み込める。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, key: str, size: int = None):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        if size is None:
+            size = s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+        self.size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self._pos + size)
+        if self._pos >= end:
+            return b""
+        data = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                         Range=f"bytes={self._pos}-{end - 1}")['Body'].read()
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
@@ -0,0 +1,230 @@
+# Parquet から Postgres へのバイナリCOPY処理
+# 変換済みの Parquet をレコードバッチ単位で読み込み、COPY ... FROM STDIN (FORMAT BINARY) に1行ずつ書き込む。
+# CSV テキストを経由しないため、テーブル全体のテキスト複製が発生せず、
+# Postgres 側での UUID・日付・タイムスタンプの文字列解析も不要になる。
+# メモリ使用量は「Parquetファイル（先行取得分を含め2つまで） + レコードバッチ1つ分」に収まり、
+# メモリ上限（PG_COPY_MEMORY_MB）の半分を超えるファイルは範囲取得で行グループ単位に読み込むため、
+# テーブル・ファイルのサイズによらず「行グループ1つ分（対象列のみ） + レコードバッチ1つ分」となる。
+#
+# Parquet の列とテーブルの列は列名で対応付ける（大文字小文字・アンダースコアの違いは無視、
+# 例: displayName / displayname ⇔ display_name）。COPY には列リストを明示し、
+# Parquet からは対応する列のみを読み込むため、列順の違いや余分な列の影響を受けない。
+import io
+import os
+import threading
+import time
+import uuid
+from operator import itemgetter
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from psycopg import sql
+from m365lib.parquetio import S3RangeFile, read_parquet_schema
+
+COPY_BATCH_ROWS = int(os.getenv('PG_COPY_BATCH_ROWS', '10000'))
+# Parquet ファイルをメモリに一括で読み込む際の上限（テーブルごと、読み込み中と先行取得中の2ファイル分の合計）
+# 1ファイルがこの半分を超える場合は一括で読み込まず、範囲取得で行グループ単位に読み込む
+COPY_MEMORY_LIMIT = int(os.getenv('PG_COPY_MEMORY_MB', '64')) * 1024 * 1024
+# テーブルの列定義のキャッシュ有効期間（秒）
+COLUMNS_CACHE_SECONDS = int(os.getenv('PG_COLUMNS_CACHE_SECONDS', '3600'))
+
+# Postgres の型（information_schema.columns.udt_name）とArrow型の対応
+# データの型が異なる場合は、COPY 前に Arrow 上でまとめてキャストする
+ARROW_TYPES = {
+    "text": pa.string(),
+    "varchar": pa.string(),
+    "bpchar": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+    "int2": pa.int16(),
+    "int4": pa.int32(),
+    "int8": pa.int64(),
+    "float4": pa.float32(),
+    "float8": pa.float64(),
+    "bool": pa.bool_(),
+}
+
+
+# テーブルの列定義（列名・型）を列順で取得するSQL（パイプラインで他のメタデータ取得とまとめて送信する）
+COLUMNS_QUERY = ("SELECT column_name, udt_name FROM information_schema.columns "
+                 "WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position")
+
+# テーブルの列定義のキャッシュ（ウォームスタート間で再利用、(host, dbname, schema, table) -> (期限, 列定義)）
+_COLUMNS_CACHE = {}
+_COLUMNS_LOCK = threading.Lock()
+
+
+def _cache_key(conn, schema: str, table: str) -> tuple:
+    return (conn.info.host, conn.info.dbname, schema, table)
+
+
+# キャッシュ済みの列定義を返す（ないか期限切れの場合は None）
+def get_cached_columns(conn, schema: str, table: str):
+    with _COLUMNS_LOCK:
+        entry = _COLUMNS_CACHE.get(_cache_key(conn, schema, table))
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def cache_columns(conn, schema: str, table: str, columns: list):
+    with _COLUMNS_LOCK:
+        _COLUMNS_CACHE[_cache_key(conn, schema, table)] = (time.monotonic() + COLUMNS_CACHE_SECONDS, columns)
+
+
+# 取り込みに失敗した場合など、テーブル定義が変更された可能性がある場合はキャッシュを破棄する
+def invalidate_columns(conn, schema: str, table: str):
+    with _COLUMNS_LOCK:
+        _COLUMNS_CACHE.pop(_cache_key(conn, schema, table), None)
+
+
+def normalize_column_name(name: str) -> str:
+    return name.replace("_", "").lower()
+
+
+# Parquet の列とテーブルの列を対応付ける
+# 戻りは [(Parquetの列名, テーブルの列名, udt_name), ...]（テーブルの列順）
+# - Parquet にないテーブル列は COPY の対象外（テーブルの既定値が設定される）
+# - テーブルにない Parquet 列は読み込まない
+def build_column_mapping(parquet_names: list, table_columns: list) -> list:
+    sources = {}
+    for name in parquet_names:
+        sources.setdefault(normalize_column_name(name), name)
+    mapping = []
+    for target, udt_name in table_columns:
+        source = sources.pop(normalize_column_name(target), None)
+        if source is not None:
+            mapping.append((source, target, udt_name))
+    if not mapping:
+        raise ValueError(f"テーブルに対応する列がありません。data: {list(parquet_names)}")
+    if sources:
+        print(f"[Warn]-[pgcopy]-[build_column_mapping] テーブルにない列は取り込みません: {list(sources.values())}")
+    mapped = {target for _, target, _ in mapping}
+    missing = [target for target, _ in table_columns if target not in mapped]
+    if missing:
+        print(f"[Warn]-[pgcopy]-[build_column_mapping] データにない列は既定値となります: {missing}")
+    return mapping
+
+
+# Parquet ファイルを開く（メモリ上限の半分以下は一括で読み込み、超える場合は範囲取得で読み込む）
+def open_parquet_file(s3_client, bucket_name: str, key: str, memory_limit: int = None):
+    limit = COPY_MEMORY_LIMIT if memory_limit is None else memory_limit
+    size = s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+    if size > limit // 2:
+        print(f"[Info]-[pgcopy]-[open_parquet_file] 行グループ単位で読み込みます。key: {key} size: {size}")
+        return S3RangeFile(s3_client, bucket_name, key, size)
+    return io.BytesIO(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
+
+
+class ParquetPrefetcher:
+    """S3 の Parquet ファイルを取り込み順に1つ先まで先行取得する。
+    keys には取り込み順に並べた全ファイル（複数の基準日分を含む）を指定し、
+    あるファイルを開く際に次のファイルの取得をバックグラウンドで開始する。
+    COPY の書き込み中に次のファイル（次の基準日の先頭ファイルを含む）の読み込みが進み、
+    保持するのは読み込み中と先行取得中のファイルのみとなる（読み込み後は release で解放する）。
+    メモリ上限を超えるファイルは先行取得せず、範囲取得で読み込む（open_parquet_file）。
+    """
+
+    def __init__(self, s3_client, bucket_name: str, keys: list, executor):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.executor = executor
+        self._following = dict(zip(keys, keys[1:]))
+        self._futures = {}
+
+    def _submit(self, key: str):
+        if key not in self._futures:
+            self._futures[key] = self.executor.submit(open_parquet_file, self.s3_client, self.bucket_name, key)
+        return self._futures[key]
+
+    def open(self, key: str):
+        future = self._submit(key)
+        following = self._following.get(key)
+        if following is not None:
+            self._submit(following)
+        return future.result()
+
+    def release(self, key: str):
+        self._futures.pop(key, None)
+
+
+# S3 上の Parquet ファイルをレコードバッチ単位で返すジェネレータ（ファイルは1つずつ読み込む）
+# columns を指定した場合はその列のみ読み込む
+# prefetcher を指定した場合は、読み込み中のファイルを処理している間に次のファイルを先行取得する
+def iter_parquet_batches(s3_client, bucket_name: str, keys: list, batch_size: int = COPY_BATCH_ROWS,
+                         columns: list = None, prefetcher: ParquetPrefetcher = None):
+    for key in keys:
+        if prefetcher is None:
+            source = open_parquet_file(s3_client, bucket_name, key)
+        else:
+            source = prefetcher.open(key)
+            prefetcher.release(key)
+        parquet_file = pq.ParquetFile(source)
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+
+# 取り込み対象の Parquet ファイル群を開く
+# 先頭ファイルのスキーマ（フッターのみ取得）から列の対応付けを作成し、対応する列のみを読み込むバッチを返す
+# （分割ファイルは同一スキーマで出力されている）
+# prefetcher を指定した場合は、先行取得した先頭ファイルからスキーマを読み込む
+def open_parquet_source(s3_client, bucket_name: str, keys: list, table_columns: list,
+                        batch_size: int = COPY_BATCH_ROWS, prefetcher: ParquetPrefetcher = None):
+    if prefetcher is None:
+        parquet_schema = read_parquet_schema(s3_client, bucket_name, keys[0])
+    else:
+        parquet_schema = pq.read_schema(prefetcher.open(keys[0]))
+    mapping = build_column_mapping(parquet_schema.names, table_columns)
+    batches = iter_parquet_batches(s3_client, bucket_name, keys, batch_size,
+                                   columns=[source for source, _, _ in mapping], prefetcher=prefetcher)
+    return mapping, batches
+
+
+# Arrow配列を Python 値のリストに変換する
+# 日付・タイムスタンプは Python オブジェクトの生成が重いため、一意な値のみ変換して展開する
+# （基準日・取得日などは全行同一のため、行数に比例した変換を避けられる）
+def _to_pylist(array) -> list:
+    if not pa.types.is_temporal(array.type) or len(array) < 2:
+        return array.to_pylist()
+    encoded = pc.dictionary_encode(array)
+    values = encoded.dictionary.to_pylist() + [None]
+    indices = encoded.indices.fill_null(len(values) - 1).to_numpy().tolist()
+    return list(itemgetter(*indices)(values))
+
+
+def _to_uuid(value):
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(value)
+
+
+# レコードバッチを COPY の列順・型に合わせた Python 値の列リストに変換する
+def batch_to_columns(batch: pa.RecordBatch, mapping: list) -> list:
+    values = []
+    for source, _, udt_name in mapping:
+        array = batch.column(source)
+        arrow_type = ARROW_TYPES.get(udt_name)
+        if arrow_type is not None and array.type != arrow_type:
+            array = array.cast(arrow_type)
+        column = _to_pylist(array)
+        if udt_name == "uuid":
+            column = [_to_uuid(value) for value in column]
+        values.append(column)
+    return values
+
+
+# レコードバッチを列リスト付きのバイナリCOPYで書き込み、書き込んだ行数を返す（コミットは呼び出し側で行う）
+# mapping: build_column_mapping の戻り値
+def copy_batches(conn, schema: str, table: str, mapping: list, batches) -> int:
+    rows = 0
+    statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+        sql.Identifier(schema, table),
+        sql.SQL(", ").join(sql.Identifier(target) for _, target, _ in mapping))
+    with conn.cursor() as cur:
+        with cur.copy(statement) as copy:
+            copy.set_types([udt_name for _, _, udt_name in mapping])
+            for batch in batches:
+                for row in zip(*batch_to_columns(batch, mapping)):
+                    copy.write_row(row)
+                rows += batch.num_rows
+    return rows
@@ -0,0 +1,145 @@
+# ステージングテーブル経由のマージ取り込み処理
+# 一時テーブル（セッション固有、コミット時に削除）のステージングに COPY し、対象テーブルの基準日分をステージングの内容に揃える。
+# 差分（追加・更新・削除）のみを集合演算で反映するため、再実行しても結果は同じになり（冪等）、
+# 途中まで取り込まれた基準日データも手作業の削除なしに修復できる。
+# ステージングの作成から反映までを1トランザクションで行い、コミット時に一括で切り替わる。
+#
+# 主キーがない場合は行全体のハッシュ（md5(ROW(...)::text)）で突き合わせる（ハッシュ結合で処理できるため）。
+# 同一内容の重複行は件数で比較し、ステージングと同じ件数になるよう追加・削除する（重複行を1行にまとめない）。
+import uuid
+from psycopg import sql
+
+STAGING_SUFFIX = "_stg"
+# 一時テーブルのスキーマ（セッションごとに別の実体になる）
+TEMP_SCHEMA = "pg_temp"
+
+# 主キー列を列順で取得するSQL（主キーがない場合は0件）
+PRIMARY_KEY_QUERY = ("SELECT a.attname FROM pg_index i "
+                     "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                     "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+                     "ORDER BY array_position(i.indkey::int2[], a.attnum)")
+
+
+def staging_name(table: str) -> str:
+    return f"{table}{STAGING_SUFFIX}"
+
+
+# 複数の接続から COPY するステージングテーブルを対象テーブルと同じ列定義で作成する（分割COPY用）
+# 同じテーブルへの取り込みが同時に実行されても衝突しないよう、実行ごとに別名とする
+def create_staging(conn, schema: str, table: str) -> str:
+    staging = f"{staging_name(table)}_{uuid.uuid4().hex[:8]}"
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {})").format(
+            sql.Identifier(schema, staging), sql.Identifier(schema, table)))
+    return staging
+
+
+# マージ用のステージングを一時テーブルとして作成する（TEMP_SCHEMA に作成、コミット・ロールバック時に削除される）
+# 一時テーブルはセッション固有のため、同時に実行される他の取り込みと衝突しない
+def create_temp_staging(conn, schema: str, table: str) -> str:
+    staging = staging_name(table)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {}) ON COMMIT DROP").format(
+            sql.Identifier(staging), sql.Identifier(schema, table)))
+    return staging
+
+
+def _columns(names):
+    return sql.SQL(", ").join(sql.Identifier(name) for name in names)
+
+
+def _row(alias, names):
+    return sql.SQL("ROW({})").format(
+        sql.SQL(", ").join(sql.Identifier(alias, name) for name in names))
+
+
+# 行全体のハッシュ（NULL と空文字も区別される行の文字列表現から算出）
+def _row_hash(names):
+    return sql.SQL("md5(ROW({})::text)").format(_columns(names))
+
+
+# 主キーあり: INSERT ... ON CONFLICT で追加・更新（値が変わった行のみ更新）し、ステージングにない行を削除
+def _merge_by_key(cur, target, stage, columns, key_columns, base_date):
+    names = [name for name, _ in columns]
+    values = [name for name in names if name not in key_columns]
+    key_match = sql.SQL(" AND ").join(
+        sql.SQL("{} = {}").format(sql.Identifier("t", name), sql.Identifier("s", name))
+        for name in key_columns)
+    cur.execute(sql.SQL(
+        "DELETE FROM {target} t WHERE t.base_date = %s "
+        "AND NOT EXISTS (SELECT 1 FROM {stage} s WHERE {key_match})"
+    ).format(target=target, stage=stage, key_match=key_match), (base_date,))
+    deleted = cur.rowcount
+    if values:
+        action = sql.SQL("DO UPDATE SET {assign} WHERE {old} IS DISTINCT FROM {new}").format(
+            assign=sql.SQL(", ").join(
+                sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(name), sql.Identifier(name))
+                for name in values),
+            old=_row("t", values),
+            new=sql.SQL("ROW({})").format(sql.SQL(", ").join(
+                sql.SQL("EXCLUDED.{}").format(sql.Identifier(name)) for name in values)))
+    else:
+        action = sql.SQL("DO NOTHING")
+    cur.execute(sql.SQL(
+        "WITH merged AS (INSERT INTO {target} AS t ({columns}) SELECT {columns} FROM {stage} "
+        "ON CONFLICT ({keys}) {action} RETURNING (xmax = 0) AS inserted) "
+        "SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged"
+    ).format(target=target, stage=stage, columns=_columns(names),
+             keys=_columns(key_columns), action=action))
+    inserted, updated = cur.fetchone()
+    return {"inserted": inserted, "updated": updated, "deleted": deleted}
+
+
+# 主キーなし: 行全体のハッシュごとの件数で比較し、ステージングより多い行を削除、少ない行を追加
+# 同じハッシュの行に連番を振り、相手側の件数を超えた分だけを対象とする
+def _merge_by_row(cur, target, stage, columns, base_date):
+    names = [name for name, _ in columns]
+    row_hash = _row_hash(names)
+    cur.execute(sql.SQL(
+        "DELETE FROM {target} t USING ("
+        "SELECT x.tableoid, x.ctid FROM ("
+        "SELECT tableoid, ctid, {row_hash} AS _row_hash, "
+        "row_number() OVER (PARTITION BY {row_hash}) AS _row_no FROM {target} WHERE base_date = %s) x "
+        "LEFT JOIN (SELECT {row_hash} AS _row_hash, COUNT(*) AS _row_count FROM {stage} GROUP BY 1) s "
+        "ON s._row_hash = x._row_hash WHERE x._row_no > COALESCE(s._row_count, 0)) d "
+        "WHERE t.base_date = %s AND t.tableoid = d.tableoid AND t.ctid = d.ctid"
+    ).format(target=target, stage=stage, row_hash=row_hash), (base_date, base_date))
+    deleted = cur.rowcount
+    cur.execute(sql.SQL(
+        "INSERT INTO {target} ({columns}) SELECT {source} FROM ("
+        "SELECT {columns}, {row_hash} AS _row_hash, "
+        "row_number() OVER (PARTITION BY {row_hash}) AS _row_no FROM {stage}) s "
+        "LEFT JOIN (SELECT {row_hash} AS _row_hash, COUNT(*) AS _row_count "
+        "FROM {target} WHERE base_date = %s GROUP BY 1) t "
+        "ON t._row_hash = s._row_hash WHERE s._row_no > COALESCE(t._row_count, 0)"
+    ).format(target=target, stage=stage, columns=_columns(names),
+             source=sql.SQL(", ").join(sql.Identifier("s", name) for name in names),
+             row_hash=row_hash), (base_date,))
+    return {"inserted": cur.rowcount, "updated": 0, "deleted": deleted}
+
+
+# 一時テーブルのステージング（create_temp_staging）の内容を対象テーブルの基準日分に反映する
+# （コミットは呼び出し側で行い、ステージングはコミット時に削除される）
+# 戻りは反映件数（inserted, updated, deleted）
+def merge_staging(conn, schema: str, table: str, staging: str, columns: list, key_columns: list,
+                  base_date: str) -> dict:
+    target = sql.Identifier(schema, table)
+    stage = sql.Identifier(TEMP_SCHEMA, staging)
+    with conn.cursor() as cur:
+        if key_columns:
+            counts = _merge_by_key(cur, target, stage, columns, key_columns, base_date)
+        else:
+            counts = _merge_by_row(cur, target, stage, columns, base_date)
+    return counts
+
+
+# ステージングの内容を対象テーブルに一括で追加し、ステージングを削除する（コミットは呼び出し側で行う）
+# 複数の接続から並列に COPY したステージングを1トランザクションで公開する（分割COPY、pgsplit）
+def publish_staging(conn, schema: str, table: str, staging: str, columns: list) -> int:
+    names = _columns([name for name, _ in columns])
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+            sql.Identifier(schema, table), names, names, sql.Identifier(schema, staging)))
+        rows = cur.rowcount
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(schema, staging)))
+    return rows
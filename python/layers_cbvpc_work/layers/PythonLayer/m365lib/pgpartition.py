@@ -0,0 +1,155 @@
+# 基準日（base_date）のレンジパーティションと取り込み台帳の管理処理
+# パーティション化された取り込み先テーブル（PARTITION BY RANGE (base_date)）には、
+# 基準日ごとに新しいテーブルへ COPY してからパーティションとしてアタッチする。
+# 「取り込み済みか」は取り込み台帳（load_ledger、主キー: table_name, base_date）の索引検索で判定し、
+# 保持期間を過ぎたデータは DELETE ではなくパーティションのデタッチ・削除で除去する。
+import datetime
+import os
+from psycopg import sql
+
+LEDGER_TABLE = os.getenv('PG_LEDGER_TABLE', 'load_ledger')
+PARTITION_SUFFIX = "_p"
+
+# 保持日数（0 は保持期間による除去を行わない）と除去方法（detach: 切り離しのみ / drop: 削除）
+RETENTION_DAYS = int(os.getenv('PG_RETENTION_DAYS', '0'))
+RETENTION_ACTION = os.getenv('PG_RETENTION_ACTION', 'detach')
+RETENTION_ACTIONS = ("detach", "drop")
+
+# テーブルの種類（'p': パーティションテーブル、'r': 通常テーブル）を取得するSQL
+RELKIND_QUERY = ("SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                 "WHERE n.nspname = %s AND c.relname = %s")
+
+# 指定した名前のうちアタッチ済みの子パーティション名を取得するSQL（基準日パーティションの有無を複数日分まとめて確認）
+# テーブルの有無ではなく pg_inherits で判定する（取り込み途中で中断し、アタッチされずに残ったテーブルは対象外）
+ATTACHED_PARTITIONS_QUERY = ("SELECT c.relname FROM pg_inherits i "
+                             "JOIN pg_class c ON c.oid = i.inhrelid "
+                             "JOIN pg_class p ON p.oid = i.inhparent "
+                             "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                             "WHERE n.nspname = %s AND p.relname = %s AND c.relname = ANY(%s)")
+
+# アタッチされていない（親テーブルを持たない）同名のテーブルを取得するSQL
+ORPHAN_PARTITION_QUERY = ("SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                          "WHERE n.nspname = %s AND c.relname = %s "
+                          "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)")
+
+# 子パーティション名の一覧を取得するSQL
+PARTITIONS_QUERY = ("SELECT c.relname FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                    "WHERE n.nspname = %s AND p.relname = %s ORDER BY c.relname")
+
+# 取り込み台帳（Lambdaのコンテナ内で作成済みのスキーマを記録し、2回目以降は確認を省略）
+_LEDGER_READY = set()
+
+
+def _to_date(base_date) -> datetime.date:
+    if isinstance(base_date, datetime.date):
+        return base_date
+    return datetime.date.fromisoformat(base_date)
+
+
+def partition_name(table: str, base_date) -> str:
+    return f"{table}{PARTITION_SUFFIX}{_to_date(base_date).strftime('%Y%m%d')}"
+
+
+# パーティション名から基準日を取得（命名規則に合わないパーティションは None）
+def partition_date(table: str, name: str):
+    prefix = f"{table}{PARTITION_SUFFIX}"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.datetime.strptime(name[len(prefix):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+# 取り込み台帳を作成する（存在しない場合のみ）
+def ensure_ledger(conn, schema: str):
+    if schema in _LEDGER_READY:
+        return
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {} ("
+            "table_name text not null, "
+            "base_date date not null, "
+            "row_count bigint not null, "
+            "load_method text not null, "
+            "loaded_at timestamp not null default now(), "
+            "primary key (table_name, base_date))"
+        ).format(sql.Identifier(schema, LEDGER_TABLE)))
+    conn.commit()
+    _LEDGER_READY.add(schema)
+
+
+# 取り込み台帳の検索SQL（基準日の配列を指定し、取り込み済みの基準日と行数を返す）
+def ledger_query(schema: str):
+    return sql.SQL("SELECT base_date, row_count FROM {} WHERE table_name = %s AND base_date = ANY(%s)").format(
+        sql.Identifier(schema, LEDGER_TABLE))
+
+
+# 取り込み結果を台帳に記録する（再取り込み時は上書き、コミットは呼び出し側で行う）
+def record_load(conn, schema: str, table: str, base_date, rows: int, load_method: str):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(
+            "INSERT INTO {} (table_name, base_date, row_count, load_method) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (table_name, base_date) DO UPDATE "
+            "SET row_count = EXCLUDED.row_count, load_method = EXCLUDED.load_method, loaded_at = now()"
+        ).format(sql.Identifier(schema, LEDGER_TABLE)), (table, _to_date(base_date), rows, load_method))
+
+
+# 基準日のパーティション用テーブルを作成する（アタッチ前のため COPY は他のセッションから見えない）
+# 範囲の CHECK 制約を付けておき、アタッチ時の全件検証を省略させる
+# 前回の取り込みが中断され（Lambdaのタイムアウトなど）、アタッチされずに残った同名のテーブルは削除して作り直す
+def create_partition(conn, schema: str, table: str, base_date) -> str:
+    day = _to_date(base_date)
+    partition = partition_name(table, day)
+    with conn.cursor() as cur:
+        cur.execute(ORPHAN_PARTITION_QUERY, (schema, partition))
+        if cur.fetchone() is not None:
+            print(f"[Warn]-[pgpartition]-[create_partition] アタッチされていない {schema}.{partition} を削除して作り直します")
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(schema, partition)))
+        cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+            sql.Identifier(schema, partition), sql.Identifier(schema, table)))
+        # DDL はパラメータを使用できないためリテラルで埋め込む
+        cur.execute(sql.SQL(
+            "ALTER TABLE {} ADD CONSTRAINT {} CHECK (base_date >= {} AND base_date < {})"
+        ).format(sql.Identifier(schema, partition), sql.Identifier(f"{partition}_range"),
+                 sql.Literal(day), sql.Literal(day + datetime.timedelta(days=1))))
+    return partition
+
+
+# 作成したテーブルを基準日のパーティションとしてアタッチする（コミットは呼び出し側で行う）
+def attach_partition(conn, schema: str, table: str, partition: str, base_date):
+    day = _to_date(base_date)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+            sql.Identifier(schema, table), sql.Identifier(schema, partition),
+            sql.Literal(day), sql.Literal(day + datetime.timedelta(days=1))))
+        # パーティション境界と重複するため、アタッチ後は CHECK 制約を削除する
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+            sql.Identifier(schema, partition), sql.Identifier(f"{partition}_range")))
+
+
+# 保持期間を過ぎたパーティションをデタッチ（または削除）し、台帳からも除く（コミットは呼び出し側で行う）
+# 基準日を含む直近 days 日分を残し、それより前のパーティションが対象。戻りは処理したパーティション名のリスト
+def apply_retention(conn, schema: str, table: str, base_date, days: int = RETENTION_DAYS,
+                    action: str = RETENTION_ACTION) -> list:
+    if days <= 0:
+        return []
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"未対応の除去方法です。action: {action}")
+    cutoff = _to_date(base_date) - datetime.timedelta(days=days - 1)
+    with conn.cursor() as cur:
+        cur.execute(PARTITIONS_QUERY, (schema, table))
+        expired = [name for (name,) in cur.fetchall()
+                   if (partition_date(table, name) or cutoff) < cutoff]
+        for name in expired:
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(schema, table), sql.Identifier(schema, name)))
+            if action == "drop":
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(schema, name)))
+        if expired:
+            cur.execute(sql.SQL("DELETE FROM {} WHERE table_name = %s AND base_date < %s").format(
+                sql.Identifier(schema, LEDGER_TABLE)), (table, cutoff))
+    return expired
@@ -0,0 +1,79 @@
+# Postgres 接続プール処理
+# Lambda のウォームスタート間で接続を再利用するため、接続プール（psycopg_pool）をモジュールスコープに保持する。
+# VPC Lambda では TCP+TLS+認証のハンドシェイクが処理時間の大半を占めるため、
+# 新規接続時は接続確立（TCP接続・TLS確立・認証）の所要時間をログに出力する。
+import hashlib
+import os
+import threading
+import time
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
+
+PG_PORT = os.getenv('PG_PORT', '5432')
+POOL_MIN_SIZE = int(os.getenv('PG_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.getenv('PG_POOL_MAX_SIZE', '4'))
+POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', '30'))
+
+# 接続先ごとのプール（接続先キー -> (接続情報の指紋, プール)）
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class TimedConnection(psycopg.Connection):
+    """接続確立の所要時間を計測する接続クラス（プールは connection_class.connect で接続する）。
+    connect_seconds: connect の呼び出しから接続完了（TCP接続・TLS確立・認証）まで
+    """
+
+    connect_seconds = None
+
+    @classmethod
+    def connect(cls, conninfo: str = "", **kwargs):
+        started = time.perf_counter()
+        conn = super().connect(conninfo, **kwargs)
+        conn.connect_seconds = time.perf_counter() - started
+        print(f"[Info]-[pgpool]-[connect] 新規接続 host: {conn.info.host} "
+              f"ssl: {bool(conn.pgconn.ssl_in_use)} elapsed: {conn.connect_seconds:.3f}s")
+        return conn
+
+
+# 接続情報を組み立てる
+def build_conninfo(pguser: str, pgpasswd: str, pghost: str, dbname: str, port: str = PG_PORT) -> str:
+    return make_conninfo(user=pguser, password=pgpasswd, host=pghost, dbname=dbname, port=port)
+
+
+# 接続先のプールを取得する（ウォームスタート時は前回のプールを再利用）
+# パスワード変更などで接続情報が変わった場合は、古いプールを閉じて作り直す
+def get_pool(pguser: str, pgpasswd: str, pghost: str, dbname: str, port: str = PG_PORT) -> ConnectionPool:
+    target = (pghost, str(port), dbname, pguser)
+    conninfo = build_conninfo(pguser, pgpasswd, pghost, dbname, port)
+    fingerprint = hashlib.sha1(conninfo.encode('utf-8')).hexdigest()
+    with _POOLS_LOCK:
+        current = _POOLS.get(target)
+        if current is not None and current[0] == fingerprint and not current[1].closed:
+            return current[1]
+        if current is not None:
+            print(f"[Info]-[pgpool]-[get_pool] 接続情報が変更されたためプールを再作成します。host: {pghost} db: {dbname}")
+            current[1].close()
+        started = time.perf_counter()
+        pool = ConnectionPool(conninfo,
+                              connection_class=TimedConnection,
+                              min_size=POOL_MIN_SIZE,
+                              max_size=max(POOL_MIN_SIZE, POOL_MAX_SIZE),
+                              timeout=POOL_TIMEOUT,
+                              # フリーズ中に切断された接続を払い出さないよう、取得時に疎通確認する
+                              check=ConnectionPool.check_connection,
+                              name=f"{pghost}/{dbname}",
+                              open=True)
+        print(f"[Info]-[pgpool]-[get_pool] プール作成 host: {pghost} db: {dbname} "
+              f"min: {POOL_MIN_SIZE} max: {pool.max_size} elapsed: {time.perf_counter() - started:.3f}s")
+        _POOLS[target] = (fingerprint, pool)
+        return pool
+
+
+# 全てのプールを閉じる（テスト・終了処理用）
+def close_pools():
+    with _POOLS_LOCK:
+        for _, pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
@@ -0,0 +1,53 @@
+# 一括取り込み後の処理（索引の後付け作成・統計情報の更新）
+# 基準日のパーティション用テーブルは索引なし（LIKE ... INCLUDING DEFAULTS）で作成して COPY し、
+# COPY 完了後に親テーブルと同じ索引・一意制約をまとめて作成してからアタッチする。
+# 行ごとの索引更新が発生せず、アタッチ時は作成済みの索引が親の索引に対応付けられるだけとなる
+# （親テーブルのロックを保持したまま索引を作成しない）。
+# パーティションはアタッチ前で他のセッションから参照されないため、CONCURRENTLY ではなく通常の作成とする。
+#
+# 取り込み後は ANALYZE で統計情報を更新し、autovacuum を待たずに新しい基準日のデータに適切な実行計画を使わせる。
+import os
+import re
+from psycopg import sql
+
+# 索引の後付け作成・取り込み後の ANALYZE の有無
+DEFER_INDEXES = os.getenv('PG_DEFER_INDEXES', 'true').lower() == 'true'
+ANALYZE_AFTER_LOAD = os.getenv('PG_ANALYZE_AFTER_LOAD', 'true').lower() == 'true'
+
+# 索引の定義と、制約（主キー・一意制約）の索引の場合は制約の定義を取得するSQL
+INDEXES_QUERY = ("SELECT i.relname, pg_get_indexdef(x.indexrelid), pg_get_constraintdef(c.oid) "
+                 "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+                 "LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid "
+                 "WHERE x.indrelid = %s::regclass ORDER BY i.relname")
+
+# pg_get_indexdef の出力（CREATE [UNIQUE] INDEX 名前 ON [ONLY] テーブル USING ...）から対象テーブル以降を取り出す
+_INDEXDEF = re.compile(r"^CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (USING .+)$")
+
+
+# 親テーブルの索引・制約をパーティション用テーブルに作成する（コミットは呼び出し側で行う）
+# 制約の索引は制約として作成する（アタッチ時に親の制約に対応付けるため）。索引名は自動で付与する
+# 戻りは作成した索引の元になった親の索引名のリスト
+def build_partition_indexes(conn, schema: str, table: str, partition: str) -> list:
+    built = []
+    target = sql.Identifier(schema, partition)
+    with conn.cursor() as cur:
+        cur.execute(INDEXES_QUERY, (f"{schema}.{table}",))
+        indexes = cur.fetchall()
+        for name, indexdef, constraintdef in indexes:
+            if constraintdef:
+                statement = sql.SQL("ALTER TABLE {} ADD {}").format(target, sql.SQL(constraintdef))
+            else:
+                matched = _INDEXDEF.match(indexdef)
+                if matched is None:
+                    raise ValueError(f"索引の定義を解析できません。index: {name} definition: {indexdef}")
+                statement = sql.SQL("CREATE {}INDEX ON {} {}").format(
+                    sql.SQL(matched.group(1) or ""), target, sql.SQL(matched.group(2)))
+            cur.execute(statement)
+            built.append(name)
+    return built
+
+
+# 取り込み先の統計情報を更新する（コミットは呼び出し側で行う）
+def analyze_table(conn, schema: str, table: str):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(schema, table)))
@@ -0,0 +1,118 @@
+# 単一テーブルの分割並列COPY処理
+# 1本の COPY は Postgres の1バックエンド（1コア）で処理されるため、データ量の大きいテーブルは
+# Parquet の行グループを複数の接続に振り分け、同じ取り込み先（ステージングテーブル・アタッチ前のパーティション）へ並列に COPY する。
+# 取り込み先は他のセッションから参照されないテーブルとし、全接続の COPY 完了後に呼び出し側が1トランザクションで公開する
+# （ステージングからの INSERT、またはパーティションのアタッチ）。
+#
+# 追加の接続は接続プールから待ち時間の上限付きで借り、借りられた数で分割する（テーブル間の並列取り込みと競合した場合に
+# 接続待ちで停止しないよう、取得できない場合はテーブル自身の接続のみで取り込む）。
+# 各接続は担当する行グループのみを範囲取得で読み込む（S3RangeFile）。
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import pyarrow.parquet as pq
+from psycopg import sql
+from psycopg_pool import PoolTimeout
+from m365lib.parquetio import S3RangeFile, read_parquet_metadata
+from m365lib.pgcopy import COPY_BATCH_ROWS, copy_batches
+
+# 1テーブルの COPY に使用する最大接続数（1 は分割しない）
+COPY_SPLITS = int(os.getenv('PG_COPY_SPLITS', '1'))
+# 分割する最小行数（これ未満のテーブルは接続の追加・ステージングの公開の負荷が上回るため分割しない）
+SPLIT_MIN_ROWS = int(os.getenv('PG_COPY_SPLIT_MIN_ROWS', '1000000'))
+# 追加の接続を借りる際の待ち時間の上限（秒）
+SPLIT_CONNECT_TIMEOUT = float(os.getenv('PG_COPY_SPLIT_CONNECT_TIMEOUT', '5'))
+
+
+# 分割COPYの計画を作成する（各ファイルのフッターのみ取得し、行グループ単位の作業に分ける）
+# 分割しない場合（分割数1以下・行グループ1つ・行数が下限未満）は None
+# 戻りは {"splits": 最大接続数, "names": Parquetの列名, "rows": 総行数,
+#         "units": [(key, size, 行グループ番号, 行数), ...]}
+def plan_split_copy(s3_client, bucket_name: str, keys: list, splits: int = COPY_SPLITS,
+                    min_rows: int = SPLIT_MIN_ROWS):
+    if splits <= 1:
+        return None
+    units = []
+    names = None
+    for key in keys:
+        metadata = read_parquet_metadata(s3_client, bucket_name, key)
+        if names is None:
+            names = metadata.schema.to_arrow_schema().names
+        size = s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+        units.extend((key, size, index, metadata.row_group(index).num_rows)
+                     for index in range(metadata.num_row_groups))
+    rows = sum(unit[3] for unit in units)
+    if len(units) < 2 or rows < min_rows:
+        return None
+    return {"splits": splits, "names": names, "rows": rows, "units": units}
+
+
+# 行グループを行数が均等になるように振り分ける（行数の多い順に、担当行数の最も少ない接続へ割り当て）
+# 各接続内はファイル・行グループ順に並べ直す
+def distribute_units(units: list, count: int) -> list:
+    shares = [[] for _ in range(count)]
+    loads = [0] * count
+    for unit in sorted(units, key=lambda unit: -unit[3]):
+        target = loads.index(min(loads))
+        shares[target].append(unit)
+        loads[target] += unit[3]
+    order = {unit: i for i, unit in enumerate(units)}
+    return [sorted(share, key=order.get) for share in shares if share]
+
+
+# 担当する行グループをファイルごとに範囲取得で読み込み、レコードバッチ単位で返す
+def iter_share_batches(s3_client, bucket_name: str, share: list, columns: list,
+                       batch_size: int = COPY_BATCH_ROWS):
+    files = {}
+    for key, size, index, _ in share:
+        files.setdefault((key, size), []).append(index)
+    for (key, size), row_groups in files.items():
+        parquet_file = pq.ParquetFile(S3RangeFile(s3_client, bucket_name, key, size))
+        yield from parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns)
+
+
+# 接続プールから追加の接続を借りる（借りられた分のみ返す、返却は stack の終了時）
+def acquire_connections(stack: ExitStack, pool, count: int, timeout: float = SPLIT_CONNECT_TIMEOUT) -> list:
+    connections = []
+    for _ in range(count):
+        try:
+            connections.append(stack.enter_context(pool.connection(timeout=timeout)))
+        except PoolTimeout:
+            break
+    return connections
+
+
+def _copy_share(conn, s3_client, bucket_name: str, share: list, mapping: list, schema: str, table: str) -> int:
+    batches = iter_share_batches(s3_client, bucket_name, share, [source for source, _, _ in mapping])
+    rows = copy_batches(conn, schema, table, mapping, batches)
+    conn.commit()
+    return rows
+
+
+# 計画に従い、テーブル自身の接続と借りた接続で取り込み先へ並列に COPY し、書き込んだ行数を返す
+# 各接続の COPY はそれぞれコミットする（取り込み先は公開前のため他のセッションからは参照されない）
+# 失敗した場合は例外を送出する（取り込み先の削除は呼び出し側で行う）
+def split_copy(conn, pool, s3_client, bucket_name: str, plan: dict, mapping: list, schema: str, table: str) -> int:
+    with ExitStack() as stack:
+        helpers = acquire_connections(stack, pool, min(plan["splits"], len(plan["units"])) - 1)
+        shares = distribute_units(plan["units"], 1 + len(helpers))
+        print(f"[Info]-[pgsplit]-[split_copy] {schema}.{table} 分割数: {len(shares)} "
+              f"行グループ数: {len(plan['units'])} 行数: {plan['rows']}")
+        if len(shares) == 1:
+            return _copy_share(conn, s3_client, bucket_name, shares[0], mapping, schema, table)
+        with ThreadPoolExecutor(max_workers=len(shares) - 1) as executor:
+            futures = [executor.submit(_copy_share, helper, s3_client, bucket_name, share, mapping, schema, table)
+                       for helper, share in zip(helpers, shares[1:])]
+            rows = _copy_share(conn, s3_client, bucket_name, shares[0], mapping, schema, table)
+            return rows + sum(future.result() for future in futures)
+
+
+# 失敗時に分割COPYの取り込み先（コミット済みのステージング・アタッチ前のパーティション）を削除する
+def drop_split_target(conn, schema: str, table: str):
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(schema, table)))
+        conn.commit()
+    except Exception as e:
+        print(f"[func-error]-[pgsplit]-[drop_split_target] {schema}.{table}: {e}")
+        conn.rollback()
@@ -0,0 +1,33 @@
+# 上限付きスレッドプールによる先読み（プリフェッチ）処理
+# S3取得などI/O待ちが支配的な処理を並行実行しつつ、結果は入力順に1件ずつ返却する。
+# 呼び出し側が現在のファイルを加工している間に、後続ファイルの取得を進められる。
+# 先読み数は max_workers 件までに制限するため、メモリ使用量は入力件数に依存しない。
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+# items の各要素に fn を並行適用し、(item, result, error) を入力順に返すジェネレータ
+# fn で例外が発生した場合は error に例外を格納して返却する（ファイル単位のエラー判定は呼び出し側で行う）
+def prefetch_map(fn, items, max_workers: int = 8):
+    max_workers = max(1, int(max_workers))
+    iterator = iter(items)
+    window = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in islice(iterator, max_workers):
+                window.append((item, executor.submit(fn, item)))
+            while window:
+                item, future = window.popleft()
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                # 結果を返却する前に次の要素を投入し、呼び出し側の処理中も取得を継続する
+                for next_item in islice(iterator, 1):
+                    window.append((next_item, executor.submit(fn, next_item)))
+                yield item, result, error
+        finally:
+            # 呼び出し側が途中で中断した場合、未着手の先読みは取り消す
+            for _, future in window:
+                future.cancel()
@@ -0,0 +1,67 @@
+# パイプライン実行単位の基準日コンテキスト（base/from/to）を解決する共通処理
+# データレイアウトは basedatetime/basedatetime.csv と同じ
+# base : 基準日(yyyy-mm-dd)
+# from : データ取得開始日時(yyyy-mm-dd HH:MM)
+# to   : データ取得終了日時(yyyy-mm-dd HH:MM)
+#
+# イベントに basedate（と fromtimestamp/totimestamp）が指定されていればそれを使用し、
+# 未指定または na の場合のみ S3 の basedatetime.csv を読み込む。
+# ウォームスタートのLambdaでは同一バケットの読込結果をプロセス内にキャッシュし、
+# basedatetime.csv の ETag が変わった場合（基準日の更新）のみ再取得する。
+# CSVは数十バイトのためpandasは使わず標準のcsvモジュールで解析する。
+import csv
+import io
+
+BASEDATETIME_KEY = "basedatetime/basedatetime.csv"
+
+# {bucket_name: (ETag, コンテキスト)}
+_CACHE: dict = {}
+
+
+# 基準日からコンテキストを組み立てる（from/to未指定時は 00:00 / 23:59 を補完）
+def build_run_context(basedate: str, fromtimestamp: str = None, totimestamp: str = None) -> dict:
+    return {
+        "basedate": basedate,
+        "fromtimestamp": fromtimestamp or f"{basedate} 00:00",
+        "totimestamp": totimestamp or f"{basedate} 23:59",
+    }
+
+
+# basedatetime.csv の本文を解析する
+def parse_basedatetime_csv(body: bytes) -> dict:
+    reader = csv.DictReader(io.StringIO(body.decode('utf-8-sig')))
+    row = next(reader, None)
+    if row is None or not row.get('base'):
+        raise ValueError("basedatetime.csv に base 列のデータがありません")
+    return build_run_context(row['base'].strip(),
+                             (row.get('from') or '').strip() or None,
+                             (row.get('to') or '').strip() or None)
+
+
+# S3から basedatetime.csv を取得する（ETag が前回の読込時と同じ場合はキャッシュを返却）
+def load_run_context(s3_client, bucket_name: str) -> dict:
+    etag = s3_client.head_object(Bucket=bucket_name, Key=BASEDATETIME_KEY)['ETag']
+    cached = _CACHE.get(bucket_name)
+    if cached and cached[0] == etag:
+        return dict(cached[1])
+
+    csv_file = s3_client.get_object(Bucket=bucket_name, Key=BASEDATETIME_KEY)
+    context = parse_basedatetime_csv(csv_file['Body'].read())
+    _CACHE[bucket_name] = (csv_file.get('ETag', etag), context)
+    return dict(context)
+
+
+# キャッシュを破棄する（テスト用）
+def clear_cache():
+    _CACHE.clear()
+
+
+# イベントから実行コンテキストを解決する
+# event['basedate'] が yyyy-mm-dd で指定されていればS3を読まずにそのまま使用する
+def resolve_run_context(event: dict, s3_client, bucket_name: str) -> dict:
+    basedate = (event or {}).get('basedate')
+    if basedate and basedate != 'na':
+        return build_run_context(basedate,
+                                 event.get('fromtimestamp'),
+                                 event.get('totimestamp'))
+    return load_run_context(s3_client, bucket_name)
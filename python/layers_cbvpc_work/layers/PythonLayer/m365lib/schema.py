@@ -0,0 +1,101 @@
+# 変換出力の固定スキーマ（Arrowスキーマ）処理
+# UpdateType が Glue の型更新に使用する型定義ファイル（conf/updatetype.json を S3 に配置したもの）を
+# 変換処理でも読み込み、型定義にある列の型を固定して Parquet に出力する。
+# これにより日付・タイムスタンプ・数値が型付きで出力され、日ごとのクローラのスキーマ揺れが発生しない。
+# 型定義にない列・列名（大文字小文字）・列順は変更しない（既存の Parquet / Glue の構成を維持する）。
+import json
+import pyarrow as pa
+from m365lib.arrowconv import cast_column
+
+# UpdateType と同じ型定義ファイルのキー
+TYPE_DEFINITION_KEY = "datatype/updatetype.json"
+
+# 型定義（Glue/Athenaの型名）とArrow型の対応
+ARROW_TYPES = {
+    "string": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("ms"),
+    "bigint": pa.int64(),
+    "int": pa.int32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+}
+
+# パーティションキー（S3パスで表現するため、ファイル内の列には含めない）
+PARTITION_KEYS = ("date",)
+
+# コンテナ再利用時の再取得を避けるためのキャッシュ（bucket -> (ETag, {table: columns})）
+# 型定義ファイルが更新された場合（ETag の変化）は再取得する
+_CACHE = {}
+
+
+# 型定義ファイルを読み込み、テーブル名ごとの列型定義を返す
+def load_type_definitions(s3_client, bucket_name: str) -> dict:
+    etag = s3_client.head_object(Bucket=bucket_name, Key=TYPE_DEFINITION_KEY)["ETag"]
+    cached = _CACHE.get(bucket_name)
+    if cached is not None and cached[0] == etag:
+        return cached[1]
+    obj = s3_client.get_object(Bucket=bucket_name, Key=TYPE_DEFINITION_KEY)
+    type_json = json.loads(obj["Body"].read().decode("utf-8"))
+    definitions = {}
+    for config in type_json:
+        if isinstance(config, dict) and config.get("table") and isinstance(config.get("columns"), dict):
+            definitions[config["table"]] = config["columns"]
+    _CACHE[bucket_name] = (obj.get("ETag", etag), definitions)
+    return definitions
+
+
+def clear_cache():
+    _CACHE.clear()
+
+
+# 列型定義からArrowスキーマを組み立てる（パーティションキーは除外）
+def build_schema(columns: dict) -> pa.Schema:
+    fields = []
+    for name, type_name in columns.items():
+        if name in PARTITION_KEYS:
+            continue
+        if type_name not in ARROW_TYPES:
+            raise ValueError(f"未対応の型です。column: {name} type: {type_name}")
+        fields.append(pa.field(name, ARROW_TYPES[type_name]))
+    return pa.schema(fields)
+
+
+# 対象テーブルの出力スキーマを取得する
+# overrides を指定した場合は型定義に追加・上書きする（型定義ファイルにないテーブルは overrides のみで組み立てる）
+# 型定義ファイルがない、または対象テーブルの定義がない場合は None を返す（型推論で出力）
+def load_table_schema(s3_client, bucket_name: str, table_name: str, overrides: dict = None):
+    try:
+        definitions = load_type_definitions(s3_client, bucket_name)
+    except Exception as e:
+        print(f"[Warn]-[schema]-[load_table_schema] 型定義ファイルの読み込みに失敗しました。"
+              f"key: {TYPE_DEFINITION_KEY} err: {e}")
+        definitions = {}
+    columns = definitions.get(table_name)
+    if overrides:
+        columns = {**(columns or {}), **{name.lower(): type_name for name, type_name in overrides.items()}}
+    if columns is None:
+        print(f"[Warn]-[schema]-[load_table_schema] 型定義がありません。table: {table_name}")
+        return None
+    return build_schema(columns)
+
+
+# テーブルの型定義にある列を出力スキーマの型に変換する
+# - 列名は大文字小文字を区別せずに対応付ける（列名・列順はデータのまま）
+# - 型は列単位でまとめてキャストする（変換できない値がある場合は例外）
+# - 辞書エンコードの列（定数列）は辞書の値のみを変換し、辞書エンコードのまま出力する
+# - スキーマにない列はそのまま出力し、データにない列は null 列として末尾に追加する
+def cast_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    fields = {field.name: field for field in schema}
+    names = []
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        field = fields.pop(name.lower(), None)
+        if field is not None:
+            column = cast_column(column, field.type)
+        names.append(name)
+        columns.append(column)
+    for field in fields.values():
+        names.append(field.name)
+        columns.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(columns, names=names)
@@ -0,0 +1,60 @@
+# 変換出力のスキーマ指紋（列名・型・列順のハッシュ）の索引
+# 変換処理が Parquet の出力完了時に日ごとのスキーマ指紋を記録し、
+# カタログ更新（updatecatalog）はファイルを読まずに指紋の比較でスキーマ変更を判定する。
+# 日ごとの記録を集約した履歴からは、列が最初に出現した日なども参照できる。
+#
+# 配置: s3://<bucket>/<group>/<SCHEMA_INDEX_PREFIX><table>/date=yyyymmdd.json
+# （convert 配下に置くとテーブルとして扱われるため、別プレフィックスとする）
+# 指紋の算出方法は updatecatalog（コンテナ）側にも同じ実装があるため、変更する場合は両方を合わせること
+# （コンテナのテスト test_schema_fingerprint_identical_to_layer で一致を確認している）。
+import hashlib
+import json
+import os
+import pyarrow as pa
+
+INDEX_PREFIX = os.getenv('SCHEMA_INDEX_PREFIX', 'schemaindex/')
+INDEX_VERSION = 1
+
+
+# 列型の表記（辞書エンコードの列は値の型とする。読み込み時のスキーマと一致させるため）
+def _type_name(data_type) -> str:
+    if pa.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    return str(data_type)
+
+
+# スキーマを [[列名, 型], ...]（列順）に変換する
+def schema_columns(schema: pa.Schema) -> list:
+    return [[field.name, _type_name(field.type)] for field in schema]
+
+
+def schema_fingerprint(columns: list) -> str:
+    return hashlib.sha256(json.dumps(columns, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+# 日ごとの指紋の配置先キーを組み立て
+def build_index_key(group: str, targetdataname: str, basedate: str) -> str:
+    return f"{group}/{INDEX_PREFIX}{targetdataname}/date={basedate.replace('-', '')}.json"
+
+
+# 日ごとの指紋を削除する（再変換時に出力を書き換える前に呼び出し、古い指紋が残らないようにする）
+def delete_schema_index(s3_client, bucket_name: str, group: str, targetdataname: str, basedate: str) -> str:
+    key = build_index_key(group, targetdataname, basedate)
+    s3_client.delete_object(Bucket=bucket_name, Key=key)
+    return key
+
+
+# 出力したスキーマの指紋を記録し、記録先のキーを返す（再変換時は上書き）
+def write_schema_index(s3_client, bucket_name: str, group: str, targetdataname: str,
+                       basedate: str, schema: pa.Schema) -> str:
+    columns = schema_columns(schema)
+    key = build_index_key(group, targetdataname, basedate)
+    body = {
+        "version": INDEX_VERSION,
+        "table": targetdataname,
+        "date": basedate.replace('-', ''),
+        "fingerprint": schema_fingerprint(columns),
+        "columns": columns,
+    }
+    s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(body).encode('utf-8'))
+    return key
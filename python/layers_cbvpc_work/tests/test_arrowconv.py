@@ -0,0 +1,44 @@
+import os
+import sys
+import pyarrow as pa
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib.arrowconv import (
+    append_constant_columns,
+    concat_tables,
+    fill_null_columns,
+)  # noqa: E402
+
+
+def test_append_constant_columns_dictionary_encoded():
+    table = pa.Table.from_pylist([{"id": "1"}, {"id": "2"}, {"id": "3"}])
+    table = append_constant_columns(table, {"base_date": "2025-07-25", "acquired_date": "2025-07-26"})
+    assert table.column_names == ["id", "base_date", "acquired_date"]
+    assert pa.types.is_dictionary(table.schema.field("base_date").type)
+    assert table.column("base_date").to_pylist() == ["2025-07-25"] * 3
+    # 辞書の実体は1件のみ
+    assert len(table.column("base_date").chunk(0).dictionary) == 1
+
+
+def test_concat_tables_promotes_missing_and_null_columns():
+    t1 = pa.Table.from_pylist([{"id": "1", "description": None}])
+    t2 = pa.Table.from_pylist([{"id": "2", "description": "desc", "extra": 1}])
+    merged = concat_tables([t1, t2])
+    assert merged.num_rows == 2
+    assert merged.column("description").to_pylist() == [None, "desc"]
+    assert merged.column("extra").to_pylist() == [None, 1]
+    # チャンク連結（コピーなし）
+    assert merged.column("id").num_chunks == 2
+
+
+def test_fill_null_columns():
+    t1 = pa.Table.from_pylist([{"id": "1", "surname": None}])
+    t2 = pa.Table.from_pylist([{"id": "2", "surname": "s"}])
+    merged = fill_null_columns(concat_tables([t1, t2]), ["surname", "givenName"], "dummy")
+    assert merged.column("surname").to_pylist() == ["dummy", "s"]
+    assert merged.column("givenName").to_pylist() == ["dummy", "dummy"]
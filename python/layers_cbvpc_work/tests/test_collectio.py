@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib.collectio import (
+    build_collect_prefix,
+    parse_collect_body,
+    read_collect_object,
+    build_collect_reference,
+    build_manifest_key,
+    write_collect_manifest,
+    read_collect_manifest,
+)  # noqa: E402
+
+
+def _collect_body(data, bom=False):
+    body = json.dumps({
+        "m365_base": "2025-07-25",
+        "m365_from": "2025-07-25 00:00",
+        "m365_to": "2025-07-25 23:59",
+        "acquired_date": "2025-07-26",
+        "data": data,
+    }).encode('utf-8')
+    return (b'\xef\xbb\xbf' + body) if bom else body
+
+
+class DummyBody:
+    def __init__(self, data: bytes):
+        self._b = data
+    def read(self):
+        return self._b
+
+
+class DummyS3:
+    def __init__(self, body: bytes):
+        self.body = body
+    def get_object(self, Bucket, Key):
+        return {"Body": DummyBody(self.body), "ETag": '"abc"', "ContentLength": len(self.body)}
+
+
+def test_build_collect_prefix():
+    assert build_collect_prefix('group1', 'collect/', 'm365getuser', '2025-07-25') \
+        == 'group1/collect/m365getuser/date=20250725/'
+
+
+def test_parse_collect_body_flatten_and_bom():
+    result = parse_collect_body(_collect_body(
+        [{"id": "1", "name": {"first": "a", "last": "b"}}], bom=True))
+    assert result['row_count'] == 1
+    assert result['table'].column_names == ['id', 'name.first', 'name.last']
+    assert result['m365_base'] == '2025-07-25'
+
+
+def test_parse_collect_body_merges_keys_of_all_records():
+    # 後続のレコードにのみ存在するキー・null のみの値も列として取り込む（pd.json_normalize と同じ）
+    result = parse_collect_body(_collect_body([
+        {"id": "1", "mail": None},
+        {"id": "2", "mail": "b@example.com", "jobTitle": "dev", "manager": {"id": "m1"}},
+        {"id": "3"},
+    ]))
+    table = result['table']
+    assert table.column_names == ['id', 'mail', 'jobTitle', 'manager.id']
+    assert table.column('mail').to_pylist() == [None, "b@example.com", None]
+    assert table.column('jobTitle').to_pylist() == [None, "dev", None]
+    assert table.column('manager.id').to_pylist() == [None, "m1", None]
+
+
+def test_parse_collect_body_mixed_types_as_string():
+    # 同じキーで型が混在する列は文字列として取り込み、他の列の型は維持する
+    result = parse_collect_body(_collect_body([
+        {"id": "1", "size": 10, "extra": {"a": 1}, "count": 1},
+        {"id": "2", "size": "large", "extra": "none", "count": None},
+        {"id": "3", "size": None, "tags": ["x"], "count": 3},
+    ]))
+    table = result['table']
+    assert table.column_names == ['id', 'size', 'extra.a', 'count', 'extra', 'tags']
+    assert table.column('size').to_pylist() == ["10", "large", None]
+    assert table.column('extra.a').to_pylist() == [1, None, None]
+    assert table.column('extra').to_pylist() == [None, "none", None]
+    assert table.column('count').to_pylist() == [1, None, 3]
+    assert table.column('tags').to_pylist() == [None, None, ["x"]]
+
+
+def test_parse_collect_body_empty_data():
+    result = parse_collect_body(_collect_body([]))
+    assert result['row_count'] == 0
+
+
+def test_parse_collect_body_single_object():
+    # ConvertTo-Json は1件の場合に配列ではなくオブジェクトを出力する
+    result = parse_collect_body(_collect_body({"id": "1"}))
+    assert result['row_count'] == 1
+
+
+def test_read_collect_object_reference():
+    s3 = DummyS3(_collect_body([{"id": "1"}, {"id": "2"}]))
+    collect = read_collect_object(s3, 'bucket', 'group1/collect/t/date=20250725/0_t.json')
+    reference = build_collect_reference('bucket', collect)
+    assert reference['row_count'] == 2
+    assert reference['etag'] == 'abc'
+    assert reference['schema'] == [{"name": "id", "type": "string"}]
+    assert 'table' not in reference
+    # Lambdaレスポンスとして返却できること
+    json.dumps(reference)
+
+
+def test_collect_manifest_round_trip():
+    # マニフェストはcollect配下ではなく別プレフィックスに出力し、キーとETagのみを返却する
+    class ManifestS3:
+        def __init__(self):
+            self.objects = {}
+        def put_object(self, Bucket, Key, Body):
+            self.objects[Key] = Body
+            return {"ETag": '"m1"'}
+        def get_object(self, Bucket, Key):
+            return {"Body": DummyBody(self.objects[Key])}
+
+    s3 = ManifestS3()
+    key = build_manifest_key('group1', 'm365getuser', '2025-07-25')
+    assert key == 'group1/collectmanifest/m365getuser/date=20250725.json'
+    manifest = [{"key": "group1/collect/m365getuser/date=20250725/0_m365getuser.json", "size": 10}]
+    assert write_collect_manifest(s3, 'bucket', key, manifest) == {"manifest_key": key, "manifest_etag": "m1"}
+    assert read_collect_manifest(s3, 'bucket', key) == manifest
@@ -0,0 +1,317 @@
+import io
+import json
+import os
+import sys
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import convengine, schema as schema_mod  # noqa: E402
+
+UPDATETYPE_JSON = os.path.join(os.path.dirname(os.path.dirname(CURRENT_DIR)),
+                               'UpdateType', 'conf', 'updatetype.json')
+
+META = {"m365_base": "2025-07-25", "m365_from": "2025-07-25 00:00",
+        "m365_to": "2025-07-25 23:59", "acquired_date": "2025-07-26"}
+
+PARAMS = {'/m365/common/s3bucket': 'bucket',
+          '/m365/common/pipelinecol': 'collect/',
+          '/m365/common/pipelineconv': 'convert/'}
+
+
+class FakeS3:
+    def __init__(self, collect_files):
+        self.collect_files = collect_files
+        self.objects = {}
+        self.manifests = {}
+        self.collect_reads = []
+
+    def get_object(self, Bucket, Key):
+        if Key == schema_mod.TYPE_DEFINITION_KEY:
+            with open(UPDATETYPE_JSON, 'rb') as f:
+                return {'Body': io.BytesIO(f.read())}
+        if Key in self.objects:
+            return {'Body': io.BytesIO(self.objects[Key])}
+        if Key in self.manifests:
+            return {'Body': io.BytesIO(self.manifests[Key])}
+        if Key not in self.collect_files:
+            raise Exception(f"NoSuchKey: {Key}")
+        self.collect_reads.append(Key)
+        data = self.collect_files[Key]
+        if isinstance(data, Exception):
+            raise data
+        body = json.dumps({**META, "data": data}).encode('utf-8')
+        return {'Body': io.BytesIO(body), 'ETag': '"etag"', 'ContentLength': len(body)}
+
+    def head_object(self, Bucket, Key):
+        assert Key == schema_mod.TYPE_DEFINITION_KEY
+        return {'ETag': '"updatetype"'}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_paginator(self, name):
+        assert name == 'list_objects_v2'
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {'Contents': [{'Key': k} for k in sorted(objects) if k.startswith(Prefix)]}
+
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop(obj['Key'], None)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class FakeSSM:
+    def get_parameter(self, Name, WithDecryption):
+        return {'Parameter': {'Value': PARAMS[Name]}}
+
+
+class FakeLambda:
+    """m365cols3list の代替（マニフェストをS3に出力してキーを返す）"""
+    def __init__(self, keys, s3, status_code=200):
+        self.keys = keys
+        self.s3 = s3
+        self.status_code = status_code
+        self.etags = {}
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        manifest = [{"key": k, "filename": k.split('/')[-1], "etag": self.etags.get(k, f"etag-{k}")}
+                    for k in self.keys]
+        manifest_key = "group1/collectmanifest/table/date=20250725.json"
+        self.s3.manifests[manifest_key] = json.dumps(manifest).encode('utf-8')
+        body = json.dumps({"statusCode": self.status_code, "manifest_key": manifest_key}).encode('utf-8')
+        return {'Payload': io.BytesIO(body)}
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    schema_mod.clear_cache()
+
+    def setup(collect_files, status_code=200):
+        s3 = FakeS3(collect_files)
+        s3.lambda_client = FakeLambda(list(collect_files), s3, status_code)
+        clients = {'s3': s3, 'ssm': FakeSSM(), 'lambda': s3.lambda_client}
+        monkeypatch.setattr(convengine.boto3, 'client', lambda name: clients[name])
+        return s3
+
+    yield setup
+    schema_mod.clear_cache()
+
+
+def _output(s3, table_name):
+    key = f"group1/convert/{table_name}/date=20250725/{table_name}.parquet"
+    return pq.read_table(io.BytesIO(s3.objects[key]))
+
+
+USER_SPEC = {"name": "m365convuser", "targetdataname": "m365getuser",
+             "fill_null": {"surname": "dummy", "givenName": "dummy"}}
+
+
+def test_run_conversion_writes_typed_parquet(aws):
+    s3 = aws({
+        "collect/f1.json": [{"id": "1", "userPrincipalName": "a@example.com", "surname": None,
+                             "givenName": "g", "displayName": "d"}],
+        "collect/f2.json": [],
+        "collect/f3.json": [{"id": "2", "userPrincipalName": "b@example.com", "surname": "s",
+                             "givenName": None, "displayName": "e"}],
+    })
+    assert json.loads(convengine.run_conversion({"group": "group1"}, USER_SPEC)) == {"status": "success"}
+
+    table = _output(s3, "m365getuser")
+    assert table.schema.field("base_date").type == pa.date32()
+    # 出力スキーマの指紋が記録されること
+    entry = json.loads(s3.objects["group1/schemaindex/m365getuser/date=20250725.json"])
+    assert entry['columns'][:2] == [[table.schema[0].name, str(table.schema[0].type)],
+                                    [table.schema[1].name, str(table.schema[1].type)]]
+    assert len(entry['columns']) == table.num_columns
+    # 列名はデータのまま（型定義の小文字の列名に変えない）
+    assert table.column_names[:5] == ["id", "userPrincipalName", "surname", "givenName", "displayName"]
+    assert table.column("userPrincipalName").to_pylist() == ["a@example.com", "b@example.com"]
+    assert table.column("surname").to_pylist() == ["dummy", "s"]
+    assert table.column("givenName").to_pylist() == ["g", "dummy"]
+
+
+def test_run_conversion_applies_transforms_and_projection(aws):
+    s3 = aws({"collect/f1.json": [{"id": "1", "displayName": "group one", "description": "x"}]})
+
+    def upper_display_name(table, result):
+        index = table.schema.get_field_index("displayName")
+        return table.set_column(index, "displayName", pc.utf8_upper(table.column(index)))
+
+    spec = {"name": "m365convgroup", "targetdataname": "m365getgroup",
+            "columns": ["id", "displayName", "base_date"],
+            "transforms": [upper_display_name]}
+    assert json.loads(convengine.run_conversion({"group": "group1"}, spec)) == {"status": "success"}
+
+    table = _output(s3, "m365getgroup")
+    assert table.column_names == ["id", "displayName", "base_date"]
+    assert table.column("displayName").to_pylist() == ["GROUP ONE"]
+    assert table.schema.field("base_date").type == pa.date32()
+
+
+def test_run_conversion_keeps_columns_without_type_definition(aws):
+    # 型定義にない列（mail, jobTitle）も除外せずに出力する
+    s3 = aws({"collect/f1.json": [{"id": "1", "userPrincipalName": "a@example.com", "surname": "s",
+                                   "givenName": "g", "displayName": "d", "mail": "a@example.com",
+                                   "jobTitle": "engineer"}]})
+    assert json.loads(convengine.run_conversion({"group": "group1"}, USER_SPEC)) == {"status": "success"}
+
+    table = _output(s3, "m365getuser")
+    assert table.column("mail").to_pylist() == ["a@example.com"]
+    assert table.column("jobTitle").to_pylist() == ["engineer"]
+    assert table.schema.field("from_datetime").type == pa.timestamp("ms")
+
+
+def test_run_conversion_empty_file_error(aws):
+    s3 = aws({"collect/f1.json": []})
+    spec = {"name": "conv_athena_bilmetrics", "targetdataname": "athenabillingmetrics", "empty_file": "error"}
+    assert json.loads(convengine.run_conversion({"group": "group1"}, spec)) == {"status": "failed"}
+    assert s3.objects == {}
+
+
+def test_run_conversion_all_empty_is_success_without_output(aws):
+    s3 = aws({"collect/f1.json": []})
+    assert json.loads(convengine.run_conversion({"group": "group1"}, USER_SPEC)) == {"status": "success"}
+    assert s3.objects == {}
+
+
+def test_run_conversion_list_failure(aws):
+    aws({"collect/f1.json": []}, status_code=500)
+    assert json.loads(convengine.run_conversion({"group": "group1"}, USER_SPEC)) == {"status": "failed"}
+
+
+def test_run_conversion_invalid_input(aws):
+    aws({})
+    assert json.loads(convengine.run_conversion({"group": "group1", "basedate": "20250725"}, USER_SPEC)) == {"status": "failed"}
+    assert json.loads(convengine.run_conversion({}, USER_SPEC)) == {"status": "failed"}
+
+
+def test_normalize_spec_requires_name_and_table():
+    with pytest.raises(ValueError):
+        convengine.normalize_spec({"name": "x"})
+    with pytest.raises(ValueError):
+        convengine.normalize_spec({"name": "x", "targetdataname": "t", "empty_file": "ignore"})
+
+
+def test_run_conversion_removes_stale_split_files(aws):
+    s3 = aws({"collect/f1.json": [{"id": "1", "displayName": "d", "description": "x"}]})
+    prefix = "group1/convert/m365getgroup/date=20250725/"
+    # 前回実行時に分割出力されたファイル
+    s3.objects[prefix + "m365getgroup-00001.parquet"] = b"stale"
+    s3.objects["group1/convert/m365getgroup/date=20250724/m365getgroup-00001.parquet"] = b"other day"
+
+    spec = {"name": "m365convgroup", "targetdataname": "m365getgroup"}
+    assert json.loads(convengine.run_conversion({"group": "group1"}, spec)) == {"status": "success"}
+
+    assert sorted(k for k in s3.objects if k.startswith(prefix)) == [prefix + "m365getgroup.parquet"]
+    assert "group1/convert/m365getgroup/date=20250724/m365getgroup-00001.parquet" in s3.objects
+
+
+def test_rerun_removes_stale_schema_index_when_write_fails(aws, monkeypatch):
+    s3 = aws({"collect/f1.json": [{"id": "1", "displayName": "d", "description": "x"}]})
+    index_key = "group1/schemaindex/m365getgroup/date=20250725.json"
+    # 前回実行時の指紋（今回の出力とはスキーマが異なる）
+    s3.objects[index_key] = json.dumps({"fingerprint": "old"}).encode('utf-8')
+
+    def fail_write(*args, **kwargs):
+        raise RuntimeError("put failed")
+    monkeypatch.setattr(convengine, "write_schema_index", fail_write)
+    spec = {"name": "m365convgroup", "targetdataname": "m365getgroup"}
+    assert json.loads(convengine.run_conversion({"group": "group1"}, spec)) == {"status": "success"}
+    # 指紋の記録に失敗しても古い指紋は残らない（カタログ更新は Parquet から判定する）
+    assert index_key not in s3.objects
+
+
+CACHE_PREFIX = "group1/convcache/m365getuser/date=20250725/"
+EVENT = {"group": "group1", "basedate": "2025-07-25"}
+# 変換キャッシュは変換定義で有効にしたテーブルのみ使用する
+CACHED_SPEC = {**USER_SPEC, "cache": True}
+
+
+def _user(i):
+    return {"id": str(i), "userPrincipalName": f"u{i}@example.com", "surname": "s",
+            "givenName": "g", "displayName": f"user{i}"}
+
+
+def test_rerun_reuses_cached_fragments(aws):
+    s3 = aws({"collect/f1.json": [_user(1)], "collect/f2.json": [], "collect/f3.json": [_user(3)]})
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    first = _output(s3, "m365getuser")
+    manifest = json.loads(s3.objects[CACHE_PREFIX + "manifest.json"])
+    assert sorted(manifest["files"]) == ["collect/f1.json", "collect/f2.json", "collect/f3.json"]
+    assert manifest["files"]["collect/f2.json"]["fragment"] is None
+
+    # 再実行: ETag が変わらない収集ファイルは読み込まない
+    s3.collect_reads.clear()
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    assert s3.collect_reads == []
+    assert _output(s3, "m365getuser").equals(first)
+
+    # 1ファイルのみ更新: 更新されたファイルのみ読み込み、参照されなくなったフラグメントは削除
+    s3.collect_files["collect/f3.json"] = [_user(30)]
+    s3.lambda_client.etags["collect/f3.json"] = "etag-updated"
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    assert s3.collect_reads == ["collect/f3.json"]
+    assert _output(s3, "m365getuser").column("id").to_pylist() == ["1", "30"]
+    fragments = [k for k in s3.objects if k.startswith(CACHE_PREFIX + "fragments/")]
+    assert len(fragments) == 2
+
+
+def test_failed_run_keeps_processed_fragments_for_retry(aws):
+    s3 = aws({"collect/f1.json": [_user(1)], "collect/f2.json": Exception("throttled")})
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "failed"}
+    manifest = json.loads(s3.objects[CACHE_PREFIX + "manifest.json"])
+    assert list(manifest["files"]) == ["collect/f1.json"]
+
+    # リトライ: 失敗したファイルのみ読み込む
+    s3.collect_reads.clear()
+    s3.collect_files["collect/f2.json"] = [_user(2)]
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    assert s3.collect_reads == ["collect/f2.json"]
+    assert _output(s3, "m365getuser").column("id").to_pylist() == ["1", "2"]
+
+
+def test_spec_change_invalidates_cache(aws):
+    s3 = aws({"collect/f1.json": [_user(1)]})
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    s3.collect_reads.clear()
+
+    spec = {**CACHED_SPEC, "fill_null": {"surname": "none"}}
+    assert json.loads(convengine.run_conversion(EVENT, spec)) == {"status": "success"}
+    assert s3.collect_reads == ["collect/f1.json"]
+
+
+def test_cache_disabled(aws):
+    # 既定ではキャッシュを使用せず、フラグメント・マニフェストを出力しない
+    s3 = aws({"collect/f1.json": [_user(1)]})
+    assert json.loads(convengine.run_conversion(EVENT, USER_SPEC)) == {"status": "success"}
+    assert not any(k.startswith("group1/convcache/") for k in s3.objects)
+
+
+def test_successful_run_prunes_expired_cache_dates(aws):
+    # 基準日から保持日数（既定7日）より前の date= 配下のみ削除される
+    s3 = aws({"collect/f1.json": [_user(1)]})
+    old_keys = ["group1/convcache/m365getuser/date=20250717/manifest.json",
+                "group1/convcache/m365getuser/date=20250717/fragments/a-etag.parquet"]
+    kept_keys = ["group1/convcache/m365getuser/date=20250718/manifest.json",
+                 "group1/convcache/m365getuser2/date=20250101/manifest.json"]
+    for key in old_keys + kept_keys:
+        s3.objects[key] = b"{}"
+    assert json.loads(convengine.run_conversion(EVENT, CACHED_SPEC)) == {"status": "success"}
+    assert not any(key in s3.objects for key in old_keys)
+    assert all(key in s3.objects for key in kept_keys)
+    assert CACHE_PREFIX + "manifest.json" in s3.objects
@@ -0,0 +1,290 @@
+import io
+import os
+import sys
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import parquetio  # noqa: E402
+from m365lib.parquetio import (
+    S3RangeFile,
+    SplitParquetWriter,
+    StreamingParquetWriter,
+    conform_table,
+    delete_stale_parquet,
+    list_parquet_keys,
+    read_parquet_schema,
+)  # noqa: E402
+
+
+class FakeS3:
+    """put_object / マルチパートアップロードの呼び出しを記録するS3クライアント"""
+
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.calls = []
+        self.deleted = []
+        # 並行アップロード時の呼び出し記録の競合を防ぐ
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append('put_object')
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append('create_multipart_upload')
+        self.parts[Key] = {}
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.calls.append('upload_part')
+            self.parts[Key][PartNumber] = Body
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        assert numbers == sorted(self.parts[Key])
+        parts = self.parts.pop(Key)
+        self.objects[Key] = b''.join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        self.aborted.append(Key)
+        self.parts.pop(Key, None)
+
+    def get_paginator(self, name):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(k for k in objects if k.startswith(Prefix))
+                # 2ページに分けて返却
+                yield {'Contents': [{'Key': k} for k in keys[:1]]}
+                yield {'Contents': [{'Key': k} for k in keys[1:]]}
+
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.deleted.append(obj['Key'])
+            self.objects.pop(obj['Key'], None)
+
+
+def _read(body):
+    return pq.read_table(io.BytesIO(body))
+
+
+def test_small_output_uses_single_put():
+    s3 = FakeS3()
+    writer = StreamingParquetWriter(s3, 'bucket', 'out/t.parquet')
+    writer.write_table(pa.Table.from_pylist([{"id": "1"}, {"id": "2"}]))
+    writer.write_table(pa.Table.from_pylist([{"id": "3"}]))
+    result = writer.close()
+
+    assert result == {"s3_key": "out/t.parquet", "rows": 3}
+    assert s3.calls == ['put_object']
+    assert _read(s3.objects['out/t.parquet']).column("id").to_pylist() == ["1", "2", "3"]
+
+
+def test_large_output_uploads_parts_and_row_groups(monkeypatch):
+    monkeypatch.setattr(parquetio, 'MIN_PART_SIZE', 1024)
+    s3 = FakeS3()
+    writer = StreamingParquetWriter(s3, 'bucket', 'out/t.parquet', row_group_rows=100, part_size=1024)
+    for n in range(5):
+        writer.write_table(pa.Table.from_pylist([{"id": f"{n}-{i}", "v": f"value-{n}-{i:04d}" * 5} for i in range(100)]))
+    # 行グループを書き出すたびにパートが送信される（close前にアップロードが進んでいる）
+    assert s3.calls.count('upload_part') > 1
+    writer.close()
+
+    assert s3.calls[0] == 'create_multipart_upload'
+    assert s3.calls[-1] == 'complete_multipart_upload'
+    parquet_file = pq.ParquetFile(io.BytesIO(s3.objects['out/t.parquet']))
+    assert parquet_file.metadata.num_rows == 500
+    assert parquet_file.metadata.num_row_groups == 5
+
+
+def test_abort_discards_uploaded_parts(monkeypatch):
+    monkeypatch.setattr(parquetio, 'MIN_PART_SIZE', 1024)
+    s3 = FakeS3()
+    writer = StreamingParquetWriter(s3, 'bucket', 'out/t.parquet', row_group_rows=10, part_size=1024)
+    writer.write_table(pa.Table.from_pylist([{"v": f"value-{i:04d}" * 5} for i in range(100)]))
+    writer.abort()
+
+    assert writer.closed
+    assert s3.aborted == ['out/t.parquet']
+    assert 'out/t.parquet' not in s3.objects
+
+
+def test_close_without_rows_creates_no_object():
+    s3 = FakeS3()
+    writer = StreamingParquetWriter(s3, 'bucket', 'out/t.parquet')
+    writer.write_table(pa.Table.from_pylist([]))
+    assert writer.close()["rows"] == 0
+    assert s3.objects == {}
+
+
+def test_schema_from_first_table_accepts_later_values():
+    s3 = FakeS3()
+    writer = StreamingParquetWriter(s3, 'bucket', 'out/t.parquet')
+    # 最初のファイルは全件null（null型）、後続ファイルで値が入るケース
+    writer.write_table(pa.Table.from_pylist([{"id": "1", "description": None}]))
+    writer.write_table(pa.Table.from_pylist([{"id": "2", "description": "desc"}]))
+    writer.close()
+
+    table = _read(s3.objects['out/t.parquet'])
+    assert table.schema.field("description").type == pa.string()
+    assert table.column("description").to_pylist() == [None, "desc"]
+
+
+def test_conform_table_fills_missing_and_drops_extra_columns():
+    schema = pa.schema([("id", pa.string()), ("description", pa.string())])
+    table = conform_table(pa.Table.from_pylist([{"id": "1", "extra": 1}]), schema)
+    assert table.schema == schema
+    assert table.column("description").to_pylist() == [None]
+
+
+def _rows(n, count):
+    return pa.Table.from_pylist([{"id": f"{n}-{i}", "v": f"value-{n}-{i:04d}" * 5} for i in range(count)])
+
+
+def test_conform_table_keeps_dictionary_columns():
+    # 出力スキーマが辞書型の列は辞書エンコードのまま、値の型が異なる場合も辞書の値のみを変換する
+    schema = pa.schema([("base_date", pa.dictionary(pa.int32(), pa.date32())),
+                        ("name", pa.dictionary(pa.int32(), pa.string()))])
+    base_date = pa.DictionaryArray.from_arrays(pa.array([0, 0], pa.int32()), pa.array(["2025-07-25"]))
+    table = conform_table(pa.table({"base_date": base_date, "name": ["a", "b"]}), schema)
+    assert table.schema == schema
+    assert len(table.column("base_date").chunk(0).dictionary) == 1
+    assert table.column("name").to_pylist() == ["a", "b"]
+
+
+def test_split_writer_rolls_files_by_target_size(monkeypatch):
+    monkeypatch.setattr(parquetio, 'MIN_PART_SIZE', 1024)
+    s3 = FakeS3()
+    writer = SplitParquetWriter(s3, 'bucket', 'out/date=20250725/', 't',
+                                target_file_size=4096, upload_workers=3,
+                                row_group_rows=100, part_size=1024)
+    for n in range(6):
+        writer.write_table(_rows(n, 100))
+    result = writer.close()
+
+    assert result['rows'] == 600
+    assert result['s3_keys'][0] == 'out/date=20250725/t.parquet'
+    assert result['s3_keys'][1] == 'out/date=20250725/t-00001.parquet'
+    assert len(result['s3_keys']) > 1
+    total = 0
+    for key in result['s3_keys']:
+        table = _read(s3.objects[key])
+        assert table.column_names == ["id", "v"]
+        total += table.num_rows
+    assert total == 600
+
+
+def test_split_writer_single_file_when_small():
+    s3 = FakeS3()
+    writer = SplitParquetWriter(s3, 'bucket', 'out/date=20250725/', 't')
+    writer.write_table(_rows(0, 10))
+    assert writer.close() == {"s3_keys": ['out/date=20250725/t.parquet'], "rows": 10}
+    assert s3.calls == ['put_object']
+
+
+def test_split_writer_keeps_columns_added_and_widened_in_later_files():
+    s3 = FakeS3()
+    writer = SplitParquetWriter(s3, 'bucket', 'out/date=20250725/', 't')
+    # 2ファイル目で列が追加され（mail）、型が広がる（code: int → string、score: int → double）
+    writer.write_table(pa.Table.from_pylist([{"id": "1", "code": 1, "score": 1}]))
+    writer.write_table(pa.Table.from_pylist([{"id": "2", "code": "A-2", "score": 2.5, "mail": "b@example.com"}]))
+    writer.write_table(pa.Table.from_pylist([{"id": "3", "code": 3, "score": 3}]))
+    result = writer.close()
+
+    assert result == {"s3_keys": ['out/date=20250725/t.parquet', 'out/date=20250725/t-00001.parquet'],
+                      "rows": 3}
+    first = _read(s3.objects['out/date=20250725/t.parquet'])
+    assert first.column_names == ["id", "code", "score"]
+    second = _read(s3.objects['out/date=20250725/t-00001.parquet'])
+    assert second.schema == pa.schema([("id", pa.string()), ("code", pa.string()),
+                                       ("score", pa.float64()), ("mail", pa.string())])
+    assert second.column("code").to_pylist() == ["A-2", "3"]
+    assert second.column("mail").to_pylist() == ["b@example.com", None]
+    assert writer.schema == second.schema
+
+
+def test_split_writer_abort_discards_all_files(monkeypatch):
+    monkeypatch.setattr(parquetio, 'MIN_PART_SIZE', 1024)
+    s3 = FakeS3()
+    writer = SplitParquetWriter(s3, 'bucket', 'out/', 't', target_file_size=4096,
+                                row_group_rows=100, part_size=1024)
+    for n in range(3):
+        writer.write_table(_rows(n, 100))
+    writer.abort()
+
+    assert writer.closed
+    assert s3.aborted
+    assert s3.parts == {}
+
+
+def test_list_and_delete_stale_parquet():
+    s3 = FakeS3()
+    for key in ['p/t.parquet', 'p/t-00001.parquet', 'p/t-00002.parquet', 'p/_SUCCESS', 'q/t.parquet']:
+        s3.objects[key] = b''
+    assert list_parquet_keys(s3, 'bucket', 'p/') == ['p/t-00001.parquet', 'p/t-00002.parquet', 'p/t.parquet']
+
+    stale = delete_stale_parquet(s3, 'bucket', 'p/', ['p/t.parquet', 'p/t-00001.parquet'])
+    assert stale == ['p/t-00002.parquet']
+    assert sorted(s3.objects) == ['p/_SUCCESS', 'p/t-00001.parquet', 'p/t.parquet', 'q/t.parquet']
+
+
+def test_read_parquet_schema_reads_footer_by_range(monkeypatch):
+    table = pa.table({f"c{i}": pa.array([i] * 1000) for i in range(40)})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    data = buffer.getvalue()
+    ranges = []
+
+    class RangeS3:
+        def get_object(self, Bucket, Key, Range):
+            ranges.append(Range)
+            return {'Body': io.BytesIO(data[int(Range.split('=')[1]):])}
+
+    # 初回の取得範囲にフッターが収まらない場合はフッター長分を取得し直す
+    monkeypatch.setattr(parquetio, 'FOOTER_READ_SIZE', 64)
+    schema = read_parquet_schema(RangeS3(), 'bucket', 'p/t.parquet')
+    assert schema.names == table.schema.names
+    assert len(ranges) == 2 and ranges[0] == 'bytes=-64'
+    assert int(ranges[1].split('-')[1]) < len(data)
+
+
+def test_s3_range_file_reads_row_groups_by_range():
+    table = pa.table({f"c{i}": pa.array(range(40000)) for i in range(6)})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=10000)
+    data = buffer.getvalue()
+    ranges = []
+
+    class RangeS3:
+        def head_object(self, Bucket, Key):
+            return {'ContentLength': len(data)}
+
+        def get_object(self, Bucket, Key, Range):
+            start, end = (int(n) for n in Range.split('=')[1].split('-'))
+            ranges.append(end - start + 1)
+            return {'Body': io.BytesIO(data[start:end + 1])}
+
+    parquet_file = pq.ParquetFile(S3RangeFile(RangeS3(), 'bucket', 'p/t.parquet'))
+    batches = parquet_file.iter_batches(batch_size=10000, columns=['c0', 'c3'])
+    assert next(batches).column('c3').to_pylist()[:2] == [0, 1]
+    # 先頭の行グループの対象列のみ取得している
+    assert sum(ranges) < len(data) / 6
+    assert sum(batch.num_rows for batch in batches) == 30000
+    # 対象外の列は取得しない
+    assert sum(ranges) < len(data) / 2
@@ -0,0 +1,211 @@
+import datetime
+import io
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import parquetio, pgcopy  # noqa: E402
+
+COLUMNS = [("id", "uuid"), ("displayname", "text"), ("from_datetime", "timestamp"), ("base_date", "date")]
+MAPPING = [(name, name, udt_name) for name, udt_name in COLUMNS]
+ID = "6f1c1f0e-3c57-4d4c-9a43-0c6f7b0f9a11"
+
+
+class FakeCopy:
+    def __init__(self):
+        self.types = None
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy(self, sql):
+        self.conn.sql = sql
+        return self.conn.copy_obj
+
+
+class FakeConn:
+    def __init__(self):
+        self.copy_obj = FakeCopy()
+        self.sql = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.reads = []
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.reads.append((Key, Range) if Range else Key)
+        data = self.objects[Key]
+        if Range:
+            start, end = Range.split("=")[1].split("-")
+            data = data[int(start):int(end) + 1] if start else data[-int(end):]
+        return {'Body': io.BytesIO(data)}
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+
+def _parquet(table, row_group_size=None):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=row_group_size)
+    return buffer.getvalue()
+
+
+def _table(ids):
+    return pa.table({
+        "id": pa.array(ids, pa.string()),
+        "displayname": pa.array([f"name{i}" for i in range(len(ids))], pa.string()),
+        "from_datetime": pa.array([datetime.datetime(2025, 7, 25)] * len(ids), pa.timestamp("ms")),
+        "base_date": pa.array([datetime.date(2025, 7, 25)] * len(ids), pa.date32()),
+    })
+
+
+def test_copy_batches_writes_typed_rows():
+    conn = FakeConn()
+    batches = _table([ID, None]).to_batches()
+    rows = pgcopy.copy_batches(conn, "m365", "m365getgroup", MAPPING, batches)
+
+    assert rows == 2
+    assert conn.sql.as_string(None) == ('COPY "m365"."m365getgroup" ("id", "displayname", "from_datetime", '
+                                        '"base_date") FROM STDIN (FORMAT BINARY)')
+    assert conn.copy_obj.types == ["uuid", "text", "timestamp", "date"]
+    assert conn.copy_obj.rows[0] == (uuid.UUID(ID), "name0", datetime.datetime(2025, 7, 25),
+                                     datetime.date(2025, 7, 25))
+    assert conn.copy_obj.rows[1][0] is None
+
+
+def test_batch_to_columns_casts_to_table_types():
+    batch = pa.record_batch({"n": pa.array(["1", "2"]), "d": pa.array(["2025-07-25", None])})
+    values = pgcopy.batch_to_columns(batch, [("n", "n", "int8"), ("d", "d", "date")])
+    assert values == [[1, 2], [datetime.date(2025, 7, 25), None]]
+
+
+def test_build_column_mapping_matches_by_normalized_name():
+    table_columns = [("id", "uuid"), ("display_name", "text"), ("userPrincipalName", "text"),
+                     ("note", "text"), ("base_date", "date")]
+    mapping = pgcopy.build_column_mapping(["base_date", "displayName", "userprincipalname", "id", "extra"],
+                                          table_columns)
+    # テーブルの列順で対応付け、データにない列（note）・テーブルにない列（extra）は除外
+    assert mapping == [("id", "id", "uuid"), ("displayName", "display_name", "text"),
+                       ("userprincipalname", "userPrincipalName", "text"), ("base_date", "base_date", "date")]
+
+
+def test_build_column_mapping_without_common_columns():
+    with pytest.raises(ValueError):
+        pgcopy.build_column_mapping(["foo"], COLUMNS)
+
+
+def test_open_parquet_source_projects_mapped_columns():
+    table = _table([ID] * 3).rename_columns(["id", "displayName", "from_datetime", "base_date"])
+    table = table.append_column("extra", pa.array([1, 2, 3]))
+    s3 = FakeS3({"t/t.parquet": _parquet(table)})
+    mapping, batches = pgcopy.open_parquet_source(s3, "bucket", ["t/t.parquet"],
+                                                  [("base_date", "date"), ("id", "uuid"), ("display_name", "text")])
+
+    assert mapping == [("base_date", "base_date", "date"), ("id", "id", "uuid"),
+                       ("displayName", "display_name", "text")]
+    # スキーマはフッターのみの範囲取得で読み込む
+    assert s3.reads == [("t/t.parquet", f"bytes=-{parquetio.FOOTER_READ_SIZE}")]
+    batch = next(batches)
+    assert batch.schema.names == ["base_date", "id", "displayName"]
+    assert pgcopy.batch_to_columns(batch, mapping)[1] == [uuid.UUID(ID)] * 3
+
+
+def test_columns_cache_per_table():
+    conn = type("Conn", (), {"info": type("Info", (), {"host": "db", "dbname": "m365"})()})()
+    assert pgcopy.get_cached_columns(conn, "m365", "cached") is None
+    pgcopy.cache_columns(conn, "m365", "cached", COLUMNS)
+    assert pgcopy.get_cached_columns(conn, "m365", "cached") == COLUMNS
+    assert pgcopy.get_cached_columns(conn, "m365", "other") is None
+    pgcopy.invalidate_columns(conn, "m365", "cached")
+    assert pgcopy.get_cached_columns(conn, "m365", "cached") is None
+
+
+def test_iter_parquet_batches_reads_files_in_batches():
+    s3 = FakeS3({"t/t.parquet": _parquet(_table([ID] * 5), row_group_size=2),
+                 "t/t-00001.parquet": _parquet(_table([ID] * 3))})
+    batches = pgcopy.iter_parquet_batches(s3, "bucket", ["t/t.parquet", "t/t-00001.parquet"], batch_size=2)
+
+    first = next(batches)
+    assert first.num_rows == 2
+    # 次のファイルはバッチを消費するまで読み込まない
+    assert s3.reads == ["t/t.parquet"]
+    assert [b.num_rows for b in batches] == [2, 1, 2, 1]
+    assert s3.reads == ["t/t.parquet", "t/t-00001.parquet"]
+
+
+def test_temporal_columns_decoded_via_unique_values():
+    day = datetime.date(2025, 7, 25)
+    batch = pa.record_batch({"d": pa.array([day, None, day, datetime.date(2025, 7, 26)], pa.date32())})
+    values = pgcopy.batch_to_columns(batch, [("d", "d", "date")])
+    assert values == [[day, None, day, datetime.date(2025, 7, 26)]]
+
+
+def test_prefetcher_reads_one_file_ahead_across_sources():
+    keys = ["t/date=1/t.parquet", "t/date=1/t-00001.parquet", "t/date=2/t.parquet"]
+    s3 = FakeS3({key: _parquet(_table([ID] * 2)) for key in keys})
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = pgcopy.ParquetPrefetcher(s3, "bucket", keys, executor)
+        mapping, batches = pgcopy.open_parquet_source(s3, "bucket", keys[:2], COLUMNS, prefetcher=prefetcher)
+        assert [b.num_rows for b in batches] == [2, 2]
+        # 1日目の最終ファイルの読み込み時に、2日目の先頭ファイルの取得を開始している
+        executor.shutdown(wait=True)
+        assert s3.reads == keys
+        assert set(prefetcher._futures) == {keys[2]}
+        _, batches = pgcopy.open_parquet_source(s3, "bucket", keys[2:], COLUMNS, prefetcher=prefetcher)
+        assert [b.num_rows for b in batches] == [2]
+    # スキーマ取得を含め、各ファイルの取得は1回のみ
+    assert s3.reads == keys
+    assert prefetcher._futures == {}
+
+
+def test_large_files_are_read_by_row_group(monkeypatch):
+    # メモリ上限の半分を超えるファイルは一括で読み込まず、範囲取得で読み込む
+    monkeypatch.setattr(pgcopy, 'COPY_MEMORY_LIMIT', 1024)
+    data = _parquet(_table([ID] * 3000), row_group_size=1000)
+    s3 = FakeS3({"t/t.parquet": data})
+    mapping, batches = pgcopy.open_parquet_source(s3, "bucket", ["t/t.parquet"], COLUMNS[:2], batch_size=1000)
+    assert [b.num_rows for b in batches] == [1000, 1000, 1000]
+    assert s3.reads and all(isinstance(read, tuple) for read in s3.reads)
+
+
+def test_small_files_are_read_at_once():
+    s3 = FakeS3({"t/t.parquet": _parquet(_table([ID] * 30), row_group_size=10)})
+    batches = pgcopy.iter_parquet_batches(s3, "bucket", ["t/t.parquet"], batch_size=10, columns=["id"])
+    assert [b.num_rows for b in batches] == [10, 10, 10]
+    assert s3.reads == ["t/t.parquet"]
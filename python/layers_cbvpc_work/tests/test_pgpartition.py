@@ -0,0 +1,86 @@
+import datetime
+import os
+import sys
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import pgpartition  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, partitions=()):
+        self.partitions = partitions
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        query = query if isinstance(query, str) else query.as_string(None)
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return [(name,) for name in self.partitions]
+
+
+class FakeConn:
+    def __init__(self, partitions=()):
+        self.cur = FakeCursor(partitions)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_partition_name_and_date():
+    assert pgpartition.partition_name("m365getuser", "2025-07-25") == "m365getuser_p20250725"
+    assert pgpartition.partition_date("m365getuser", "m365getuser_p20250725") == datetime.date(2025, 7, 25)
+    assert pgpartition.partition_date("m365getuser", "m365getuser_default") is None
+    assert pgpartition.partition_date("m365getuser", "m365getgroup_p20250725") is None
+
+
+def test_attach_partition_uses_next_day_as_upper_bound():
+    conn = FakeConn()
+    pgpartition.attach_partition(conn, "m365", "m365getuser", "m365getuser_p20251231", "2025-12-31")
+    attach, drop = [query for query, _ in conn.cur.executed]
+    assert attach == ('ALTER TABLE "m365"."m365getuser" ATTACH PARTITION "m365"."m365getuser_p20251231" '
+                      "FOR VALUES FROM ('2025-12-31'::date) TO ('2026-01-01'::date)")
+    assert drop == 'ALTER TABLE "m365"."m365getuser_p20251231" DROP CONSTRAINT "m365getuser_p20251231_range"'
+
+
+@pytest.mark.parametrize("action, statements", [("detach", 1), ("drop", 2)])
+def test_apply_retention_detaches_expired_partitions(action, statements):
+    conn = FakeConn(["t_p20250620", "t_p20250625", "t_p20250626", "t_p20250725", "t_default"])
+    retired = pgpartition.apply_retention(conn, "m365", "t", "2025-07-25", days=30, action=action)
+    assert retired == ["t_p20250620", "t_p20250625"]
+    queries = [query for query, _ in conn.cur.executed[1:]]
+    assert len(queries) == len(retired) * statements + 1
+    assert queries[0] == 'ALTER TABLE "m365"."t" DETACH PARTITION "m365"."t_p20250620"'
+    assert conn.cur.executed[-1] == ('DELETE FROM "m365"."load_ledger" WHERE table_name = %s AND base_date < %s',
+                                     ("t", datetime.date(2025, 6, 26)))
+
+
+def test_apply_retention_disabled():
+    conn = FakeConn(["t_p20200101"])
+    assert pgpartition.apply_retention(conn, "m365", "t", "2025-07-25", days=0) == []
+    assert conn.cur.executed == []
+
+
+def test_ensure_ledger_runs_once_per_schema(monkeypatch):
+    monkeypatch.setattr(pgpartition, '_LEDGER_READY', set())
+    conn = FakeConn()
+    pgpartition.ensure_ledger(conn, "m365")
+    pgpartition.ensure_ledger(conn, "m365")
+    assert len(conn.cur.executed) == 1 and conn.commits == 1
+    assert conn.cur.executed[0][0].startswith('CREATE TABLE IF NOT EXISTS "m365"."load_ledger"')
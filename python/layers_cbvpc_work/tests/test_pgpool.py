@@ -0,0 +1,102 @@
+import os
+import sys
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from psycopg import pq  # noqa: E402
+from m365lib import pgpool  # noqa: E402
+
+
+class FakePool:
+    created = []
+
+    def __init__(self, conninfo, **kwargs):
+        self.conninfo = conninfo
+        self.kwargs = kwargs
+        self.max_size = kwargs['max_size']
+        self.closed = False
+        FakePool.created.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    FakePool.created = []
+    monkeypatch.setattr(pgpool, 'ConnectionPool', FakePool)
+    FakePool.check_connection = staticmethod(lambda conn: None)
+    pgpool._POOLS.clear()
+    yield FakePool
+    pgpool._POOLS.clear()
+
+
+def test_get_pool_reuses_pool_across_invocations(fake_pool):
+    first = pgpool.get_pool('user', 'pw', 'db.example', 'm365')
+    second = pgpool.get_pool('user', 'pw', 'db.example', 'm365')
+    assert first is second
+    assert len(fake_pool.created) == 1
+    assert first.kwargs['connection_class'] is pgpool.TimedConnection
+    assert 'port=5432' in first.conninfo
+
+
+def test_get_pool_recreates_on_credential_change(fake_pool):
+    first = pgpool.get_pool('user', 'pw', 'db.example', 'm365')
+    second = pgpool.get_pool('user', 'rotated', 'db.example', 'm365')
+    assert first is not second
+    assert first.closed
+    # 接続先が異なる場合は別のプール
+    other = pgpool.get_pool('user', 'rotated', 'db.example', 'other')
+    assert other is not second and not second.closed
+
+
+def test_close_pools(fake_pool):
+    pool = pgpool.get_pool('user', 'pw', 'db.example', 'm365')
+    pgpool.close_pools()
+    assert pool.closed
+    assert pgpool._POOLS == {}
+
+
+class FakeInfo:
+    host = 'db.example'
+
+
+class FakePGconn:
+    ssl_in_use = 1
+    # 後始末（__del__）で閉じ済みとして扱われるようにする
+    status = pq.ConnStatus.BAD
+
+
+def test_timed_connection_records_connect_time(monkeypatch):
+    created = []
+
+    def fake_connect(cls, conninfo="", **kwargs):
+        conn = object.__new__(cls)
+        conn.pgconn = FakePGconn()
+        created.append((conninfo, kwargs))
+        return conn
+
+    # 親クラス（psycopg.Connection）の公開 API の connect を置き換える
+    monkeypatch.setattr(pgpool.psycopg.Connection, 'connect', classmethod(fake_connect))
+    monkeypatch.setattr(pgpool.TimedConnection, 'info', FakeInfo(), raising=False)
+    clock = iter([10.0, 10.8])
+    monkeypatch.setattr(pgpool.time, 'perf_counter', lambda: next(clock))
+
+    conn = pgpool.TimedConnection.connect("host=db.example", autocommit=True)
+    assert isinstance(conn, pgpool.TimedConnection)
+    assert created == [("host=db.example", {"autocommit": True})]
+    assert conn.connect_seconds == pytest.approx(0.8)
+
+
+def test_timed_connection_failure_propagates(monkeypatch):
+    def fake_connect(cls, conninfo="", **kwargs):
+        raise pgpool.psycopg.OperationalError("password authentication failed")
+
+    monkeypatch.setattr(pgpool.psycopg.Connection, 'connect', classmethod(fake_connect))
+    with pytest.raises(pgpool.psycopg.OperationalError, match="password authentication failed"):
+        pgpool.TimedConnection.connect("host=db.example")
@@ -0,0 +1,76 @@
+import os
+import sys
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import pgpostload  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query if isinstance(query, str) else query.as_string(None), params))
+
+    def fetchall(self):
+        return self.indexes
+
+
+class FakeConn:
+    def __init__(self, indexes=()):
+        self.cur = FakeCursor(list(indexes))
+
+    def cursor(self):
+        return self.cur
+
+
+def test_build_partition_indexes_from_parent_definitions():
+    conn = FakeConn([
+        ("m365getuser_pkey", "CREATE UNIQUE INDEX m365getuser_pkey ON ONLY m365.m365getuser "
+         "USING btree (id, base_date)", "PRIMARY KEY (id, base_date)"),
+        ("m365getuser_upn_idx", 'CREATE INDEX m365getuser_upn_idx ON ONLY m365.m365getuser '
+         'USING btree ("userPrincipalName") WHERE (surname IS NOT NULL)', None),
+        ("m365getuser_name_key", "CREATE UNIQUE INDEX m365getuser_name_key ON ONLY m365.m365getuser "
+         "USING btree (\"displayName\", base_date)", None),
+    ])
+    built = pgpostload.build_partition_indexes(conn, "m365", "m365getuser", "m365getuser_p20250725")
+
+    assert built == ["m365getuser_pkey", "m365getuser_upn_idx", "m365getuser_name_key"]
+    assert conn.cur.executed == [
+        (pgpostload.INDEXES_QUERY, ("m365.m365getuser",)),
+        ('ALTER TABLE "m365"."m365getuser_p20250725" ADD PRIMARY KEY (id, base_date)', None),
+        ('CREATE INDEX ON "m365"."m365getuser_p20250725" USING btree ("userPrincipalName") '
+         'WHERE (surname IS NOT NULL)', None),
+        ('CREATE UNIQUE INDEX ON "m365"."m365getuser_p20250725" USING btree ("displayName", base_date)', None),
+    ]
+
+
+def test_build_partition_indexes_without_indexes():
+    conn = FakeConn()
+    assert pgpostload.build_partition_indexes(conn, "m365", "t", "t_p20250725") == []
+    assert len(conn.cur.executed) == 1
+
+
+def test_build_partition_indexes_rejects_unknown_definition():
+    conn = FakeConn([("odd", "CREATE INDEX odd ON m365.t", None)])
+    with pytest.raises(ValueError):
+        pgpostload.build_partition_indexes(conn, "m365", "t", "t_p20250725")
+
+
+def test_analyze_table():
+    conn = FakeConn()
+    pgpostload.analyze_table(conn, "m365", "t_p20250725")
+    assert conn.cur.executed == [('ANALYZE "m365"."t_p20250725"', None)]
@@ -0,0 +1,203 @@
+import datetime
+import io
+import os
+import sys
+import threading
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg_pool import PoolTimeout
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import pgsplit  # noqa: E402
+
+MAPPING = [("id", "id", "int8"), ("displayName", "display_name", "text"), ("base_date", "base_date", "date")]
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranges = []
+        self.lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = Range.split("=")[1].split("-")
+        data = self.objects[Key]
+        with self.lock:
+            self.ranges.append((Key, Range))
+        return {'Body': io.BytesIO(data[int(start):int(end) + 1] if start else data[-int(end):])}
+
+
+class FakeCopy:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_types(self, types):
+        pass
+
+    def write_row(self, row):
+        if self.conn.error:
+            raise self.conn.error
+        self.conn.rows.append(row)
+        time.sleep(0.0005)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy(self, statement):
+        self.conn.statements.append(statement.as_string(None))
+        return FakeCopy(self.conn)
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append(statement.as_string(None))
+
+
+class FakeConn:
+    def __init__(self, error=None):
+        self.error = error
+        self.rows = []
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.threads = set()
+
+    def cursor(self):
+        self.threads.add(threading.get_ident())
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self, connections):
+        self.connections = list(connections)
+        self.returned = []
+
+    def connection(self, timeout=None):
+        pool = self
+
+        class Context:
+            def __enter__(self):
+                if not pool.connections:
+                    raise PoolTimeout("no connection")
+                self.conn = pool.connections.pop(0)
+                return self.conn
+
+            def __exit__(self, *exc):
+                pool.returned.append(self.conn)
+                return False
+
+        return Context()
+
+
+def _parquet(rows, row_group_size):
+    table = pa.table({"id": pa.array(range(rows), pa.int64()),
+                      "displayName": pa.array([f"name{i}" for i in range(rows)]),
+                      "base_date": pa.array([datetime.date(2025, 7, 25)] * rows, pa.date32())})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=row_group_size)
+    return buffer.getvalue()
+
+
+KEYS = ["t/date=20250725/t.parquet", "t/date=20250725/t-00001.parquet"]
+
+
+def _s3():
+    return FakeS3({KEYS[0]: _parquet(400, 100), KEYS[1]: _parquet(200, 100)})
+
+
+def test_plan_split_copy_lists_row_groups():
+    plan = pgsplit.plan_split_copy(_s3(), "bucket", KEYS, splits=3, min_rows=1)
+    assert plan["splits"] == 3 and plan["rows"] == 600
+    assert plan["names"] == ["id", "displayName", "base_date"]
+    assert [(key, index, rows) for key, _, index, rows in plan["units"]] == \
+        [(KEYS[0], i, 100) for i in range(4)] + [(KEYS[1], i, 100) for i in range(2)]
+
+
+def test_plan_split_copy_skips_small_tables():
+    assert pgsplit.plan_split_copy(_s3(), "bucket", KEYS, splits=1, min_rows=1) is None
+    assert pgsplit.plan_split_copy(_s3(), "bucket", KEYS, splits=4, min_rows=1000) is None
+
+
+def test_distribute_units_balances_rows():
+    units = [("a", 0, 0, 50), ("a", 0, 1, 10), ("a", 0, 2, 40), ("b", 0, 0, 30), ("b", 0, 1, 20)]
+    shares = pgsplit.distribute_units(units, 2)
+    assert sorted(sum(unit[3] for unit in share) for share in shares) == [70, 80]
+    # 各接続内はファイル・行グループ順
+    assert all(share == sorted(share, key=units.index) for share in shares)
+    assert len(pgsplit.distribute_units(units[:1], 3)) == 1
+
+
+def test_split_copy_loads_row_groups_over_connections():
+    s3 = _s3()
+    plan = pgsplit.plan_split_copy(s3, "bucket", KEYS, splits=3, min_rows=1)
+    conn = FakeConn()
+    helpers = [FakeConn(), FakeConn()]
+    pool = FakePool(helpers)
+    rows = pgsplit.split_copy(conn, pool, s3, "bucket", plan, MAPPING, "m365", "m365getgroup_stg")
+
+    assert rows == 600
+    loaded = [conn] + helpers
+    assert [len(c.rows) for c in loaded] == [200, 200, 200]
+    assert sorted(row[0] for c in loaded for row in c.rows) == sorted(list(range(400)) + list(range(200)))
+    assert all(c.commits == 1 for c in loaded)
+    assert all(c.statements == ['COPY "m365"."m365getgroup_stg" ("id", "display_name", "base_date") '
+                                'FROM STDIN (FORMAT BINARY)'] for c in loaded)
+    # 借りた接続は別スレッドで COPY し、終了後にプールへ返す
+    assert len({thread for c in loaded for thread in c.threads}) == 3
+    assert sorted(map(id, pool.returned)) == sorted(map(id, helpers))
+
+
+def test_split_copy_uses_available_connections_only():
+    s3 = _s3()
+    plan = pgsplit.plan_split_copy(s3, "bucket", KEYS, splits=4, min_rows=1)
+    conn = FakeConn()
+    helper = FakeConn()
+    rows = pgsplit.split_copy(conn, FakePool([helper]), s3, "bucket", plan, MAPPING, "m365", "t_stg")
+    assert rows == 600
+    assert len(conn.rows) == 300 and len(helper.rows) == 300
+
+
+def test_split_copy_failure_raises():
+    s3 = _s3()
+    plan = pgsplit.plan_split_copy(s3, "bucket", KEYS, splits=2, min_rows=1)
+    helper = FakeConn(error=RuntimeError("copy failed"))
+    pool = FakePool([helper])
+    try:
+        pgsplit.split_copy(FakeConn(), pool, s3, "bucket", plan, MAPPING, "m365", "t_stg")
+        raise AssertionError("例外が発生しない")
+    except RuntimeError as e:
+        assert str(e) == "copy failed"
+    assert helper.commits == 0 and pool.returned == [helper]
+
+
+def test_drop_split_target():
+    conn = FakeConn()
+    pgsplit.drop_split_target(conn, "m365", "t_stg")
+    assert conn.statements == ['DROP TABLE IF EXISTS "m365"."t_stg"'] and conn.commits == 1
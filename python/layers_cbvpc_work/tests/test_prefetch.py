@@ -0,0 +1,49 @@
+import os
+import sys
+import threading
+import time
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib.prefetch import prefetch_map  # noqa: E402
+
+
+def test_prefetch_map_keeps_input_order():
+    def fn(i):
+        # 後の要素ほど早く完了させても入力順で返ること
+        time.sleep((10 - i) * 0.002)
+        return i * 10
+    results = [(item, result) for item, result, _ in prefetch_map(fn, range(10), max_workers=4)]
+    assert results == [(i, i * 10) for i in range(10)]
+
+
+def test_prefetch_map_per_item_error():
+    def fn(i):
+        if i == 2:
+            raise ValueError("broken file")
+        return i
+    results = list(prefetch_map(fn, range(4), max_workers=2))
+    assert [r[1] for r in results] == [0, 1, None, 3]
+    assert isinstance(results[2][2], ValueError)
+    assert results[0][2] is None
+
+
+def test_prefetch_map_bounded_concurrency():
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def fn(i):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.005)
+        with lock:
+            state["running"] -= 1
+        return i
+
+    assert len(list(prefetch_map(fn, range(30), max_workers=3))) == 30
+    assert state["peak"] <= 3
@@ -0,0 +1,82 @@
+import os
+import sys
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import runcontext  # noqa: E402
+
+
+class DummyBody:
+    def __init__(self, data: bytes):
+        self._b = data
+    def read(self):
+        return self._b
+
+
+class CountingS3:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"v1"'
+        self.calls = 0
+    def head_object(self, Bucket, Key):
+        return {"ETag": self.etag}
+    def get_object(self, Bucket, Key):
+        self.calls += 1
+        return {"Body": DummyBody(self.body), "ETag": self.etag}
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    runcontext.clear_cache()
+    yield
+    runcontext.clear_cache()
+
+
+def test_parse_basedatetime_csv():
+    ctx = runcontext.parse_basedatetime_csv(
+        b"base,from,to\n2025-07-25,2025-07-25 00:00,2025-07-25 23:59\n")
+    assert ctx == {"basedate": "2025-07-25",
+                   "fromtimestamp": "2025-07-25 00:00",
+                   "totimestamp": "2025-07-25 23:59"}
+
+
+def test_parse_basedatetime_csv_base_only():
+    ctx = runcontext.parse_basedatetime_csv(b"base\n2025-07-25\n")
+    assert ctx["fromtimestamp"] == "2025-07-25 00:00"
+    assert ctx["totimestamp"] == "2025-07-25 23:59"
+
+
+def test_load_run_context_cached_while_etag_unchanged():
+    s3 = CountingS3(b"base\n2025-07-25\n")
+    for _ in range(5):
+        assert runcontext.load_run_context(s3, 'bucket')['basedate'] == '2025-07-25'
+    assert s3.calls == 1
+
+
+def test_load_run_context_reloads_when_basedatetime_updated():
+    s3 = CountingS3(b"base\n2025-07-25\n")
+    assert runcontext.load_run_context(s3, 'bucket')['basedate'] == '2025-07-25'
+    # ウォームスタート中に basedatetime.csv が更新された場合は新しい基準日を返す
+    s3.body = b"base\n2025-07-26\n"
+    s3.etag = '"v2"'
+    assert runcontext.load_run_context(s3, 'bucket')['basedate'] == '2025-07-26'
+    assert s3.calls == 2
+
+
+def test_resolve_run_context_explicit_event_skips_s3():
+    s3 = CountingS3(b"base\n2025-07-25\n")
+    ctx = runcontext.resolve_run_context({"basedate": "2025-07-01"}, s3, 'bucket')
+    assert ctx["basedate"] == "2025-07-01"
+    assert s3.calls == 0
+
+
+def test_resolve_run_context_na_reads_s3():
+    s3 = CountingS3(b"base\n2025-07-25\n")
+    ctx = runcontext.resolve_run_context({"basedate": "na"}, s3, 'bucket')
+    assert ctx["basedate"] == "2025-07-25"
+    assert s3.calls == 1
@@ -0,0 +1,138 @@
+import datetime
+import io
+import json
+import os
+import sys
+import pyarrow as pa
+import pytest
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib import schema as schema_mod  # noqa: E402
+from m365lib.arrowconv import append_constant_columns  # noqa: E402
+from m365lib.schema import build_schema, cast_to_schema, load_table_schema  # noqa: E402
+
+# UpdateType の型定義ファイル（S3 の datatype/updatetype.json に配置される）
+UPDATETYPE_JSON = os.path.join(os.path.dirname(os.path.dirname(CURRENT_DIR)),
+                               'UpdateType', 'conf', 'updatetype.json')
+
+
+class FakeS3:
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"v1"'
+        self.get_calls = 0
+
+    def head_object(self, Bucket, Key):
+        assert Key == schema_mod.TYPE_DEFINITION_KEY
+        return {'ETag': self.etag}
+
+    def get_object(self, Bucket, Key):
+        self.get_calls += 1
+        assert Key == schema_mod.TYPE_DEFINITION_KEY
+        return {'Body': io.BytesIO(self.body), 'ETag': self.etag}
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    schema_mod.clear_cache()
+    yield
+    schema_mod.clear_cache()
+
+
+def _updatetype_body():
+    with open(UPDATETYPE_JSON, 'rb') as f:
+        return f.read()
+
+
+def test_all_updatetype_definitions_build_schema():
+    for config in json.loads(_updatetype_body()):
+        schema = build_schema(config['columns'])
+        # パーティションキーはファイル内の列に含めない
+        assert 'date' not in schema.names
+
+
+def test_load_table_schema_uses_cache():
+    s3 = FakeS3(_updatetype_body())
+    schema = load_table_schema(s3, 'bucket', 'm365getuser')
+    assert schema.field('base_date').type == pa.date32()
+    assert schema.field('from_datetime').type == pa.timestamp('ms')
+    load_table_schema(s3, 'bucket', 'm365getgroup')
+    assert s3.get_calls == 1
+
+
+def test_load_table_schema_reloads_when_definition_updated():
+    s3 = FakeS3(json.dumps([{'table': 't1', 'columns': {'n': 'bigint'}}]).encode('utf-8'))
+    assert load_table_schema(s3, 'bucket', 't1').field('n').type == pa.int64()
+    # 型定義ファイルが更新された（ETag が変わった）場合は再取得する
+    s3.body = json.dumps([{'table': 't1', 'columns': {'n': 'double'}}]).encode('utf-8')
+    s3.etag = '"v2"'
+    assert load_table_schema(s3, 'bucket', 't1').field('n').type == pa.float64()
+    assert s3.get_calls == 2
+
+
+def test_load_table_schema_returns_none_without_definition():
+    s3 = FakeS3(_updatetype_body())
+    assert load_table_schema(s3, 'bucket', 'unknown') is None
+
+
+def test_build_schema_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        build_schema({'id': 'uuid'})
+
+
+def test_cast_to_schema_types_listed_columns_and_keeps_others():
+    schema = build_schema({
+        'id': 'string',
+        'userprincipalname': 'string',
+        'surname': 'string',
+        'base_date': 'date',
+        'from_datetime': 'timestamp',
+        'bytesscanned': 'bigint',
+        'usd_per_tb': 'double',
+    })
+    table = pa.Table.from_pylist([
+        {'id': '1', 'userPrincipalName': 'a@example.com', 'bytesScanned': 10, 'usd_per_tb': 5, 'extra': 'x'},
+        {'id': '2', 'userPrincipalName': 'b@example.com', 'bytesScanned': None, 'usd_per_tb': 5.5, 'extra': 'y'},
+    ])
+    table = append_constant_columns(table, {'base_date': '2025-07-25', 'from_datetime': '2025-07-25 00:00'})
+    table = cast_to_schema(table, schema)
+
+    # 列名・列順はデータのまま、型定義にない列もそのまま、データにない列は末尾に null 列
+    assert table.column_names == ['id', 'userPrincipalName', 'bytesScanned', 'usd_per_tb', 'extra',
+                                  'base_date', 'from_datetime', 'surname']
+    assert table.column('userPrincipalName').to_pylist() == ['a@example.com', 'b@example.com']
+    assert table.column('extra').to_pylist() == ['x', 'y']
+    assert table.column('surname').type == pa.string()
+    assert table.column('surname').to_pylist() == [None, None]
+    assert table.column('base_date').to_pylist() == [datetime.date(2025, 7, 25)] * 2
+    assert table.column('from_datetime').to_pylist() == [datetime.datetime(2025, 7, 25, 0, 0)] * 2
+    assert table.column('bytesScanned').type == pa.int64()
+    assert table.column('bytesScanned').to_pylist() == [10, None]
+    assert table.column('usd_per_tb').type == pa.float64()
+    assert table.column('usd_per_tb').to_pylist() == [5.0, 5.5]
+
+
+def test_cast_to_schema_keeps_constant_columns_dictionary_encoded():
+    # 定数列は辞書の値のみを変換し、行数分の値に展開しない
+    schema = build_schema({'base_date': 'date', 'from_datetime': 'timestamp', 'acquired_date': 'string'})
+    table = append_constant_columns(pa.Table.from_pylist([{'id': str(i)} for i in range(3)]),
+                                    {'base_date': '2025-07-25', 'from_datetime': '2025-07-25 00:00',
+                                     'acquired_date': '2025-07-26'})
+    table = cast_to_schema(table, schema)
+    assert table.schema.field('base_date').type == pa.dictionary(pa.int32(), pa.date32())
+    assert table.schema.field('from_datetime').type == pa.dictionary(pa.int32(), schema.field('from_datetime').type)
+    # 値の型が同じ場合は変換しない
+    assert table.schema.field('acquired_date').type == pa.dictionary(pa.int32(), pa.string())
+    assert len(table.column('base_date').chunk(0).dictionary) == 1
+    assert table.column('base_date').to_pylist() == [datetime.date(2025, 7, 25)] * 3
+
+
+def test_cast_to_schema_raises_on_invalid_value():
+    schema = build_schema({'base_date': 'date'})
+    with pytest.raises(pa.ArrowInvalid):
+        cast_to_schema(pa.Table.from_pylist([{'base_date': 'not-a-date'}]), schema)
@@ -0,0 +1,55 @@
+import io
+import json
+import os
+import sys
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# レイヤーのライブラリディレクトリをパスに追加（pytest実行位置に依存しないように）
+CURRENT_DIR = os.path.dirname(__file__)
+LIB_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'layers', 'PythonLayer')
+if LIB_DIR not in sys.path:
+    sys.path.append(LIB_DIR)
+
+from m365lib.schemaindex import (  # noqa: E402
+    build_index_key, schema_columns, schema_fingerprint, write_schema_index,
+)
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+
+def test_fingerprint_matches_catalog_update():
+    # updatecatalog（コンテナ）側の同一実装と一致すること（辞書エンコードは値の型）
+    columns = schema_columns(pa.schema([('id', pa.string()), ('base_date', pa.date32()),
+                                        ('n', pa.dictionary(pa.int32(), pa.string()))]))
+    assert columns == [['id', 'string'], ['base_date', 'date32[day]'], ['n', 'string']]
+    assert schema_fingerprint(columns) == '382feac49ae08be64ca16e1655c470fc49efbd16babb79766fdbe6c6aaf3c771'
+
+
+def test_fingerprint_depends_on_types_and_order():
+    base = schema_fingerprint([['a', 'string'], ['b', 'int64']])
+    assert schema_fingerprint([['b', 'int64'], ['a', 'string']]) != base
+    assert schema_fingerprint([['a', 'string'], ['b', 'string']]) != base
+
+
+def test_written_schema_matches_parquet_footer():
+    # 出力時のスキーマ（辞書エンコードの定数列を含む）と Parquet から読み込んだスキーマの指紋が一致すること
+    table = pa.table({'id': ['1', '2'], 'base_date': pa.array(['x', 'x']).dictionary_encode()})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    assert schema_columns(pq.read_schema(io.BytesIO(buffer.getvalue()))) == schema_columns(table.schema)
+
+    s3 = FakeS3()
+    key = write_schema_index(s3, 'bucket', 'group1', 'm365getuser', '2025-07-25', table.schema)
+    assert key == build_index_key('group1', 'm365getuser', '2025-07-25')
+    assert key == 'group1/schemaindex/m365getuser/date=20250725.json'
+    entry = json.loads(s3.objects[key])
+    assert entry['date'] == '20250725'
+    assert entry['columns'] == [['id', 'string'], ['base_date', 'string']]
+    assert entry['fingerprint'] == schema_fingerprint(entry['columns'])